@@ -0,0 +1,189 @@
+import typing as t
+
+import numpy as np
+from prediction_market_agent_tooling.gtypes import USD
+from prediction_market_agent_tooling.markets.agent_market import AgentMarket
+from prediction_market_agent_tooling.markets.data_models import TradeType
+from pydantic import BaseModel
+
+from prediction_market_agent.agents.arbitrage_agent.data_models import MarketTrade
+
+
+class ArbitrageLeg(BaseModel):
+    market: AgentMarket
+    direction: bool
+
+    @property
+    def price(self) -> float:
+        return self.market.p_yes if self.direction else self.market.p_no
+
+
+class GraphArbitrage(BaseModel):
+    """
+    Risk-neutral set of bets in markets connected by near-perfect correlations, see `CorrelationGraph`.
+    Exactly one of the legs pays out, however the markets resolve.
+    """
+
+    legs: list[ArbitrageLeg]
+
+    def __str__(self) -> str:
+        return f"legs {[(leg.market.question, leg.direction) for leg in self.legs]} potential_profit_per_unit {self.potential_profit_per_bet_unit()}"
+
+    @property
+    def market_ids(self) -> list[str]:
+        return [leg.market.id for leg in self.legs]
+
+    def potential_profit_per_bet_unit(self) -> float:
+        return (1 / sum(leg.price for leg in self.legs)) - 1
+
+    def build_trades(self, total_bet_amount: USD) -> list[MarketTrade]:
+        """Splits the total bet amount proportionally to the prices of the legs, so that the payout is the same whichever of them wins."""
+        total_price = sum(leg.price for leg in self.legs)
+        return [
+            MarketTrade(
+                trade_type=TradeType.BUY,
+                outcome=leg.market.get_outcome_str_from_bool(leg.direction),
+                amount=total_bet_amount * leg.price / total_price,
+                market=leg.market,
+            )
+            for leg in self.legs
+        ]
+
+
+class CorrelationGraph:
+    """
+    Graph of markets (nodes) connected by their near-perfect correlations (edges), positive or negative.
+
+    Each connected component is the same event E, up to negation: a market's YES outcome is either E or not E,
+    given by the parity of the negative correlations on the path to the root of the component.
+    Markets with the same question are connected implicitly.
+    Components with contradicting correlations (a cycle with an odd number of negative ones) are skipped,
+    as at least one of their correlations is wrong.
+    """
+
+    def __init__(
+        self,
+        markets: t.Sequence[AgentMarket],
+        question_hashes: t.Sequence[str],
+        correlations: t.Iterable[tuple[str, str, bool]],
+    ) -> None:
+        """
+        `question_hashes` are of the `markets` questions, and `correlations` are pairs of question hashes with
+        the sign of their correlation, as returned by `MarketCorrelationsTableHandler.get_correlation_edges`.
+        """
+        self.markets = list(markets)
+        # Union-find, with the parity of each node relative to its parent.
+        self._parent = list(range(len(self.markets)))
+        self._parity = [0] * len(self.markets)
+        self._size = [1] * len(self.markets)
+        self._inconsistent_roots: set[int] = set()
+
+        first_market_by_hash: dict[str, int] = {}
+        for i, question_hash in enumerate(question_hashes):
+            if question_hash in first_market_by_hash:
+                self._union(first_market_by_hash[question_hash], i, parity=0)
+            else:
+                first_market_by_hash[question_hash] = i
+        for question_hash, other_question_hash, positive in correlations:
+            if (
+                question_hash in first_market_by_hash
+                and other_question_hash in first_market_by_hash
+            ):
+                self._union(
+                    first_market_by_hash[question_hash],
+                    first_market_by_hash[other_question_hash],
+                    parity=0 if positive else 1,
+                )
+
+    def _find(self, node: int) -> tuple[int, int]:
+        """Returns the root of the node's component and the node's parity relative to it."""
+        path = []
+        while self._parent[node] != node:
+            path.append(node)
+            node = self._parent[node]
+        root = node
+        # Path compression, from the closest to the root, so that the parent's parity is already relative to the root.
+        for path_node in reversed(path):
+            if self._parent[path_node] != root:
+                self._parity[path_node] ^= self._parity[self._parent[path_node]]
+                self._parent[path_node] = root
+        return root, self._parity[path[0]] if path else 0
+
+    def _union(self, node: int, other_node: int, parity: int) -> None:
+        root, root_parity = self._find(node)
+        other_root, other_root_parity = self._find(other_node)
+        if root == other_root:
+            if root_parity ^ other_root_parity != parity:
+                self._inconsistent_roots.add(root)
+            return
+        if self._size[root] < self._size[other_root]:
+            root, other_root = other_root, root
+        self._parent[other_root] = root
+        self._parity[other_root] = root_parity ^ other_root_parity ^ parity
+        self._size[root] += self._size[other_root]
+        if other_root in self._inconsistent_roots:
+            self._inconsistent_roots.discard(other_root)
+            self._inconsistent_roots.add(root)
+
+    def find_arbitrages(self, min_profit_per_bet_unit: float) -> list[GraphArbitrage]:
+        """
+        Returns the most profitable risk-neutral bet set of each component where it's more profitable than `min_profit_per_bet_unit`,
+        the most profitable first.
+
+        Buying the outcomes means paying their current prices for a payout of 1 per bet unit, so the LP of the cheapest set of outcomes
+        covering both E and not E is optimal at a vertex: the cheapest outcome that is E and the cheapest one that is not E, from any markets
+        of the component, also if they are connected only through other markets. These are found for all the components at once.
+        """
+        if not self.markets:
+            return []
+        roots_and_parities = [self._find(i) for i in range(len(self.markets))]
+        roots = np.array([root for root, _ in roots_and_parities])
+        is_event_yes = np.array([parity == 0 for _, parity in roots_and_parities])
+        p_yes = np.array([m.p_yes for m in self.markets], dtype=np.float64)
+        p_no = np.array([m.p_no for m in self.markets], dtype=np.float64)
+
+        # Prices of the outcome of each market that is E, and of the one that is not E.
+        event_prices = np.where(is_event_yes, p_yes, p_no)
+        complement_prices = np.where(is_event_yes, p_no, p_yes)
+
+        components, cheapest_event = _argmin_per_group(roots, event_prices)
+        _, cheapest_complement = _argmin_per_group(roots, complement_prices)
+        profits = (
+            1 / (event_prices[cheapest_event] + complement_prices[cheapest_complement])
+            - 1
+        )
+        profitable = (
+            (profits > min_profit_per_bet_unit)
+            & (cheapest_event != cheapest_complement)
+            & ~np.isin(components, list(self._inconsistent_roots))
+        )
+
+        arbitrages = [
+            GraphArbitrage(
+                legs=[
+                    ArbitrageLeg(
+                        market=self.markets[event],
+                        direction=bool(is_event_yes[event]),
+                    ),
+                    ArbitrageLeg(
+                        market=self.markets[complement],
+                        direction=not is_event_yes[complement],
+                    ),
+                ]
+            )
+            for event, complement in zip(
+                cheapest_event[profitable], cheapest_complement[profitable]
+            )
+        ]
+        return sorted(
+            arbitrages, key=lambda a: a.potential_profit_per_bet_unit(), reverse=True
+        )
+
+
+def _argmin_per_group(
+    groups: np.ndarray, values: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the unique groups and the index of the lowest value in each of them."""
+    order = np.lexsort((values, groups))
+    unique_groups, first_in_group = np.unique(groups[order], return_index=True)
+    return unique_groups, order[first_in_group]
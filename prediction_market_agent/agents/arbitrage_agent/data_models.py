@@ -1,5 +1,6 @@
 import typing as t
 
+import numpy as np
 from prediction_market_agent_tooling.gtypes import USD, OutcomeStr
 from prediction_market_agent_tooling.markets.agent_market import AgentMarket
 from prediction_market_agent_tooling.markets.data_models import Trade
@@ -104,3 +105,24 @@ class CorrelatedMarketPair(BaseModel):
 
 class MarketTrade(Trade):
     market: AgentMarket
+
+
+def best_case_profits_per_bet_unit(
+    main_market: AgentMarket, related_markets: t.Sequence[AgentMarket]
+) -> np.ndarray:
+    """
+    Upper bound of `CorrelatedMarketPair.potential_profit_per_bet_unit` of the main market paired with each of the related markets,
+    whichever the correlation turns out to be, so that pairs that can't be profitable at the current prices are known before calculating it.
+    """
+    related_p_yes = np.array([m.p_yes for m in related_markets], dtype=np.float64)
+    related_p_no = np.array([m.p_no for m in related_markets], dtype=np.float64)
+    # Denominators of all the bet directions, YES/NO and NO/YES for the positive correlation, YES/YES and NO/NO for the negative one.
+    lowest_denominators: np.ndarray = np.minimum.reduce(
+        [
+            main_market.p_yes + related_p_no,
+            main_market.p_no + related_p_yes,
+            main_market.p_yes + related_p_yes,
+            main_market.p_no + related_p_no,
+        ]
+    )
+    return 1 / lowest_denominators - 1
@@ -1,7 +1,6 @@
 import typing as t
 from datetime import timedelta
 
-from cachetools import TTLCache
 from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import RunnableSerializable
@@ -9,7 +8,7 @@ from langchain_openai import ChatOpenAI
 from prediction_market_agent_tooling.deploy.agent import DeployableTraderAgent
 from prediction_market_agent_tooling.gtypes import USD, Probability
 from prediction_market_agent_tooling.loggers import logger
-from prediction_market_agent_tooling.markets.agent_market import AgentMarket
+from prediction_market_agent_tooling.markets.agent_market import AgentMarket, SortBy
 from prediction_market_agent_tooling.markets.data_models import (
     CategoricalProbabilisticAnswer,
     PlacedTrade,
@@ -29,33 +28,30 @@ from prediction_market_agent_tooling.tools.langfuse_ import (
 )
 from prediction_market_agent_tooling.tools.utils import utcnow
 
+from prediction_market_agent.agents.arbitrage_agent.correlation_graph import (
+    CorrelationGraph,
+    GraphArbitrage,
+)
 from prediction_market_agent.agents.arbitrage_agent.data_models import (
     CorrelatedMarketPair,
     Correlation,
     MarketTrade,
+    best_case_profits_per_bet_unit,
 )
 from prediction_market_agent.agents.arbitrage_agent.prompt import PROMPT_TEMPLATE
+from prediction_market_agent.agents.arbitrage_agent.recently_traded_markets import (
+    RecentlyTradedMarkets,
+    SQLRecentlyTradedMarkets,
+)
+from prediction_market_agent.agents.think_thoroughly_agent.models import (
+    PineconeMetadata,
+)
+from prediction_market_agent.db.market_correlations_table_handler import (
+    MarketCorrelationsTableHandler,
+)
 from prediction_market_agent.db.pinecone_handler import PineconeHandler
 from prediction_market_agent.utils import APIKeys
 
-# Cache of recently traded market ids so we do not trade the corresponding
-# related market shortly after. Kept very simple on purpose.
-# TTL set to 3 hours by default.
-RECENTLY_TRADED_MARKET_IDS: TTLCache[str, bool] = TTLCache(
-    maxsize=10000, ttl=3 * 60 * 60
-)
-
-
-def was_market_recently_traded(market_id: str) -> bool:
-    """Return True if `market_id` was marked as traded within TTL window."""
-    return market_id.lower() in RECENTLY_TRADED_MARKET_IDS
-
-
-def mark_markets_traded(primary_market_id: str, related_market_id: str) -> None:
-    """Mark both primary and related market ids as traded within TTL window."""
-    RECENTLY_TRADED_MARKET_IDS[primary_market_id.lower()] = True
-    RECENTLY_TRADED_MARKET_IDS[related_market_id.lower()] = True
-
 
 class DeployableArbitrageAgent(DeployableTraderAgent):
     """Agent that places mirror bets on Omen for (quasi) risk-neutral profit."""
@@ -65,7 +61,18 @@ class DeployableArbitrageAgent(DeployableTraderAgent):
     total_trade_amount = USD(0.1)
     bet_on_n_markets_per_run = 5
     max_related_markets_per_market = 10
+    # We want to profit at least 0.5% per market (value chosen as initial baseline).
+    min_profit_per_bet_unit = 0.005
     n_markets_to_fetch = 50
+    # Arbitrage across the correlation graph is searched among this many of the most liquid open markets.
+    n_graph_markets_to_fetch = 1000
+    # Correlations with the related markets are calculated concurrently, each LLM request is given up after the timeout.
+    max_concurrent_correlation_calls = 10
+    correlation_call_timeout_seconds = 60.0
+    # Markets traded within this time are skipped, to not place the symmetric leg again when processing the related market.
+    recently_traded_ttl = timedelta(hours=3)
+    # Correlations are saved and reused for both orderings of the markets, until they are this old.
+    correlation_cache_ttl = timedelta(days=7)
 
     def run(self, market_type: MarketType) -> None:
         if market_type != MarketType.OMEN:
@@ -75,9 +82,113 @@ class DeployableArbitrageAgent(DeployableTraderAgent):
         self.subgraph_handler = OmenSubgraphHandler()
         self.pinecone_handler = PineconeHandler()
         self.pinecone_handler.insert_all_omen_markets_if_not_exists()
+        self.market_correlations = MarketCorrelationsTableHandler()
+        self.recently_traded_markets = self.build_recently_traded_markets()
         self.chain = self._build_chain()
+        self.markets_to_process: list[AgentMarket] = []
+        self.related_markets_by_market_id: dict[str, list[PineconeMetadata]] = {}
+        self.graph_arbitrages_by_market_id: dict[str, GraphArbitrage] = {}
         super().run(market_type=market_type)
 
+    def get_markets(self, market_type: MarketType) -> t.Sequence[AgentMarket]:
+        markets = super().get_markets(market_type)
+        # Markets with arbitrage across the correlation graph are processed first, the most profitable first.
+        # Each market is in a single component of the graph, so it's a leg of at most one arbitrage.
+        # All the legs are traded when processing the first one, so only that one is processed, taking a single slot of `bet_on_n_markets_per_run`.
+        graph_arbitrages = self.find_graph_arbitrages()
+        self.graph_arbitrages_by_market_id = {
+            arbitrage.legs[0].market.id: arbitrage for arbitrage in graph_arbitrages
+        }
+        graph_market_ids = {
+            market_id
+            for arbitrage in graph_arbitrages
+            for market_id in arbitrage.market_ids
+        }
+        markets = [arbitrage.legs[0].market for arbitrage in graph_arbitrages] + [
+            market for market in markets if market.id not in graph_market_ids
+        ]
+        # Related markets are searched only when a market is processed, see `get_related_markets`.
+        self.markets_to_process = [
+            market
+            for market in markets
+            if market.id not in self.graph_arbitrages_by_market_id
+        ]
+        self.related_markets_by_market_id = {}
+        return markets
+
+    def get_related_markets(self, market: AgentMarket) -> list[PineconeMetadata]:
+        """
+        Searches related markets of the next `bet_on_n_markets_per_run` markets from `get_markets`, starting at this one, at once
+        (with a single embeddings request), instead of one by one while processing them.
+        Only that many are likely to be processed, the next chunk is searched if some of them are skipped.
+        """
+        if market.id not in self.related_markets_by_market_id:
+            market_ids = [m.id for m in self.markets_to_process]
+            if market.id in market_ids:
+                start = market_ids.index(market.id)
+                chunk = self.markets_to_process[
+                    start : start + self.bet_on_n_markets_per_run
+                ]
+            else:
+                chunk = [market]
+            related = self.pinecone_handler.find_nearest_questions_batch(
+                texts=[m.question for m in chunk],
+                limit=self.max_related_markets_per_market,
+                filter_on_metadata=self.related_markets_filter(),
+            )
+            self.related_markets_by_market_id.update(
+                {
+                    m.id: related_for_market
+                    for m, related_for_market in zip(chunk, related)
+                }
+            )
+        return self.related_markets_by_market_id[market.id]
+
+    @observe()
+    def find_graph_arbitrages(self) -> list[GraphArbitrage]:
+        """
+        Finds arbitrage across the open markets at once, from the graph of the saved correlations (see `CorrelationGraph`),
+        also between markets that were never paired directly.
+        Markets are selected with the same filters as in `get_markets`, the most liquid ones first, as they can take the bets.
+        """
+        open_markets = [
+            OmenAgentMarket.from_data_model(market)
+            for market in self.subgraph_handler.get_omen_markets_simple(
+                limit=self.n_graph_markets_to_fetch,
+                filter_by=self.get_markets_filter_by,
+                sort_by=SortBy.HIGHEST_LIQUIDITY,
+                created_after=self.trade_on_markets_created_after,
+            )
+        ]
+        graph = CorrelationGraph(
+            markets=open_markets,
+            question_hashes=[
+                self.market_correlations.get_question_hash(market.question)
+                for market in open_markets
+            ],
+            correlations=self.market_correlations.get_correlation_edges(
+                max_age=self.correlation_cache_ttl
+            ),
+        )
+        arbitrages = graph.find_arbitrages(self.min_profit_per_bet_unit)
+        logger.info(
+            f"Found {len(arbitrages)} arbitrages in the correlation graph of {len(open_markets)} open markets."
+        )
+        return arbitrages
+
+    def build_recently_traded_markets(self) -> RecentlyTradedMarkets:
+        # Shared between the runs and replicas of the agent, override to use a different store.
+        return SQLRecentlyTradedMarkets(ttl=self.recently_traded_ttl)
+
+    @staticmethod
+    def related_markets_filter() -> dict[str, dict[str, t.Any]]:
+        # We only wanted to find related markets that are open.
+        return {
+            "close_time_timestamp": {
+                "$gte": int((utcnow() + timedelta(hours=1)).timestamp())
+            }
+        }
+
     def answer_binary_market(self, market: AgentMarket) -> ProbabilisticAnswer | None:
         return ProbabilisticAnswer(p_yes=Probability(0.5), confidence=1.0)
 
@@ -86,6 +197,7 @@ class DeployableArbitrageAgent(DeployableTraderAgent):
             temperature=0,
             model_name=self.model,
             openai_api_key=APIKeys().openai_api_key,
+            request_timeout=self.correlation_call_timeout_seconds,
         )
 
         parser = PydanticOutputParser(pydantic_object=Correlation)
@@ -110,25 +222,68 @@ class DeployableArbitrageAgent(DeployableTraderAgent):
         )
         return correlation
 
+    @observe()
+    def calculate_correlations_between_markets(
+        self, market: AgentMarket, related_markets: t.Sequence[AgentMarket]
+    ) -> list[Correlation | None]:
+        """
+        Same as `calculate_correlation_between_markets` for many related markets, calculated concurrently.
+        Previously calculated correlations (of the pair in either order) are reused, only new pairs are sent to the LLM.
+        Correlations that failed to be calculated (e.g. timed out) are None, instead of failing all of them.
+        """
+        question_pairs = [
+            (market.question, related_market.question)
+            for related_market in related_markets
+        ]
+        correlations = self.market_correlations.get_correlations(
+            question_pairs, max_age=self.correlation_cache_ttl
+        )
+        missing = [
+            i for i, correlation in enumerate(correlations) if correlation is None
+        ]
+        logger.info(
+            f"Reusing {len(related_markets) - len(missing)} saved correlations for market {market.id}, calculating {len(missing)}."
+        )
+        if not missing:
+            return correlations
+
+        results: list[Correlation | Exception] = self.chain.batch(
+            [
+                {
+                    "main_market_question": market.question,
+                    "related_market_question": related_markets[i].question,
+                }
+                for i in missing
+            ],
+            config={
+                **get_langfuse_langchain_config(),
+                "max_concurrency": self.max_concurrent_correlation_calls,
+            },
+            return_exceptions=True,
+        )
+        new_correlations = []
+        for i, result in zip(missing, results):
+            if isinstance(result, Exception):
+                logger.warning(
+                    f"Failed to calculate correlation between {market.id} and {related_markets[i].id}: {result}"
+                )
+            else:
+                correlations[i] = result
+                new_correlations.append((*question_pairs[i], result))
+        self.market_correlations.save_correlations(new_correlations)
+        return correlations
+
     @observe()
     def get_correlated_markets(self, market: AgentMarket) -> list[CorrelatedMarketPair]:
         # We try to find similar, open markets which point to the same outcome.
         correlated_markets = []
-        # We only wanted to find related markets that are open.
         # We intentionally query more markets in the hope it yields open markets.
-        # We could store market_status (open, closed) in Pinecone, but we refrain from it
-        # to keep the chain data (or graph) as the source-of-truth, instead of managing the
-        # update process of the vectorDB.
-
-        related = self.pinecone_handler.find_nearest_questions_with_threshold(
-            limit=self.max_related_markets_per_market,
-            text=market.question,
-            filter_on_metadata={
-                "close_time_timestamp": {
-                    "$gte": int((utcnow() + timedelta(hours=1)).timestamp())
-                }
-            },
-        )
+        # Their state in the index is only used to skip closed ones, the chain data (or graph) stays the source-of-truth.
+
+        related = self.get_related_markets(market)
+
+        # Markets known to be closed from their state in the index (see `PineconeHandler.refresh_market_states`) don't need to be fetched.
+        related = [r for r in related if r.is_open is not False]
 
         omen_markets = self.subgraph_handler.get_omen_markets(
             limit=len(related),
@@ -146,21 +301,36 @@ class DeployableArbitrageAgent(DeployableTraderAgent):
             f"Fetched {len(omen_markets)} related markets for market {market.id}"
         )
 
+        related_agent_markets = []
         for related_market in omen_markets:
             if related_market.id.lower() == market.id.lower():
                 logger.info(
                     f"Skipping related market {related_market.id} since same market as {market.id}"
                 )
                 continue
-            result: Correlation = self.chain.invoke(
-                {
-                    "main_market_question": market.question,
-                    "related_market_question": related_market.question,
-                },
-                config=get_langfuse_langchain_config(),
+            related_agent_markets.append(
+                OmenAgentMarket.from_data_model(related_market)
             )
-            if result.near_perfect_correlation is not None:
-                related_agent_market = OmenAgentMarket.from_data_model(related_market)
+
+        # Correlation is needed only for pairs that could be profitable at the current prices, whatever it turns out to be.
+        could_be_profitable = (
+            best_case_profits_per_bet_unit(market, related_agent_markets)
+            > self.min_profit_per_bet_unit
+        )
+        logger.info(
+            f"{could_be_profitable.sum()} out of {len(related_agent_markets)} related markets could be profitable with market {market.id}."
+        )
+        related_agent_markets = [
+            related_market
+            for related_market, keep in zip(related_agent_markets, could_be_profitable)
+            if keep
+        ]
+
+        correlations = self.calculate_correlations_between_markets(
+            market=market, related_markets=related_agent_markets
+        )
+        for related_agent_market, result in zip(related_agent_markets, correlations):
+            if result is not None and result.near_perfect_correlation is not None:
                 # Double check that we're not pairing a market with itself
                 if market.id.lower() != related_agent_market.id.lower():
                     correlated_markets.append(
@@ -212,14 +382,37 @@ class DeployableArbitrageAgent(DeployableTraderAgent):
         existing_position: Position | None,
     ) -> list[Trade]:
         trades: list[Trade] = []
+        graph_arbitrage = self.graph_arbitrages_by_market_id.get(market.id)
+        if graph_arbitrage is not None:
+            if any(
+                self.recently_traded_markets.was_traded(market_id)
+                for market_id in graph_arbitrage.market_ids
+            ):
+                logger.info(
+                    f"Skipping graph arbitrage due to recent trade TTL cache: {graph_arbitrage.market_ids}"
+                )
+            # The processed market was verified already, the other legs need to pass the same checks.
+            elif not all(
+                self.verify_market(MarketType.OMEN, leg.market)
+                for leg in graph_arbitrage.legs[1:]
+            ):
+                logger.info(
+                    f"Skipping graph arbitrage as some of its markets didn't pass the verification: {graph_arbitrage.market_ids}"
+                )
+            else:
+                logger.info(f"Placing graph arbitrage trades {graph_arbitrage}")
+                trades.extend(graph_arbitrage.build_trades(self.total_trade_amount))
+                self.recently_traded_markets.mark_traded(graph_arbitrage.market_ids)
+            return trades
+
         correlated_markets = self.get_correlated_markets(market=market)
         for pair in correlated_markets:
             # Skip if either of the markets was traded recently to avoid
             # placing the symmetric leg minutes later when processing
             # the other market.
-            if was_market_recently_traded(
+            if self.recently_traded_markets.was_traded(
                 pair.main_market.id
-            ) or was_market_recently_traded(pair.related_market.id):
+            ) or self.recently_traded_markets.was_traded(pair.related_market.id):
                 logger.info(
                     "Skipping pair due to recent trade TTL cache: main=%s related=%s",
                     pair.main_market.id,
@@ -231,16 +424,14 @@ class DeployableArbitrageAgent(DeployableTraderAgent):
                     "Skipping market pair since related- and main market are the same."
                 )
                 continue
-            # We want to profit at least 0.5% per market (value chosen as initial baseline).
-            if pair.potential_profit_per_bet_unit() > 0.005:
+            if pair.potential_profit_per_bet_unit() > self.min_profit_per_bet_unit:
                 trades_for_pair = self.build_trades_for_correlated_markets(pair)
                 trades.extend(trades_for_pair)
                 if trades_for_pair:
                     # Mark both markets as traded within TTL window to avoid
                     # re-trading when the related market is processed next.
-                    mark_markets_traded(
-                        primary_market_id=pair.main_market.id,
-                        related_market_id=pair.related_market.id,
+                    self.recently_traded_markets.mark_traded(
+                        [pair.main_market.id, pair.related_market.id]
                     )
 
         return trades
@@ -0,0 +1,85 @@
+import typing as t
+from abc import ABC, abstractmethod
+from datetime import timedelta
+
+from cachetools import TTLCache
+from prediction_market_agent_tooling.tools.utils import DatetimeUTC, utcnow
+
+from prediction_market_agent.db.recently_traded_markets_table_handler import (
+    RecentlyTradedMarketsTableHandler,
+)
+
+
+class RecentlyTradedMarkets(ABC):
+    """Markets traded within the `ttl`, so that the agent doesn't trade the related market of a pair shortly after the main one."""
+
+    def __init__(self, ttl: timedelta) -> None:
+        self.ttl = ttl
+
+    @abstractmethod
+    def was_traded(self, market_id: str) -> bool:
+        """Return True if `market_id` was marked as traded within TTL window."""
+
+    @abstractmethod
+    def mark_traded(self, market_ids: t.Sequence[str]) -> None:
+        """Mark the market ids as traded within TTL window."""
+
+
+class InMemoryRecentlyTradedMarkets(RecentlyTradedMarkets):
+    """Kept only in the process, so it's lost on restart and not shared between replicas."""
+
+    def __init__(self, ttl: timedelta, maxsize: int = 10000) -> None:
+        super().__init__(ttl)
+        self.cache: TTLCache[str, bool] = TTLCache(
+            maxsize=maxsize,
+            ttl=ttl.total_seconds(),
+            # Wall clock, to expire the same way as the other stores.
+            timer=lambda: utcnow().timestamp(),
+        )
+
+    def was_traded(self, market_id: str) -> bool:
+        return market_id.lower() in self.cache
+
+    def mark_traded(self, market_ids: t.Sequence[str]) -> None:
+        for market_id in market_ids:
+            self.cache[market_id.lower()] = True
+
+
+class SQLRecentlyTradedMarkets(RecentlyTradedMarkets):
+    """
+    Stored in the database, so it's shared between the runs and replicas of the agent.
+    Markets found to be traded are also kept in the process, so they are looked up in the database only until they are found.
+    """
+
+    def __init__(
+        self,
+        ttl: timedelta,
+        sqlalchemy_db_url: str | None = None,
+        maxsize: int = 10000,
+    ) -> None:
+        super().__init__(ttl)
+        self.table_handler = RecentlyTradedMarketsTableHandler(
+            sqlalchemy_db_url=sqlalchemy_db_url
+        )
+        # Time of the trade of markets known to be traded, as it may have been before this process started.
+        self.traded_at: TTLCache[str, DatetimeUTC] = TTLCache(
+            maxsize=maxsize, ttl=ttl.total_seconds()
+        )
+
+    def was_traded(self, market_id: str) -> bool:
+        market_id = market_id.lower()
+        traded_after = utcnow() - self.ttl
+        traded_at = self.traded_at.get(market_id)
+        if traded_at is None or traded_at <= traded_after:
+            # Another replica could have traded it since.
+            traded_at = self.table_handler.get_traded_at(market_id)
+            if traded_at is None:
+                return False
+            self.traded_at[market_id] = traded_at
+        return traded_at > traded_after
+
+    def mark_traded(self, market_ids: t.Sequence[str]) -> None:
+        traded_at = utcnow()
+        self.table_handler.save_traded(market_ids, traded_at)
+        for market_id in market_ids:
+            self.traded_at[market_id.lower()] = traded_at
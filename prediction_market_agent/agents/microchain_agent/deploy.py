@@ -41,6 +41,7 @@ from prediction_market_agent.agents.microchain_agent.prompts import (
     TRADING_AGENT_SYSTEM_PROMPT_MINIMAL_CONFIG,
     FunctionsConfig,
 )
+from prediction_market_agent.db.background_writer import BackgroundWriter
 from prediction_market_agent.db.long_term_memory_table_handler import (
     LongTermMemoryTableHandler,
 )
@@ -63,11 +64,14 @@ class DeployableMicrochainAgentAbstract(DeployableAgent, metaclass=abc.ABCMeta):
     import_actions_from_memory_from: DatetimeUTC | None = None
     sleep_between_iterations = 0
     allow_stop: bool = True
+    # Save history and prompts from a background thread, so that iterations don't wait for the database.
+    save_in_background: bool = False
     identifier: AgentIdentifier
     functions_config: FunctionsConfig
     initial_system_prompt: str
 
     # Setup during the 'load' method.
+    background_writer: BackgroundWriter | None
     long_term_memory: LongTermMemoryTableHandler
     prompt_handler: PromptTableHandler
     prompt_inject_handler: PromptInjectHandler
@@ -79,11 +83,18 @@ class DeployableMicrochainAgentAbstract(DeployableAgent, metaclass=abc.ABCMeta):
     def get_description(cls) -> str:
         return f"Microchain-based {cls.__name__}."
 
+    def build_background_writer(self) -> BackgroundWriter | None:
+        return BackgroundWriter() if self.save_in_background else None
+
     def build_long_term_memory(self) -> LongTermMemoryTableHandler:
-        return LongTermMemoryTableHandler.from_agent_identifier(self.identifier)
+        return LongTermMemoryTableHandler.from_agent_identifier(
+            self.identifier, writer=self.background_writer
+        )
 
     def build_prompt_handler(self) -> PromptTableHandler:
-        return PromptTableHandler.from_agent_identifier(self.identifier)
+        return PromptTableHandler.from_agent_identifier(
+            self.identifier, writer=self.background_writer
+        )
 
     def build_prompt_inject_handler(self) -> PromptInjectHandler:
         return PromptInjectHandler.from_agent_identifier(self.identifier)
@@ -113,6 +124,7 @@ class DeployableMicrochainAgentAbstract(DeployableAgent, metaclass=abc.ABCMeta):
 
     def load(self) -> None:
         super().load()
+        self.background_writer = self.build_background_writer()
         self.long_term_memory = self.build_long_term_memory()
         self.prompt_handler = self.build_prompt_handler()
         self.agent = self.build_agent(market_type=MarketType.OMEN)
@@ -134,6 +146,11 @@ class DeployableMicrochainAgentAbstract(DeployableAgent, metaclass=abc.ABCMeta):
 
     def initialise_agent(self) -> None:
         logger.info(f"Initialising agent {self.__class__.__name__}.")
+        if self.background_writer is not None and self.background_writer.closed:
+            # Closed at the end of the previous run, see `deinitialise_agent`.
+            self.background_writer = self.build_background_writer()
+            self.long_term_memory.writer = self.background_writer
+            self.prompt_handler.writer = self.background_writer
         self.agent.reset()
         self.agent.build_initial_messages()
 
@@ -142,20 +159,23 @@ class DeployableMicrochainAgentAbstract(DeployableAgent, metaclass=abc.ABCMeta):
             latest_saved_memories = self.long_term_memory.search(
                 limit=self.import_actions_from_memory,
                 from_=self.import_actions_from_memory_from,
+                # Do not include system message as that one is automatically in the beginning of the history.
+                exclude_role="system",
             )
             messages_to_insert = [
                 m.metadata_dict
                 for m in latest_saved_memories[
                     ::-1
                 ]  # Revert the list to have the oldest messages first, as they were in the history.
-                if check_not_none(m.metadata_dict)["role"]
-                != "system"  # Do not include system message as that one is automatically in the beginning of the history.
             ]
             # Inject them after the system message.
             self.agent.history[1:1] = messages_to_insert
 
     def deinitialise_agent(self) -> None:
         logger.info(f"Denitialising agent {self.__class__.__name__}.")
+        if self.background_writer is not None:
+            # Make sure everything from this run is persisted, and stop the writer's thread.
+            self.background_writer.close()
 
     @observe()
     def run_general_agent(self, market_type: MarketType) -> None:
@@ -126,11 +126,11 @@ class DatedChatHistory(ChatHistory):
         from_: DatetimeUTC | None = None,
         to: DatetimeUTC | None = None,
     ) -> "DatedChatHistory":
-        memories = long_term_memory.search(from_=from_, to_=to)
-
-        # Sort memories by datetime
-        memories = sorted(memories, key=lambda m: m.datetime_)
-        chat_messages = [DatedChatMessage.from_long_term_memory(m) for m in memories]
+        # Stream the memories already sorted by datetime, so only the chat messages are kept in memory.
+        chat_messages = [
+            DatedChatMessage.from_long_term_memory(m)
+            for m in long_term_memory.iter_search(from_=from_, to_=to, order_desc=False)
+        ]
         return cls(chat_messages=chat_messages)
 
     def cluster_by_session(self) -> list["DatedChatHistory"]:
@@ -1,10 +1,9 @@
 from datetime import timedelta
 
-from langchain_chroma import Chroma
 from langchain_openai import OpenAIEmbeddings
 from microchain import Function
 from prediction_market_agent_tooling.loggers import logger
-from prediction_market_agent_tooling.tools.utils import check_not_none, utcnow
+from prediction_market_agent_tooling.tools.utils import utcnow
 
 from prediction_market_agent.agents.identifiers import AgentIdentifier
 from prediction_market_agent.agents.microchain_agent.memory import DatedChatMessage
@@ -15,10 +14,14 @@ from prediction_market_agent.agents.microchain_agent.nft_treasury_game.game_hist
     NFTGameRound,
 )
 from prediction_market_agent.agents.utils import memories_to_learnings
+from prediction_market_agent.db.embedding_cache import CachedEmbeddings
 from prediction_market_agent.db.long_term_memory_table_handler import (
     LongTermMemories,
     LongTermMemoryTableHandler,
 )
+from prediction_market_agent.db.long_term_memory_vector_index import (
+    LongTermMemoryVectorIndex,
+)
 
 
 class LongTermMemoryBasedFunction(Function):
@@ -77,25 +80,16 @@ class CheckAllPastActionsGivenContext(LongTermMemoryBasedFunction):
 
     def __call__(self, context: str) -> str:
         keys = MicrochainAgentKeys()
-        all_memories = self.long_term_memory.search()
 
-        collection = Chroma(
-            embedding_function=OpenAIEmbeddings(openai_api_key=keys.openai_api_key)
-        )
-        collection.add_texts(
-            texts=[
-                f"From: {check_not_none(x.metadata_dict)['role']} Content: {check_not_none(x.metadata_dict)['content']}"
-                for x in all_memories
-            ],
-            metadatas=[{"json": x.model_dump_json()} for x in all_memories],
+        embeddings = OpenAIEmbeddings(openai_api_key=keys.openai_api_key)
+        # Only the memories saved since the previous call need to be embedded.
+        index = LongTermMemoryVectorIndex(
+            long_term_memory=self.long_term_memory,
+            embeddings=CachedEmbeddings(embeddings, model=embeddings.model),
         )
-
-        top_k_per_query_results = collection.similarity_search(context, k=50)
         results = [
-            DatedChatMessage.from_long_term_memory(
-                LongTermMemories.model_validate_json(x.metadata["json"])
-            )
-            for x in top_k_per_query_results
+            DatedChatMessage.from_long_term_memory(memory)
+            for memory in index.search(context, k=50)
         ]
 
         return memories_to_learnings(
@@ -112,18 +106,15 @@ def fetch_memories_from_game_round(
     The last run is identified by looking at "GameRoundEnd" function calls
     as part of the prompt history of each agent.
     """
-    entries: dict[str, list[LongTermMemories]] = {}
-    for agent_id in agent_identifiers:
-        ltm = LongTermMemoryTableHandler.from_agent_identifier(agent_id)
-        entries_for_agent = ltm.search(
-            from_=round_.start_time,
-            to_=round_.end_time,
-        )
-        entries_for_agent.sort(key=lambda x: x.datetime_, reverse=True)
+    entries = LongTermMemoryTableHandler.search_many(
+        task_descriptions=agent_identifiers,
+        from_=round_.start_time,
+        to_=round_.end_time,
+    )
+    for agent_id, entries_for_agent in entries.items():
         logger.info(
             f"Fetched {len(entries_for_agent)} memories from {agent_id} latest run"
         )
-        entries[agent_id] = entries_for_agent
 
     return entries
 
@@ -5,6 +5,7 @@ Tip: if you specify PYTHONPATH=., streamlit will watch for the changes in all fi
 """
 
 import typing as t
+from dataclasses import dataclass
 from datetime import timedelta
 from enum import Enum
 from math import ceil
@@ -78,6 +79,7 @@ from prediction_market_agent.db.report_table_handler import (
     ReportNFTGame,
     ReportNFTGameTableHandler,
 )
+from prediction_market_agent.db.sql_handler import KeysetCursor
 from prediction_market_agent.tools.anvil.anvil_requests import set_balance
 from prediction_market_agent.tools.message_utils import (
     compress_message,
@@ -275,36 +277,74 @@ def customized_chat_message(
             st.markdown(parsed_function_output_body)
 
 
+@dataclass
+class FunctionCallsPage:
+    """Currently shown page of an agent's actions."""
+
+    number: int = 0
+    # Pages are fetched by seeking from a cursor instead of using offset, so that the last page is as fast as the first one.
+    # Cursor of None with `older=True` means the newest page, with `older=False` the oldest page.
+    cursor: KeysetCursor | None = None
+    older: bool = True
+    # Cursors of the newest and oldest message on the currently shown page.
+    bounds: tuple[KeysetCursor, KeysetCursor] | None = None
+
+
+def get_function_calls_page(nft_agent: AgentInputType) -> FunctionCallsPage:
+    page: FunctionCallsPage = st.session_state.setdefault(
+        f"function_calls_page_{nft_agent.identifier}", FunctionCallsPage()
+    )
+    return page
+
+
 def show_function_calls_part(
     nft_agent: AgentInputType,
 ) -> None:
     st.markdown(f"### Agent's actions")
 
-    n_total_messages = long_term_memory_table_handler(nft_agent.identifier).count()
+    # System calls aren't supposed to be shown in the chat history itself.
+    # The total only sizes the pagination, so it can be a few minutes old, instead of counting all the messages on every rerun.
+    n_total_messages = long_term_memory_table_handler(nft_agent.identifier).count(
+        exclude_role="system", max_age_seconds=600
+    )
     messages_per_page = 50
-    if "page_number" not in st.session_state:
-        st.session_state.page_number = 0
+    # Kept per agent, as this part is shown on every agent's page, and the cursors of one agent's messages mean nothing for another one.
+    page = get_function_calls_page(nft_agent)
 
     max_page_number = max(ceil(n_total_messages / messages_per_page) - 1, 0)
+    # Messages might have been archived since the page was chosen.
+    page.number = min(page.number, max_page_number)
 
     # Define as function callbacks, because otherwise Streamlit web updates logic with 1 step delay.
     def go_to_first_page() -> None:
-        st.session_state.page_number = 0
+        page.number = 0
+        page.cursor = None
+        page.older = True
 
     def go_to_prev_page() -> None:
-        st.session_state.page_number = max(0, st.session_state.page_number - 1)
+        if page.number <= 1 or page.bounds is None:
+            go_to_first_page()
+            return
+        page.number -= 1
+        page.cursor = page.bounds[0]
+        page.older = False
 
     def go_to_next_page() -> None:
-        st.session_state.page_number = min(
-            max_page_number, st.session_state.page_number + 1
-        )
+        if page.number >= max_page_number - 1 or page.bounds is None:
+            go_to_last_page()
+            return
+        page.number += 1
+        page.cursor = page.bounds[1]
+        page.older = True
 
     def go_to_last_page() -> None:
-        st.session_state.page_number = max_page_number
+        page.number = max_page_number
+        page.cursor = None
+        page.older = False
 
     # Compute disabled statuses based on the current page number
-    disable_first_prev = st.session_state.page_number == 0
-    disable_next_last = st.session_state.page_number == max_page_number
+    disable_first_prev = page.number == 0
+    disable_next_last = page.number == max_page_number
 
     # Build the columns and buttons with updated disabled statuses
     col1, col2, col3, col4, col5 = st.columns(5)
@@ -316,14 +356,22 @@ def show_function_calls_part(
             "Previous page", disabled=disable_first_prev, on_click=go_to_prev_page
         )
     with col3:
-        st.write(f"Page {st.session_state.page_number + 1} of {max_page_number + 1}")
+        st.write(f"Page {page.number + 1} of {max_page_number + 1}")
     with col4:
         st.button("Next page", disabled=disable_next_last, on_click=go_to_next_page)
     with col5:
         st.button("Last page", disabled=disable_next_last, on_click=go_to_last_page)
 
     show_function_calls_part_messages(
-        nft_agent, messages_per_page, st.session_state.page_number
+        nft_agent,
+        # The oldest page is usually not full. The count can be outdated, so at least one message is requested, as 0 means no limit.
+        (
+            messages_per_page
+            if page.older or page.cursor is not None
+            else max(n_total_messages - max_page_number * messages_per_page, 1)
+        ),
+        page.cursor,
+        page.older,
     )
 
 
@@ -331,22 +379,28 @@ def show_function_calls_part(
 def show_function_calls_part_messages(
     nft_agent: AgentInputType,
     messages_per_page: int,
-    page_number: int,
+    page_cursor: KeysetCursor | None,
+    page_older: bool,
 ) -> None:
     with st.spinner("Loading agent's actions..."):
-        calls = long_term_memory_table_handler(nft_agent.identifier).search(
-            offset=page_number * messages_per_page,
+        calls, _ = long_term_memory_table_handler(nft_agent.identifier).search_page(
             limit=messages_per_page,
+            after=page_cursor,
+            order_desc=page_older,
+            exclude_role="system",
         )
+        if not page_older:
+            # Pages towards the newer messages are fetched in ascending order, but always shown from the newest.
+            calls = calls[::-1]
 
     if not calls:
         st.markdown("No actions yet.")
         return
 
-    # Filter out system calls, because they aren't supposed to be shown in the chat history itself.
-    calls = [
-        call for call in calls if check_not_none(call.metadata_dict)["role"] != "system"
-    ]
+    get_function_calls_page(nft_agent).bounds = (
+        LongTermMemoryTableHandler.get_cursor(calls[0]),
+        LongTermMemoryTableHandler.get_cursor(calls[-1]),
+    )
 
     # Microchain works on `function call` - `funtion response` pairs, so we will process them together.
     for index, (function_output, function_call) in enumerate(
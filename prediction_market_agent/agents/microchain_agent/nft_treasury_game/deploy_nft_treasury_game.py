@@ -50,6 +50,7 @@ class DeployableAgentNFTGameAbstract(DeployableMicrochainAgentAbstract):
     # Agent configuration
     sleep_between_iterations = 5
     allow_stop = False
+    save_in_background = True
     import_actions_from_memory = 256
     functions_config = FunctionsConfig(
         common_functions=True,
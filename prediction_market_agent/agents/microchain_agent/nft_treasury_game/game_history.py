@@ -2,6 +2,7 @@ from typing import Optional
 
 from prediction_market_agent_tooling.tools.datetime_utc import DatetimeUTC
 from prediction_market_agent_tooling.tools.utils import utcnow
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel, col
 
 from prediction_market_agent.db.sql_handler import SQLHandler
@@ -9,9 +10,11 @@ from prediction_market_agent.db.sql_handler import SQLHandler
 
 class NFTGameRound(SQLModel, table=True):
     __tablename__ = "nft_game_round"
-    __table_args__ = {
-        "extend_existing": True,
-    }
+    __table_args__ = (
+        Index("ix_nft_game_round_start_time", "start_time"),
+        Index("ix_nft_game_round_end_time", "end_time"),
+        {"extend_existing": True},
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     start_time: DatetimeUTC
     end_time: DatetimeUTC
@@ -122,16 +122,13 @@ def extract_reasoning_behind_tweet(
     Fetches memories from the DB that are most closely related to bets.
     Returns a summary of the reasoning value from the metadata of those memories.
     """
-    memories = long_term_memory.search(from_=memories_since)
-    simple_memories = [
-        SimpleMemoryThinkThoroughly.from_long_term_memory(ltm) for ltm in memories
-    ]
     # We want memories only from the bets to add relevant learnings
     questions_from_bets = set([b.market_question for b in bets])
     filtered_memories = [
-        m
-        for m in simple_memories
-        if m.metadata.original_question in questions_from_bets
+        SimpleMemoryThinkThoroughly.from_long_term_memory(ltm)
+        for ltm in long_term_memory.iter_search(
+            from_=memories_since, original_questions=questions_from_bets
+        )
     ]
     return extract_reasonings_to_learnings(filtered_memories, tweet)
 
@@ -1,6 +1,10 @@
+import typing as t
+from datetime import timedelta
+
 from eth_typing import HexAddress
 from prediction_market_agent_tooling.gtypes import Probability
 from prediction_market_agent_tooling.markets.omen.data_models import OmenMarket
+from prediction_market_agent_tooling.tools.utils import check_not_none, utcnow
 from pydantic import BaseModel
 
 
@@ -8,6 +12,19 @@ class PineconeMetadata(BaseModel):
     question_title: str
     market_address: HexAddress
     close_time_timestamp: int
+    # Live state of the market, as of `state_updated_timestamp`, kept current by `PineconeHandler.refresh_market_states`.
+    # Missing for markets indexed before these fields existed, until their first refresh.
+    is_open: bool | None = None
+    current_p_yes: Probability | None = None
+    liquidity: float | None = None
+    state_updated_timestamp: int | None = None
+
+    STATE_FIELDS: t.ClassVar[set[str]] = {
+        "is_open",
+        "current_p_yes",
+        "liquidity",
+        "state_updated_timestamp",
+    }
 
     @staticmethod
     def from_omen_market(market: OmenMarket) -> "PineconeMetadata":
@@ -15,6 +32,16 @@ class PineconeMetadata(BaseModel):
             question_title=market.question_title,
             market_address=market.id,
             close_time_timestamp=int(market.close_time.timestamp()),
+            is_open=market.is_open and not market.is_resolved,
+            current_p_yes=market.current_p_yes,
+            liquidity=market.liquidityParameter.as_token.value,
+            state_updated_timestamp=int(utcnow().timestamp()),
+        )
+
+    def has_state_newer_than(self, max_age: timedelta) -> bool:
+        return (
+            self.state_updated_timestamp is not None
+            and self.state_updated_timestamp >= (utcnow() - max_age).timestamp()
         )
 
 
@@ -28,3 +55,10 @@ class CorrelatedMarketInput(BaseModel):
             current_p_yes=omen_market.current_p_yes,
             question_title=omen_market.question_title,
         )
+
+    @staticmethod
+    def from_pinecone_metadata(metadata: PineconeMetadata) -> "CorrelatedMarketInput":
+        return CorrelatedMarketInput(
+            current_p_yes=check_not_none(metadata.current_p_yes),
+            question_title=metadata.question_title,
+        )
@@ -0,0 +1,38 @@
+import time
+import typing as t
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from datetime import timedelta
+
+T = t.TypeVar("T")
+
+
+def wait_for_quorum(
+    futures: t.Sequence[Future[tuple[str, T | None]]],
+    quorum: float,
+    min_quorum: float,
+    deadline: timedelta,
+) -> set[Future[tuple[str, T | None]]]:
+    """
+    Waits until at least `quorum` (a fraction of all the futures) of the scenarios is predicted, or all of them are done,
+    and returns the ones that aren't done.
+    After the `deadline`, `min_quorum` is enough. Futures that raised or returned no prediction don't count towards the quorum.
+    """
+    deadline_at = time.monotonic() + deadline.total_seconds()
+    pending = set(futures)
+    while pending:
+        n_predicted = sum(
+            future.exception() is None and future.result()[1] is not None
+            for future in futures
+            if future not in pending
+        )
+        if n_predicted >= quorum * len(futures):
+            break
+        remaining_seconds = deadline_at - time.monotonic()
+        timeout: float | None = remaining_seconds
+        if remaining_seconds <= 0:
+            if n_predicted >= min_quorum * len(futures):
+                break
+            # Without the minimal quorum, the scenarios are awaited until it's reached, or all of them are done.
+            timeout = None
+        _, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+    return pending
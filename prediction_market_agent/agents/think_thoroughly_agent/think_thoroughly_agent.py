@@ -1,5 +1,9 @@
+import contextvars
+import threading
 import typing as t
 from abc import ABC
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from datetime import timedelta
 from uuid import UUID, uuid4
 
 import langfuse
@@ -7,6 +11,7 @@ from crewai import Agent, Crew, Process, Task
 from crewai.crews.crew_output import CrewOutput
 from crewai.llm import LLM
 from crewai.tools import tool
+from loky import get_reusable_executor
 from openinference.instrumentation.crewai import CrewAIInstrumentor
 from openinference.instrumentation.litellm import LiteLLMInstrumentor
 from prediction_market_agent_tooling.deploy.agent import initialize_langfuse
@@ -20,7 +25,6 @@ from prediction_market_agent_tooling.tools.openai_utils import (
     OpenAIModel,
     get_openai_provider,
 )
-from prediction_market_agent_tooling.tools.parallelism import par_generator, par_map
 from prediction_market_agent_tooling.tools.tavily.tavily_search import tavily_search
 from prediction_market_agent_tooling.tools.utils import (
     LLM_SUPER_LOW_TEMPERATURE,
@@ -54,6 +58,9 @@ from prediction_market_agent.agents.think_thoroughly_agent.prompts import (
     RESEARCH_OUTCOME_PROMPT,
     RESEARCH_OUTCOME_WITH_PREVIOUS_OUTPUTS_PROMPT,
 )
+from prediction_market_agent.agents.think_thoroughly_agent.scenario_quorum import (
+    wait_for_quorum,
+)
 from prediction_market_agent.agents.utils import get_event_date_from_question
 from prediction_market_agent.db.long_term_memory_table_handler import (
     LongTermMemoryTableHandler,
@@ -65,6 +72,32 @@ from prediction_market_agent.tools.prediction_prophet.research import (
 )
 from prediction_market_agent.utils import APIKeys
 
+ScenarioExecutionMode = t.Literal["process", "thread"]
+
+# Inputs of `process_scenario`, as a single tuple, so that it can be submitted to any of the executors as is.
+ScenarioInputs = tuple[
+    bool,
+    UUID,
+    KnownModelName,
+    str,
+    str,
+    list[tuple[str, AnswerWithScenario]] | None,
+    t.Callable[
+        [
+            UUID,
+            KnownModelName,
+            str,
+            str,
+            list[tuple[str, AnswerWithScenario]] | None,
+        ],
+        AnswerWithScenario | None,
+    ],
+]
+
+_INSTRUMENT_LOCK = threading.Lock()
+
+T = t.TypeVar("T")
+
 
 class Scenarios(BaseModel):
     scenarios: list[str]
@@ -91,6 +124,21 @@ class ThinkThoroughlyBase(ABC):
     identifier: AgentIdentifier
     model: KnownModelName
     model_for_generate_prediction_for_one_outcome: KnownModelName
+    # Correlated markets are fetched from the subgraph, unless their state in the index is at most this old.
+    max_market_state_age = timedelta(hours=1)
+    # Predictions of the scenarios are I/O-bound (LLM and search calls), so they run in threads of this process, without starting
+    # worker processes and pickling their inputs. Agents whose predictions use non-thread-safe state run them in processes instead.
+    scenario_execution_mode: ScenarioExecutionMode = "thread"
+    max_scenario_processes = 5
+    max_scenario_threads = 10
+    # Scenarios don't all need to be predicted, as up to half of them can fail anyway. The fan-out is complete once `scenario_quorum`
+    # of them are predicted, or, after `scenario_deadline`, once `min_scenario_quorum` of them are. The others are then dropped.
+    scenario_quorum = 0.8
+    min_scenario_quorum = 0.5
+    scenario_deadline = timedelta(minutes=10)
+    # Independent stages of `answer_binary_market`.
+    max_concurrent_stages = 4
+    max_concurrent_market_fetches = 5
 
     def __init__(self, enable_langfuse: bool, memory: bool = True) -> None:
         self.enable_langfuse = enable_langfuse
@@ -120,9 +168,7 @@ class ThinkThoroughlyBase(ABC):
 
     @staticmethod
     def _get_researcher(model: KnownModelName) -> Agent:
-        # If not already, configures Langfuse instrumentation for CrewAI
-        CrewAIInstrumentor().instrument(skip_dep_check=True)
-        LiteLLMInstrumentor().instrument()
+        instrument_crewai()
 
         return Agent(
             role="Research Analyst",
@@ -136,9 +182,7 @@ class ThinkThoroughlyBase(ABC):
 
     @staticmethod
     def _get_predictor(model: KnownModelName) -> Agent:
-        # If not already, configures Langfuse instrumentation for CrewAI
-        CrewAIInstrumentor().instrument(skip_dep_check=True)
-        LiteLLMInstrumentor().instrument()
+        instrument_crewai()
 
         return Agent(
             role="Professional Gambler",
@@ -221,20 +265,41 @@ class ThinkThoroughlyBase(ABC):
             5, text=question
         )
 
-        markets = par_map(
-            items=[q.market_address for q in nearest_questions],
-            func=lambda market_address: OmenSubgraphHandler().get_omen_market_by_market_id(
-                market_id=market_address
-            ),
-        )
+        # Use the state kept in the index by `PineconeHandler.refresh_market_states`, if it's recent enough.
+        if all(
+            q.has_state_newer_than(self.max_market_state_age) for q in nearest_questions
+        ):
+            return [
+                CorrelatedMarketInput.from_pinecone_metadata(q)
+                for q in nearest_questions
+            ]
+
+        # Fetched in threads, not in the shared process pool (`par_map`), where they would queue behind the scenarios in the process mode.
+        with ThreadPoolExecutor(
+            max_workers=self.max_concurrent_market_fetches
+        ) as executor:
+            markets = list(
+                executor.map(
+                    lambda q: OmenSubgraphHandler().get_omen_market_by_market_id(
+                        market_id=q.market_address
+                    ),
+                    nearest_questions,
+                )
+            )
         return [CorrelatedMarketInput.from_omen_market(market) for market in markets]
 
+    def get_research_report(self, question: str) -> str | None:
+        """Research of the question for the final decision, if the agent does any."""
+        return None
+
     @observe()
     def generate_final_decision(
         self,
         question: str,
         scenarios_with_probabilities: list[t.Tuple[str, AnswerWithScenario]],
         created_time: DatetimeUTC | None,
+        correlated_markets: list[CorrelatedMarketInput],
+        event_date: DatetimeUTC | None,
         research_report: str | None = None,
     ) -> ProbabilisticAnswer:
         predictor = self._get_predictor(self.model)
@@ -252,9 +317,6 @@ class ThinkThoroughlyBase(ABC):
 
         crew = Crew(agents=[predictor], tasks=[task_final_decision], verbose=True)
 
-        correlated_markets = self.get_correlated_markets(question)
-
-        event_date = get_event_date_from_question(question)
         n_remaining_days = (event_date - utcnow()).days if event_date else "Unknown"
         n_market_open_days = (
             (utcnow() - created_time).days if created_time else "Unknown"
@@ -295,6 +357,58 @@ class ThinkThoroughlyBase(ABC):
         )
         return answer
 
+    def process_scenarios(
+        self, items: list[ScenarioInputs]
+    ) -> tuple[list[tuple[str, AnswerWithScenario | None]], list[str]]:
+        """
+        Returns the results of `process_scenario` for the inputs that completed before the quorum was reached, in their order,
+        and the scenarios that were dropped. Executed as set by `scenario_execution_mode`.
+        """
+        executor: Executor
+        if self.scenario_execution_mode == "process":
+            # Reusable process pool of the process, so it isn't shut down.
+            executor = get_reusable_executor(
+                max_workers=self.max_scenario_processes, initializer=patch_logger
+            )
+            futures = [executor.submit(process_scenario, item) for item in items]
+            stragglers = self.wait_for_scenario_quorum(futures)
+        else:
+            executor = ThreadPoolExecutor(
+                max_workers=self.max_scenario_threads, thread_name_prefix="scenario"
+            )
+            # Each scenario runs in a copy of the current context, so that it's traced under the current Langfuse trace.
+            futures = [
+                executor.submit(contextvars.copy_context().run, predict_scenario, item)
+                for item in items
+            ]
+            stragglers = self.wait_for_scenario_quorum(futures)
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        # Stragglers that didn't start are cancelled. Running ones can't be interrupted, they finish in the background and are ignored.
+        for future in stragglers:
+            future.cancel()
+        # Scenarios fail inside `predict_scenario`, but the executor itself can fail too, e.g. if a worker process dies.
+        results = [
+            future.result() if future.exception() is None else (item[3], None)
+            for future, item in zip(futures, items)
+            if future not in stragglers
+        ]
+        dropped = [
+            item[3] for future, item in zip(futures, items) if future in stragglers
+        ]
+        return results, dropped
+
+    def wait_for_scenario_quorum(
+        self, futures: list[Future[tuple[str, AnswerWithScenario | None]]]
+    ) -> set[Future[tuple[str, AnswerWithScenario | None]]]:
+        """Waits until the quorum of the scenarios is predicted (see `scenario_quorum`) or all of them are done, and returns the ones that aren't."""
+        return wait_for_quorum(
+            futures,
+            quorum=self.scenario_quorum,
+            min_quorum=self.min_scenario_quorum,
+            deadline=self.scenario_deadline,
+        )
+
     @observe()
     def answer_binary_market(
         self,
@@ -302,13 +416,49 @@ class ThinkThoroughlyBase(ABC):
         n_iterations: int = 1,
         created_time: DatetimeUTC | None = None,
     ) -> ProbabilisticAnswer | None:
-        hypothetical_scenarios = self.get_hypohetical_scenarios(question)
-        conditional_scenarios = self.get_required_conditions(question)
+        # Stages that don't depend on each other run concurrently, so that the latency is of the longest chain of them:
+        # scenarios are generated, then predicted, then the final decision is made with the inputs fetched in the meantime.
+        # The research report is the exception, it's expensive and only needed if the predictions succeed.
+        # Each stage runs in a copy of the current context, so that it's traced under the current Langfuse trace.
+        # The stages have their own pool, separate from the scenarios' executor, to not queue behind them.
+        with ThreadPoolExecutor(
+            max_workers=self.max_concurrent_stages, thread_name_prefix="stage"
+        ) as executor:
+
+            def submit(fn: t.Callable[[str], T]) -> Future[T]:
+                return executor.submit(contextvars.copy_context().run, fn, question)
+
+            hypothetical_scenarios_future = submit(self.get_hypohetical_scenarios)
+            conditional_scenarios_future = submit(self.get_required_conditions)
+            correlated_markets_future = submit(self.get_correlated_markets)
+            event_date_future = submit(get_event_date_from_question)
+
+            scenarios_with_probs = self.predict_scenarios(
+                question,
+                all_scenarios=hypothetical_scenarios_future.result().scenarios
+                + conditional_scenarios_future.result().scenarios,
+                n_iterations=n_iterations,
+            )
+            research_report = self.get_research_report(question)
+
+            final_answer = self.generate_final_decision(
+                question,
+                scenarios_with_probs,
+                created_time=created_time,
+                correlated_markets=correlated_markets_future.result(),
+                event_date=event_date_future.result(),
+                research_report=research_report,
+            )
+        return final_answer
 
+    def predict_scenarios(
+        self, question: str, all_scenarios: list[str], n_iterations: int
+    ) -> list[tuple[str, AnswerWithScenario]]:
         unique_id = uuid4()
         observe_unique_id(unique_id)
 
         scenarios_with_probs: list[tuple[str, AnswerWithScenario]] = []
+        all_dropped_scenarios: list[str] = []
         for iteration in range(n_iterations):
             # If n_ierations is > 1, the agent will generate predictions for
             # each scenario multiple times, taking into account the previous
@@ -317,11 +467,8 @@ class ThinkThoroughlyBase(ABC):
                 f"Starting to generate predictions for each scenario, iteration {iteration + 1} / {n_iterations}."
             )
 
-            all_scenarios = (
-                hypothetical_scenarios.scenarios + conditional_scenarios.scenarios
-            )
-            sub_predictions = par_generator(
-                items=[
+            sub_predictions, dropped_scenarios = self.process_scenarios(
+                [
                     (
                         self.enable_langfuse,
                         unique_id,
@@ -332,8 +479,7 @@ class ThinkThoroughlyBase(ABC):
                         self.generate_prediction_for_one_outcome,
                     )
                     for scenario in all_scenarios
-                ],
-                func=process_scenario,
+                ]
             )
 
             scenarios_with_probs = []
@@ -347,15 +493,22 @@ class ThinkThoroughlyBase(ABC):
                 )
                 self.save_answer_to_long_term_memory(prediction)
 
-            if len(scenarios_with_probs) < len(all_scenarios) / 2:
+            if dropped_scenarios:
+                logger.warning(
+                    f"Dropped {len(dropped_scenarios)} scenarios that weren't predicted before the quorum was reached: {dropped_scenarios}"
+                )
+                all_dropped_scenarios.extend(dropped_scenarios)
+                # Recorded in the trace, so that the analytics can tell dropped scenarios from the failed ones.
+                observe_dropped_scenarios(all_dropped_scenarios)
+
+            if len(scenarios_with_probs) < self.min_scenario_quorum * len(
+                all_scenarios
+            ):
                 raise ValueError(
                     f"Too many of sub_predictions have failed, stopping the agent. Got only {len(scenarios_with_probs)} out of {len(all_scenarios)}."
                 )
 
-        final_answer = self.generate_final_decision(
-            question, scenarios_with_probs, created_time=created_time
-        )
-        return final_answer
+        return scenarios_with_probs
 
 
 class ThinkThoroughlyWithItsOwnResearch(ThinkThoroughlyBase):
@@ -432,6 +585,8 @@ class ThinkThoroughlyWithPredictionProphetResearch(ThinkThoroughlyBase):
     identifier = THINK_THOROUGHLY_PROPHET
     model = "openai:gpt-5.4"
     model_for_generate_prediction_for_one_outcome = "openai:gpt-5.4"
+    # `prophet_research` embeds the search results into an in-memory ChromaDB collection, which would be shared by the threads of a process.
+    scenario_execution_mode: ScenarioExecutionMode = "process"
 
     @staticmethod
     def generate_prediction_for_one_outcome(
@@ -494,35 +649,21 @@ class ThinkThoroughlyWithPredictionProphetResearch(ThinkThoroughlyBase):
             reasoning=prediction.reasoning,
         )
 
-    def generate_final_decision(
-        self,
-        question: str,
-        scenarios_with_probabilities: list[t.Tuple[str, AnswerWithScenario]],
-        created_time: DatetimeUTC | None,
-        research_report: str | None = None,
-    ) -> ProbabilisticAnswer:
+    def get_research_report(self, question: str) -> str | None:
         api_keys = APIKeys()
-        report = (
-            research_report
-            or prophet_research(
-                goal=question,
-                agent=PydanticAIAgent(
-                    OpenAIModel(
-                        infer_model(self.model),
-                        provider=get_openai_provider(api_keys.openai_api_key),
-                    ),
-                    model_settings=ModelSettings(temperature=0.7),
+        report: str = prophet_research(
+            goal=question,
+            agent=PydanticAIAgent(
+                OpenAIModel(
+                    infer_model(self.model),
+                    provider=get_openai_provider(api_keys.openai_api_key),
                 ),
-                openai_api_key=api_keys.openai_api_key,
-                tavily_api_key=api_keys.tavily_api_key,
-            ).report
-        )
-        return super().generate_final_decision(
-            question=question,
-            scenarios_with_probabilities=scenarios_with_probabilities,
-            created_time=created_time,
-            research_report=report,
-        )
+                model_settings=ModelSettings(temperature=0.7),
+            ),
+            openai_api_key=api_keys.openai_api_key,
+            tavily_api_key=api_keys.tavily_api_key,
+        ).report
+        return report
 
 
 def observe_unique_id(unique_id: UUID) -> None:
@@ -530,31 +671,34 @@ def observe_unique_id(unique_id: UUID) -> None:
     langfuse.get_client().update_current_trace(metadata={"unique_id": str(unique_id)})
 
 
-def process_scenario(
-    inputs: tuple[
-        bool,
-        UUID,
-        KnownModelName,
-        str,
-        str,
-        list[tuple[str, AnswerWithScenario]] | None,
-        t.Callable[
-            [
-                UUID,
-                KnownModelName,
-                str,
-                str,
-                list[tuple[str, AnswerWithScenario]] | None,
-            ],
-            AnswerWithScenario | None,
-        ],
-    ],
-) -> tuple[str, AnswerWithScenario | None]:
+def observe_dropped_scenarios(dropped_scenarios: list[str]) -> None:
+    langfuse.get_client().update_current_trace(
+        metadata={"dropped_scenarios": dropped_scenarios}
+    )
+
+
+def instrument_crewai() -> None:
+    # If not already, configures Langfuse instrumentation for CrewAI.
+    # Locked, because the instrumentors aren't thread-safe, and the scenarios can be started from many threads at once.
+    with _INSTRUMENT_LOCK:
+        CrewAIInstrumentor().instrument(skip_dep_check=True)
+        LiteLLMInstrumentor().instrument()
+
+
+def process_scenario(inputs: ScenarioInputs) -> tuple[str, AnswerWithScenario | None]:
     # Needs to be a normal function outside of class, because `lambda` and `self` aren't pickable for processpool executor,
-    # and process pool executor is required, because ChromaDB isn't thread-safe.
-    # Input arguments needs to be as a single tuple, because par_generator requires a single argument.
+    # which is used for agents whose predictions aren't thread-safe, see `ThinkThoroughlyBase.scenario_execution_mode`.
+    enable_langfuse = inputs[0]
+    # Reset Langfuse, as this is executed as a separate process and Langfuse isn't thread-safe.
+    initialize_langfuse(enable_langfuse)
+    # Same for patching logger. Force patch, because while our logger is forked patched, LiteLLM still needs patching.
+    patch_logger(force_patch=True)
+    return predict_scenario(inputs)
+
+
+def predict_scenario(inputs: ScenarioInputs) -> tuple[str, AnswerWithScenario | None]:
     (
-        enable_langfuse,
+        _,
         unique_id,
         model,
         scenario,
@@ -562,10 +706,6 @@ def process_scenario(
         scenarios_with_probs,
         process_function,
     ) = inputs
-    # Reset Langfuse, as this is executed as a separate process and Langfuse isn't thread-safe.
-    initialize_langfuse(enable_langfuse)
-    # Same for patching logger. Force patch, because while our logger is forked patched, LiteLLM still needs patching.
-    patch_logger(force_patch=True)
     try:
         result = observe(name="process_scenario")(process_function)(
             unique_id, model, scenario, original_question, scenarios_with_probs
@@ -573,6 +713,6 @@ def process_scenario(
     except Exception as e:
         # Log only as warning, because ThinkThoroughly is generating a lot of scenarios and it can happen that some of them will fail for any random error.
         # If too many of them fail, it will be logged as error and we will know.
-        logger.warning(f"Error in `process_scenario` subprocess: {str(e)}")
+        logger.warning(f"Error in `process_scenario`: {str(e)}")
         result = None
     return (scenario, result)
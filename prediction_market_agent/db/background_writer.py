@@ -0,0 +1,158 @@
+import atexit
+import queue
+import threading
+import time
+import typing as t
+from dataclasses import dataclass
+
+from prediction_market_agent_tooling.loggers import logger
+from sqlmodel import SQLModel
+
+from prediction_market_agent.db.sql_handler import SQLHandler
+
+
+@dataclass
+class _WriteRequest:
+    sql_handler: SQLHandler
+    items: list[SQLModel]
+    n_failed_writes: int = 0
+
+
+class BackgroundWriter:
+    """
+    Write-behind queue that inserts items into the database from a background thread, so the caller doesn't wait for the database.
+
+    Submitted items are buffered and written (using `SQLHandler.bulk_insert`) once there are `max_batch_size` of them,
+    once the oldest of them waited for `max_delay_seconds`, or on `flush` / `close`.
+    Items are always written in the order they were submitted. If a write fails, the items stay in the buffer and are retried
+    with the next write, and the error is raised (once) from the next `flush` or `close`. Items still failing after `max_retries` retries are dropped
+    (and logged), so that the buffer doesn't grow forever while the database is down. Remaining items are written at interpreter exit as well.
+
+    Note: in-memory SQLite databases are per-thread, so the writer needs a file-based one.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int = 100,
+        max_delay_seconds: float = 5.0,
+        max_retries: int = 10,
+    ):
+        self.max_batch_size = max_batch_size
+        self.max_delay_seconds = max_delay_seconds
+        self.max_retries = max_retries
+        self._queue: queue.Queue[_WriteRequest | threading.Event | None] = queue.Queue()
+        self._error: Exception | None = None
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name=self.__class__.__name__, daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def submit(self, sql_handler: SQLHandler, items: t.Sequence[SQLModel]) -> None:
+        if self._closed:
+            raise RuntimeError(f"{self.__class__.__name__} is already closed.")
+        self._queue.put(_WriteRequest(sql_handler=sql_handler, items=list(items)))
+
+    def flush(self, raise_error: bool = True) -> None:
+        """
+        Blocks until all items submitted so far are written, or failed to be written.
+        Read paths only need the items written when possible, so they can pass `raise_error=False` to log the error instead.
+        """
+        if not self._closed:
+            written = threading.Event()
+            self._queue.put(written)
+            written.wait()
+        try:
+            self._raise_if_failed()
+        except Exception as e:
+            if raise_error:
+                raise
+            logger.error(
+                f"{self.__class__.__name__} failed to write items before reading: {e}"
+            )
+
+    def close(self) -> None:
+        """Writes all the remaining items and stops the background thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        atexit.unregister(self.close)
+        self._raise_if_failed()
+
+    def _raise_if_failed(self) -> None:
+        # Raised only once, the failed items are retried (or dropped) regardless.
+        if (error := self._error) is not None:
+            self._error = None
+            raise error
+
+    def _run(self) -> None:
+        pending: list[_WriteRequest] = []
+        deadline: float | None = None
+
+        while True:
+            timeout = (
+                None if deadline is None else max(0.0, deadline - time.monotonic())
+            )
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                request = threading.Event()  # Deadline reached, handle as a flush.
+
+            if isinstance(request, _WriteRequest):
+                pending.append(request)
+                if deadline is None:
+                    deadline = time.monotonic() + self.max_delay_seconds
+                if sum(len(r.items) for r in pending) < self.max_batch_size:
+                    continue
+
+            pending = self._write(pending)
+            # Retry failed writes after the delay, instead of in a busy loop.
+            deadline = time.monotonic() + self.max_delay_seconds if pending else None
+
+            if request is None:
+                if pending:
+                    logger.error(
+                        f"{self.__class__.__name__} closed with {sum(len(r.items) for r in pending)} items that failed to be written."
+                    )
+                return
+            if isinstance(request, threading.Event):
+                request.set()
+
+    def _write(self, pending: list[_WriteRequest]) -> list[_WriteRequest]:
+        """Writes the pending requests in order and returns those that failed and can be retried."""
+        while pending:
+            # Merge consecutive requests for the same table into a single insert.
+            sql_handler = pending[0].sql_handler
+            n_requests = 1
+            while (
+                n_requests < len(pending)
+                and pending[n_requests].sql_handler is sql_handler
+            ):
+                n_requests += 1
+            try:
+                sql_handler.bulk_insert(
+                    [item for r in pending[:n_requests] for item in r.items]
+                )
+            except Exception as e:
+                logger.error(f"{self.__class__.__name__} failed to write items: {e}")
+                self._error = e
+                for request in pending[:n_requests]:
+                    request.n_failed_writes += 1
+                if dropped := [
+                    r for r in pending if r.n_failed_writes > self.max_retries
+                ]:
+                    logger.error(
+                        f"{self.__class__.__name__} dropped {sum(len(r.items) for r in dropped)} items after {self.max_retries + 1} failed writes."
+                    )
+                return [r for r in pending if r.n_failed_writes <= self.max_retries]
+            pending = pending[n_requests:]
+
+        self._error = None
+        return pending
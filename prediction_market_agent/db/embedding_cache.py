@@ -0,0 +1,125 @@
+import hashlib
+import typing as t
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from prediction_market_agent_tooling.loggers import logger
+from sqlalchemy import Column, LargeBinary, Table
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Field, SQLModel, col
+
+from prediction_market_agent.db.sql_handler import SQLHandler
+from prediction_market_agent.utils import DBKeys
+
+
+class CachedEmbedding(SQLModel, table=True):
+    __tablename__ = "embedding_cache"
+    __table_args__ = {"extend_existing": True}
+    # sha256 of the model and the text, see `CachedEmbeddings.get_key`.
+    key: str = Field(primary_key=True)
+    # float32 array, as returned by the embeddings API.
+    vector: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Drop-in `Embeddings` that stores the vectors computed by `embeddings` in a local SQLite database, content-addressed by the model and the text.
+    Repeated texts are then a local lookup instead of an API call.
+
+    Queries and documents share the cache, as the embedding of a text doesn't depend on its usage for OpenAI models.
+    """
+
+    # Stay below the SQLite limit on the number of variables in a query.
+    lookup_batch_size = 500
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model: str,
+        sqlite_path: str | None = None,
+    ) -> None:
+        self.embeddings = embeddings
+        self.model = model
+        self.sql_handler = SQLHandler(
+            model=CachedEmbedding,
+            sqlalchemy_db_url=f"sqlite:///{sqlite_path or DBKeys().EMBEDDING_CACHE_SQLITE_PATH}",
+        )
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        n_lookups = self.hits + self.misses
+        return self.hits / n_lookups if n_lookups else 0.0
+
+    def get_key(self, text: str) -> str:
+        # Null byte separates the model from the text, so that their concatenation is unambiguous.
+        return hashlib.sha256(f"{self.model}\0{text}".encode()).hexdigest()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(texts, self.embeddings.embed_documents)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(
+            [text], lambda texts: [self.embeddings.embed_query(texts[0])]
+        )[0]
+
+    def _embed(
+        self,
+        texts: list[str],
+        embed_fn: t.Callable[[list[str]], list[list[float]]],
+    ) -> list[list[float]]:
+        keys = [self.get_key(text) for text in texts]
+        vectors = self._load(set(keys))
+
+        # Each distinct missing text is embedded only once, even if it's repeated in `texts`.
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        if missing:
+            computed = embed_fn(list(missing.values()))
+            # Rounded the same way as the stored ones, to not depend on whether the text was cached.
+            new_vectors = {
+                key: np.asarray(vector, dtype=np.float32).tolist()
+                for key, vector in zip(missing.keys(), computed)
+            }
+            self._store(new_vectors)
+            vectors.update(new_vectors)
+
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        logger.debug(
+            f"Embedding cache of {self.model}: {len(texts) - len(missing)} hits and {len(missing)} misses, {self.hit_rate:.1%} hit rate overall ({self.hits} hits, {self.misses} misses)."
+        )
+        return [vectors[key] for key in keys]
+
+    def _load(self, keys: set[str]) -> dict[str, list[float]]:
+        sorted_keys = sorted(keys)
+        vectors: dict[str, list[float]] = {}
+        for i in range(0, len(sorted_keys), self.lookup_batch_size):
+            cached_embedding: CachedEmbedding
+            for cached_embedding in self.sql_handler.get_with_filter_and_order(
+                query_filters=[
+                    col(CachedEmbedding.key).in_(
+                        sorted_keys[i : i + self.lookup_batch_size]
+                    )
+                ]
+            ):
+                vectors[cached_embedding.key] = np.frombuffer(
+                    cached_embedding.vector, dtype=np.float32
+                ).tolist()
+        return vectors
+
+    def _store(self, vectors: dict[str, list[float]]) -> None:
+        table: Table = CachedEmbedding.__table__  # type: ignore[attr-defined]
+        with self.sql_handler.db_manager.get_connection() as connection:
+            # Another process could have stored the same text in the meantime, which is fine, as the vectors are the same.
+            connection.execute(
+                insert(table).on_conflict_do_nothing(),
+                [
+                    {
+                        "key": key,
+                        "vector": np.asarray(vector, dtype=np.float32).tobytes(),
+                    }
+                    for key, vector in vectors.items()
+                ],
+            )
+            connection.commit()
@@ -0,0 +1,595 @@
+import json
+import os
+import typing as t
+from pathlib import Path
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from prediction_market_agent_tooling.loggers import logger
+from pydantic import BaseModel
+
+# Subset of Pinecone's metadata filter operators, see https://docs.pinecone.io/guides/data/filter-with-metadata.
+FILTER_OPERATORS: dict[str, t.Callable[[np.ndarray, t.Any], np.ndarray]] = {
+    "$eq": lambda values, operand: values == operand,
+    "$ne": lambda values, operand: values != operand,
+    "$gt": lambda values, operand: values > operand,
+    "$gte": lambda values, operand: values >= operand,
+    "$lt": lambda values, operand: values < operand,
+    "$lte": lambda values, operand: values <= operand,
+    "$in": lambda values, operand: np.isin(values, list(operand)),
+    "$nin": lambda values, operand: ~np.isin(values, list(operand)),
+}
+
+# Number of set bits of each byte value, for Hamming distances of binary-quantized vectors.
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class VectorCompression(BaseModel):
+    """
+    Compact copy of the vectors, used to find candidates that are then reranked with the full vectors.
+
+    `dimension` keeps only the first dimensions of the vectors (re-normalized), which works for Matryoshka embeddings,
+    such as OpenAI's `text-embedding-3-*`. `quantization` stores each dimension as int8 (with a scale per vector),
+    or as a single bit (its sign) compared by Hamming distance.
+    """
+
+    dimension: int | None = None
+    quantization: t.Literal["int8", "binary"] | None = None
+    # How many times more candidates than the requested `k` are reranked with the full vectors.
+    rerank_factor: int = 4
+
+    # Rows of the full vectors processed at once, to bound the temporary memory.
+    chunk_size: t.ClassVar[int] = 16384
+
+    @property
+    def name(self) -> str:
+        return f"{self.dimension or 'full'}d_{self.quantization or 'float32'}"
+
+    def row_dtype(self, full_dimension: int) -> np.dtype:
+        dimension = self.dimension or full_dimension
+        if self.quantization == "int8":
+            return np.dtype([("scale", np.float32), ("values", np.int8, (dimension,))])
+        elif self.quantization == "binary":
+            return np.dtype((np.uint8, ((dimension + 7) // 8,)))
+        return np.dtype((np.float32, (dimension,)))
+
+    def truncate(self, vectors: np.ndarray) -> np.ndarray:
+        return _normalize(vectors[:, : self.dimension]) if self.dimension else vectors
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Compresses the normalized full `vectors`, into an array of `row_dtype`."""
+        truncated = self.truncate(vectors)
+        if self.quantization == "int8":
+            encoded = np.zeros(len(truncated), dtype=self.row_dtype(vectors.shape[1]))
+            scale = np.abs(truncated).max(axis=1) / 127
+            encoded["scale"] = scale
+            encoded["values"] = np.round(
+                truncated / np.where(scale == 0, 1, scale)[:, None]
+            )
+            return encoded
+        elif self.quantization == "binary":
+            return np.packbits(truncated > 0, axis=1)
+        return truncated.astype(np.float32)
+
+    def scores(self, encoded: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """Approximate similarity of the normalized full `queries` (rows of the result) to the `encoded` vectors (columns)."""
+        truncated_queries = self.truncate(queries)
+        scores = np.empty((len(queries), len(encoded)), dtype=np.float32)
+        for start in range(0, len(encoded), self.chunk_size):
+            chunk = encoded[start : start + self.chunk_size]
+            if self.quantization == "int8":
+                chunk_scores = (
+                    truncated_queries @ chunk["values"].astype(np.float32).T
+                ) * chunk["scale"]
+            elif self.quantization == "binary":
+                packed_queries = np.packbits(truncated_queries > 0, axis=1)
+                chunk_scores = -np.stack(
+                    [
+                        _POPCOUNT[chunk ^ packed_query].sum(axis=1, dtype=np.int32)
+                        for packed_query in packed_queries
+                    ]
+                )
+            else:
+                chunk_scores = truncated_queries @ chunk.T
+            scores[:, start : start + len(chunk)] = chunk_scores
+        return scores
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process alternative to `PineconeVectorStore`, for searching without any external service.
+
+    Vectors are kept normalized in a float32 file, memory-mapped for searching, so that cosine similarity is a single matrix-vector product.
+    Documents and their metadata are kept in a JSON lines file next to it. Both files are append-only: adding an existing id appends
+    a new row and the previous one is ignored from then on. Metadata can also be updated without re-adding the vectors, the updates
+    are appended to another JSON lines file and merged into the documents file once there are more of them than documents. Metadata can be filtered with the same syntax as in Pinecone (e.g. `{"close_time_timestamp": {"$gte": 100}}`).
+
+    With `use_hnsw`, searches go through an HNSW graph (requires the optional `hnswlib` package, see the `hnsw` extra) instead of comparing
+    against all the vectors, which is approximate, but scales better with large indexes. The graph is saved only by `persist`, rows missing
+    in the saved one are added to it when loading. Alternatively, with `compression`, all the vectors are compared in a compact form
+    (see `VectorCompression`), and only the best candidates are compared using the full vectors.
+
+    The store is meant to be used by a single process at a time.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        path: str | Path,
+        use_hnsw: bool = False,
+        compression: VectorCompression | None = None,
+    ) -> None:
+        if use_hnsw and compression is not None:
+            raise ValueError("Use either `use_hnsw` or `compression`, not both.")
+        self.embedding = embedding
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.use_hnsw = use_hnsw
+        self.compression = compression
+
+        self.dimension: int | None = None
+        self.ids: list[str] = []
+        self.texts: list[str] = []
+        self.metadatas: list[dict[str, t.Any]] = []
+        # Row of the latest version of each id, older rows are excluded from searches.
+        self.id_to_row: dict[str, int] = {}
+        self.active = np.zeros(0, dtype=bool)
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.compressed_vectors = np.zeros(0, dtype=np.float32)
+        self._metadata_columns: dict[str, np.ndarray] = {}
+        self._hnsw_index: t.Any = None
+        # Whether the HNSW index has changes that aren't saved yet.
+        self._hnsw_index_changed = False
+
+        self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    @property
+    def _config_path(self) -> Path:
+        return self.path / "index.json"
+
+    @property
+    def _vectors_path(self) -> Path:
+        return self.path / "vectors.f32"
+
+    @property
+    def _documents_path(self) -> Path:
+        return self.path / "documents.jsonl"
+
+    @property
+    def _metadata_updates_path(self) -> Path:
+        return self.path / "metadata_updates.jsonl"
+
+    @property
+    def _hnsw_path(self) -> Path:
+        return self.path / "hnsw.bin"
+
+    @property
+    def _compressed_vectors_path(self) -> Path:
+        return (
+            self.path
+            / f"vectors_{t.cast(VectorCompression, self.compression).name}.bin"
+        )
+
+    def __len__(self) -> int:
+        return len(self.id_to_row)
+
+    def _load(self) -> None:
+        if not self._config_path.exists():
+            return
+        self.dimension = json.loads(self._config_path.read_text())["dimension"]
+
+        with self._documents_path.open() as f:
+            for line in f:
+                document = json.loads(line)
+                self.ids.append(document["id"])
+                self.texts.append(document["text"])
+                self.metadatas.append(document["metadata"])
+        # Only rows of which both the vector and the document were written count, in case a write was interrupted.
+        row_size = np.dtype(np.float32).itemsize * self._dimension
+        n_rows = min(len(self.ids), self._vectors_path.stat().st_size // row_size)
+        if n_rows < len(self.ids):
+            del self.ids[n_rows:], self.texts[n_rows:], self.metadatas[n_rows:]
+            self._write_documents()
+        os.truncate(self._vectors_path, n_rows * row_size)
+
+        self.active = np.zeros(n_rows, dtype=bool)
+        for row, id in enumerate(self.ids):
+            if (previous_row := self.id_to_row.get(id)) is not None:
+                self.active[previous_row] = False
+            self.id_to_row[id] = row
+            self.active[row] = True
+        self._map_vectors()
+        self._load_metadata_updates()
+
+        if self.use_hnsw:
+            self._load_hnsw_index()
+        if self.compression is not None:
+            self._load_compressed_vectors()
+
+    def _load_metadata_updates(self) -> None:
+        if not self._metadata_updates_path.exists():
+            return
+        n_updates = 0
+        with self._metadata_updates_path.open() as f:
+            for line in f:
+                try:
+                    update = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # Interrupted write of the last update.
+                # Updates are stored by row, as an id can be re-added with new metadata after its update.
+                if update["row"] < len(self.metadatas):
+                    self.metadatas[update["row"]].update(update["metadata"])
+                n_updates += 1
+        if n_updates > len(self.ids):
+            self._write_documents()
+            self._metadata_updates_path.unlink()
+
+    def update_metadata(self, metadatas: dict[str, dict[str, t.Any]]) -> None:
+        """Merges the given fields into the metadata of the documents with the given ids, unknown ids are ignored."""
+        with self._metadata_updates_path.open("a") as f:
+            for id, metadata in metadatas.items():
+                if (row := self.id_to_row.get(id)) is None:
+                    continue
+                f.write(json.dumps({"row": row, "metadata": metadata}) + "\n")
+                self.metadatas[row].update(metadata)
+        self._metadata_columns = {}
+
+    def _write_documents(self) -> None:
+        # Written next to the documents and then renamed, so that an interrupted write doesn't lose them.
+        tmp_path = self._documents_path.with_suffix(".tmp")
+        with tmp_path.open("w") as f:
+            for id, text, metadata in zip(self.ids, self.texts, self.metadatas):
+                f.write(
+                    json.dumps({"id": id, "text": text, "metadata": metadata}) + "\n"
+                )
+        os.replace(tmp_path, self._documents_path)
+
+    @property
+    def _dimension(self) -> int:
+        if self.dimension is None:
+            raise ValueError(
+                "Dimension is not known until the first vectors are added."
+            )
+        return self.dimension
+
+    def _map_vectors(self) -> None:
+        self.vectors = (
+            np.memmap(
+                self._vectors_path,
+                dtype=np.float32,
+                mode="r",
+                shape=(len(self.ids), self._dimension),
+            )
+            if self.ids
+            else np.zeros((0, self._dimension), dtype=np.float32)
+        )
+
+    def add_texts(
+        self,
+        texts: t.Iterable[str],
+        metadatas: list[dict[str, t.Any]] | None = None,
+        *,
+        ids: list[str] | None = None,
+        **kwargs: t.Any,
+    ) -> list[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        vectors = np.asarray(self.embedding.embed_documents(texts), dtype=np.float32)
+        return self.add_vectors(
+            vectors=vectors,
+            texts=texts,
+            metadatas=metadatas or [{} for _ in texts],
+            ids=ids or [str(len(self.ids) + i) for i in range(len(texts))],
+        )
+
+    def add_vectors(
+        self,
+        vectors: np.ndarray,
+        texts: list[str],
+        metadatas: list[dict[str, t.Any]],
+        ids: list[str],
+    ) -> list[str]:
+        """Same as `add_texts`, but with already computed vectors."""
+        if self.dimension is None:
+            self.dimension = vectors.shape[1]
+            self._config_path.write_text(json.dumps({"dimension": self.dimension}))
+        elif vectors.shape[1] != self.dimension:
+            raise ValueError(
+                f"Expected vectors of dimension {self.dimension}, got {vectors.shape[1]}."
+            )
+
+        first_row = len(self.ids)
+        with self._vectors_path.open("ab") as f:
+            f.write(_normalize(vectors).astype(np.float32).tobytes())
+        with self._documents_path.open("a") as f:
+            for id, text, metadata in zip(ids, texts, metadatas):
+                f.write(
+                    json.dumps({"id": id, "text": text, "metadata": metadata}) + "\n"
+                )
+
+        replaced_rows = []
+        self.active = np.concatenate([self.active, np.ones(len(ids), dtype=bool)])
+        for row, (id, text, metadata) in enumerate(
+            zip(ids, texts, metadatas), start=first_row
+        ):
+            if (previous_row := self.id_to_row.get(id)) is not None:
+                self.active[previous_row] = False
+                replaced_rows.append(previous_row)
+            self.id_to_row[id] = row
+            self.ids.append(id)
+            self.texts.append(text)
+            self.metadatas.append(metadata)
+        self._metadata_columns = {}
+        self._map_vectors()
+
+        if self._hnsw_index is not None:
+            self._add_to_hnsw_index(range(first_row, len(self.ids)), replaced_rows)
+        elif self.use_hnsw:
+            self._load_hnsw_index()
+        if self.compression is not None:
+            self._load_compressed_vectors()
+
+        return ids
+
+    def get_by_ids(self, ids: t.Sequence[str], /) -> list[Document]:
+        return [
+            self._document(row)
+            for id in ids
+            if (row := self.id_to_row.get(id)) is not None
+        ]
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 4,
+        filter: dict[str, t.Any] | None = None,
+        **kwargs: t.Any,
+    ) -> list[Document]:
+        return [
+            document
+            for document, _ in self.similarity_search_with_score(
+                query, k=k, filter=filter
+            )
+        ]
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: dict[str, t.Any] | None = None,
+        **kwargs: t.Any,
+    ) -> list[tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(
+            self.embedding.embed_query(query), k=k, filter=filter
+        )
+
+    def similarity_search_by_vector(
+        self,
+        embedding: list[float],
+        k: int = 4,
+        filter: dict[str, t.Any] | None = None,
+        **kwargs: t.Any,
+    ) -> list[Document]:
+        return [
+            document
+            for document, _ in self.similarity_search_by_vector_with_score(
+                embedding, k=k, filter=filter
+            )
+        ]
+
+    def similarity_search_by_vector_with_score(
+        self,
+        embedding: list[float],
+        k: int = 4,
+        filter: dict[str, t.Any] | None = None,
+    ) -> list[tuple[Document, float]]:
+        """Returns up to `k` documents with the highest cosine similarity to the `embedding`, and the similarity."""
+        return self.similarity_search_by_vectors_with_score(
+            [embedding], k=k, filter=filter
+        )[0]
+
+    def similarity_search_by_vectors_with_score(
+        self,
+        embeddings: t.Sequence[list[float]],
+        k: int = 4,
+        filter: dict[str, t.Any] | None = None,
+    ) -> list[list[tuple[Document, float]]]:
+        """Same as `similarity_search_by_vector_with_score` for many embeddings at once, searched as a single matrix product."""
+        mask = self._filter_mask(filter)
+        k = min(k, int(mask.sum()))
+        if k == 0 or not embeddings:
+            return [[] for _ in embeddings]
+        queries = _normalize(np.asarray(embeddings, dtype=np.float32))
+
+        if self._hnsw_index is not None:
+            self._hnsw_index.set_ef(max(k, 50))
+            rows, distances = self._hnsw_index.knn_query(
+                queries,
+                k=k,
+                # Replaced rows are marked as deleted in the graph, so only metadata filters need a (slower) callback.
+                filter=(lambda row: bool(mask[row])) if filter else None,
+            )
+            scores = 1 - distances
+        elif self.compression is not None:
+            approximate_scores = self.compression.scores(
+                self.compressed_vectors, queries
+            )
+            approximate_scores[:, ~mask] = -np.inf
+            candidates, _ = _top_k(
+                approximate_scores,
+                min(k * self.compression.rerank_factor, int(mask.sum())),
+            )
+            # Rerank the candidates with the full vectors, reading only their rows from the disk.
+            candidate_scores = np.einsum(
+                "qcd,qd->qc", self.vectors[candidates], queries
+            )
+            best, scores = _top_k(candidate_scores, k)
+            rows = np.take_along_axis(candidates, best, axis=1)
+        else:
+            all_scores = queries @ self.vectors.T
+            all_scores[:, ~mask] = -np.inf
+            rows, scores = _top_k(all_scores, k)
+
+        return [
+            [
+                (self._document(int(row)), float(score))
+                for row, score in zip(query_rows, query_scores)
+            ]
+            for query_rows, query_scores in zip(rows, scores)
+        ]
+
+    def _select_relevance_score_fn(self) -> t.Callable[[float], float]:
+        # Same as for Pinecone with cosine metric, so that the thresholds are interchangeable.
+        # Clipped, because normalized float32 vectors can be slightly above 1 in similarity.
+        return lambda score: (min(max(score, -1.0), 1.0) + 1) / 2
+
+    def _document(self, row: int) -> Document:
+        return Document(
+            id=self.ids[row],
+            page_content=self.texts[row],
+            metadata=self.metadatas[row],
+        )
+
+    def _filter_mask(self, filter: dict[str, t.Any] | None) -> np.ndarray:
+        mask = self.active.copy()
+        for field, condition in (filter or {}).items():
+            values = self._metadata_column(field)
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for operator, operand in condition.items():
+                if operator not in FILTER_OPERATORS:
+                    raise ValueError(f"Unsupported filter operator {operator}.")
+                mask &= FILTER_OPERATORS[operator](values, operand)
+        return mask
+
+    def _metadata_column(self, field: str) -> np.ndarray:
+        """Values of the metadata field of all rows, numeric fields as a float array (missing values as NaN), so that filters are vectorized."""
+        if field not in self._metadata_columns:
+            values = [metadata.get(field) for metadata in self.metadatas]
+            try:
+                column = np.array(
+                    [np.nan if value is None else value for value in values],
+                    dtype=np.float64,
+                )
+            except (TypeError, ValueError):
+                column = np.array(values, dtype=object)
+            self._metadata_columns[field] = column
+        return self._metadata_columns[field]
+
+    def _load_compressed_vectors(self) -> None:
+        """Maps the compressed vectors, and compresses rows that are missing in them (e.g. if the compression was just enabled)."""
+        compression = t.cast(VectorCompression, self.compression)
+        row_dtype = compression.row_dtype(self._dimension)
+        path = self._compressed_vectors_path
+        n_compressed_rows = min(
+            path.stat().st_size // row_dtype.itemsize if path.exists() else 0,
+            len(self.ids),
+        )
+        with path.open("ab") as f:
+            f.truncate(n_compressed_rows * row_dtype.itemsize)
+            for start in range(
+                n_compressed_rows, len(self.ids), compression.chunk_size
+            ):
+                f.write(
+                    compression.encode(
+                        np.asarray(self.vectors[start : start + compression.chunk_size])
+                    ).tobytes()
+                )
+        self.compressed_vectors = (
+            np.memmap(path, dtype=row_dtype, mode="r", shape=(len(self.ids),))
+            if self.ids
+            else np.zeros(0, dtype=row_dtype)
+        )
+
+    def _load_hnsw_index(self) -> None:
+        try:
+            import hnswlib
+        except ImportError as e:
+            raise ImportError(
+                "Install `hnswlib` (e.g. with the `hnsw` extra of prediction-market-agent) to use the HNSW index of LocalVectorStore."
+            ) from e
+        if self.dimension is None:
+            # Created with the first vectors.
+            return
+
+        self._hnsw_index = hnswlib.Index(space="cosine", dim=self.dimension)
+        if self._hnsw_path.exists():
+            self._hnsw_index.load_index(
+                str(self._hnsw_path), max_elements=len(self.ids)
+            )
+            indexed_rows = self._hnsw_index.get_current_count()
+        else:
+            self._hnsw_index.init_index(max_elements=max(len(self.ids), 1))
+            indexed_rows = 0
+        # Rows added while the HNSW index wasn't used.
+        self._add_to_hnsw_index(
+            range(indexed_rows, len(self.ids)),
+            [row for row in range(indexed_rows) if not self.active[row]],
+        )
+
+    def _add_to_hnsw_index(
+        self, new_rows: t.Sequence[int], replaced_rows: t.Sequence[int]
+    ) -> None:
+        if new_rows:
+            self._hnsw_index.resize_index(len(self.ids))
+            self._hnsw_index.add_items(
+                np.asarray(self.vectors[new_rows[0] : new_rows[-1] + 1]),
+                np.asarray(new_rows),
+            )
+        for row in replaced_rows:
+            try:
+                self._hnsw_index.mark_deleted(row)
+            except RuntimeError:
+                pass  # Already marked as deleted.
+        if new_rows or replaced_rows:
+            self._hnsw_index_changed = True
+
+    def persist(self) -> None:
+        """
+        Saves the HNSW index, if it changed. Vectors and documents are saved as they are added, but the whole HNSW index is rewritten,
+        so it's meant to be called once after adding all the texts, not after each batch of them.
+        """
+        if self._hnsw_index is None or not self._hnsw_index_changed:
+            return
+        self._hnsw_index.save_index(str(self._hnsw_path))
+        self._hnsw_index_changed = False
+        logger.debug(
+            f"Saved HNSW index with {len(self.ids)} rows to {self._hnsw_path}."
+        )
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: list[dict[str, t.Any]] | None = None,
+        *,
+        ids: list[str] | None = None,
+        **kwargs: t.Any,
+    ) -> "LocalVectorStore":
+        store = cls(embedding=embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _top_k(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Columns of the `k` highest scores in each row, and the scores, sorted from the highest."""
+    columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, columns, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return (
+        np.take_along_axis(columns, order, axis=1),
+        np.take_along_axis(top_scores, order, axis=1),
+    )
@@ -1,30 +1,54 @@
 import json
 import typing as t
+import zlib
+from itertools import chain, groupby, islice
 
-from prediction_market_agent_tooling.tools.utils import DatetimeUTC, utcnow
+from prediction_market_agent_tooling.tools.utils import (
+    DatetimeUTC,
+    check_not_none,
+    utcnow,
+)
+from sqlalchemy import JSON, Table, and_, cast, delete, func, or_, type_coerce, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql.elements import ColumnElement
-from sqlmodel import col
+from sqlmodel import Session, col, select
 
 from prediction_market_agent.agents.identifiers import AgentIdentifier
 from prediction_market_agent.agents.microchain_agent.answer_with_scenario import (
     AnswerWithScenario,
 )
-from prediction_market_agent.db.models import LongTermMemories
-from prediction_market_agent.db.sql_handler import SQLHandler
+from prediction_market_agent.db.background_writer import BackgroundWriter
+from prediction_market_agent.db.models import LongTermMemories, LongTermMemoriesArchive
+from prediction_market_agent.db.sql_handler import KeysetCursor, SQLHandler
+
+# Fields of the metadata that are also stored in their own columns, see `LongTermMemories`.
+METADATA_COLUMNS = ("role", "original_question")
 
 
 class LongTermMemoryTableHandler:
-    def __init__(self, task_description: str, sqlalchemy_db_url: str | None = None):
+    def __init__(
+        self,
+        task_description: str,
+        sqlalchemy_db_url: str | None = None,
+        writer: BackgroundWriter | None = None,
+    ):
+        """If `writer` is given, history is saved in the background, and flushed before any read to not miss it."""
         self.task_description = task_description
         self.sql_handler = SQLHandler(
             model=LongTermMemories, sqlalchemy_db_url=sqlalchemy_db_url
         )
+        self.archive_sql_handler = SQLHandler(
+            model=LongTermMemoriesArchive, sqlalchemy_db_url=sqlalchemy_db_url
+        )
+        self.writer = writer
 
     @staticmethod
     def from_agent_identifier(
         identifier: AgentIdentifier,
+        writer: BackgroundWriter | None = None,
     ) -> "LongTermMemoryTableHandler":
-        return LongTermMemoryTableHandler(task_description=identifier)
+        return LongTermMemoryTableHandler(task_description=identifier, writer=writer)
 
     def save_history(self, history: list[dict[str, t.Any]]) -> None:
         """Save item to storage. Note that score allows many types for easier handling by agent."""
@@ -33,12 +57,76 @@ class LongTermMemoryTableHandler:
             LongTermMemories(
                 task_description=self.task_description,
                 metadata_=json.dumps(history_item),
+                role=history_item.get("role"),
+                original_question=history_item.get("original_question"),
                 datetime_=utcnow(),
             )
             for history_item in history
         ]
 
-        self.sql_handler.save_multiple(history_items)
+        if self.writer is not None:
+            self.writer.submit(self.sql_handler, history_items)
+        else:
+            # Memories are append-only and never read back from the saved objects, so skip the ORM.
+            self.sql_handler.bulk_insert(history_items)
+
+    def _flush_writer(self) -> None:
+        if self.writer is not None:
+            self.writer.flush(raise_error=False)
+
+    @staticmethod
+    def backfill_metadata_columns(
+        batch_size: int = 10_000, sqlalchemy_db_url: str | None = None
+    ) -> int:
+        """
+        Fill the columns copied from the metadata for memories saved before the columns existed, and return the number of processed memories.
+        Only memories with the columns still empty are updated, in batches of `batch_size` ids, so it's safe to re-run or interrupt.
+        """
+        sql_handler = SQLHandler(
+            model=LongTermMemories, sqlalchemy_db_url=sqlalchemy_db_url
+        )
+        id_column = col(LongTermMemories.id)
+        metadata_column = col(LongTermMemories.metadata_)
+        not_backfilled = [
+            *(
+                col(getattr(LongTermMemories, column)).is_(None)
+                for column in METADATA_COLUMNS
+            ),
+            metadata_column.is_not(None),
+        ]
+        n_updated, last_id = 0, -1
+        with sql_handler.db_manager.get_connection() as connection:
+            while True:
+                # Memories without a role in their metadata stay empty, so batches are bounded by ids, not by the emptiness alone.
+                ids = (
+                    connection.execute(
+                        select(id_column)
+                        .where(*not_backfilled, id_column > last_id)
+                        .order_by(id_column)
+                        .limit(batch_size)
+                    )
+                    .scalars()
+                    .all()
+                )
+                if not ids:
+                    break
+                connection.execute(
+                    update(LongTermMemories)
+                    .where(*not_backfilled, id_column.in_(ids))
+                    .values(
+                        {
+                            column: _metadata_field(column, connection.dialect.name)
+                            for column in METADATA_COLUMNS
+                        }
+                    )
+                )
+                connection.commit()
+                n_updated += len(ids)
+                last_id = check_not_none(ids[-1])
+        if n_updated:
+            # The filters fall back to the metadata for empty columns, so the counts shouldn't change, but don't rely on it.
+            sql_handler.clear_count_cache()
+        return n_updated
 
     def save_answer_with_scenario(
         self, answer_with_scenario: AnswerWithScenario
@@ -46,7 +134,11 @@ class LongTermMemoryTableHandler:
         return self.save_history([answer_with_scenario.model_dump()])
 
     def _get_query_filters(
-        self, from_: DatetimeUTC | None, to_: DatetimeUTC | None
+        self,
+        from_: DatetimeUTC | None,
+        to_: DatetimeUTC | None,
+        exclude_role: str | None = None,
+        original_questions: t.Collection[str] | None = None,
     ) -> list[ColumnElement[bool]]:
         query_filters = [
             col(LongTermMemories.task_description) == self.task_description
@@ -55,6 +147,33 @@ class LongTermMemoryTableHandler:
             query_filters.append(col(LongTermMemories.datetime_) >= from_)
         if to_ is not None:
             query_filters.append(col(LongTermMemories.datetime_) <= to_)
+        # Memories saved before the metadata columns existed have them empty until `backfill_metadata_columns` runs,
+        # so their metadata is checked instead.
+        if exclude_role is not None:
+            role = col(LongTermMemories.role)
+            metadata_role = _metadata_field("role", self.sql_handler.dialect_name)
+            query_filters.append(
+                or_(
+                    role != exclude_role,
+                    and_(
+                        role.is_(None),
+                        or_(metadata_role.is_(None), metadata_role != exclude_role),
+                    ),
+                )
+            )
+        if original_questions is not None:
+            original_question = col(LongTermMemories.original_question)
+            query_filters.append(
+                or_(
+                    original_question.in_(original_questions),
+                    and_(
+                        original_question.is_(None),
+                        _metadata_field(
+                            "original_question", self.sql_handler.dialect_name
+                        ).in_(original_questions),
+                    ),
+                )
+            )
         return query_filters
 
     def search(
@@ -63,18 +182,391 @@ class LongTermMemoryTableHandler:
         to_: DatetimeUTC | None = None,
         offset: int = 0,
         limit: int | None = None,
+        after: KeysetCursor | None = None,
+        exclude_role: str | None = None,
+        original_questions: t.Collection[str] | None = None,
     ) -> list[LongTermMemories]:
         """Searches the LongTermMemoryTableHandler for entries within a specified datetime range that match
-        self.task_description."""
-        query_filters = self._get_query_filters(from_, to_)
-        return self.sql_handler.get_with_filter_and_order(
+        self.task_description. If `after` is given, only entries older than the cursor are returned, see `search_page`.
+        `exclude_role` and `original_questions` filter on the respective fields of the saved metadata.
+        Archived entries (see `archive`) are included as well, if the datetime range reaches into the archive.
+        """
+        if after is not None:
+            if offset:
+                raise ValueError("Use either `offset` or `after`, not both.")
+            return self.search_page(
+                from_=from_,
+                to_=to_,
+                limit=limit,
+                after=after,
+                exclude_role=exclude_role,
+                original_questions=original_questions,
+            )[0]
+
+        self._flush_writer()
+        query_filters = self._get_query_filters(
+            from_, to_, exclude_role, original_questions
+        )
+        n_needed = None if limit is None else offset + limit
+        memories: list[LongTermMemories] = self.sql_handler.get_with_filter_and_order(
             query_filters=query_filters,
             order_by_column_name=LongTermMemories.datetime_.key,  # type: ignore[attr-defined]
             order_desc=True,
-            offset=offset,
+            # Offset is applied only after merging with the archived memories, if they are needed.
+            limit=n_needed,
+        )
+        # Archived memories are older than the ones in the table, so they are needed only if the table doesn't have enough of them,
+        # and the datetime range reaches before the oldest of them.
+        if (n_needed is not None and len(memories) >= n_needed) or (
+            memories and from_ is not None and from_ >= memories[-1].datetime_
+        ):
+            return memories[offset:]
+
+        memories.extend(
+            islice(
+                self._iter_archive(
+                    from_, to_, exclude_role, original_questions, order_desc=True
+                ),
+                None if n_needed is None else n_needed - len(memories),
+            )
+        )
+        return memories[offset:]
+
+    def _iter_archive(
+        self,
+        from_: DatetimeUTC | None,
+        to_: DatetimeUTC | None,
+        exclude_role: str | None,
+        original_questions: t.Collection[str] | None,
+        order_desc: bool,
+    ) -> t.Iterator[LongTermMemories]:
+        """Same filtering as `_get_query_filters`, but over the archive, see `_iter_archived`."""
+        return (
+            memory
+            for memory in _iter_archived(
+                self.archive_sql_handler,
+                [self.task_description],
+                from_,
+                to_,
+                order_desc=order_desc,
+            )
+            if (
+                exclude_role is None
+                or (role := _get_metadata_value(memory, "role")) is None
+                or role != exclude_role
+            )
+            and (
+                original_questions is None
+                or _get_metadata_value(memory, "original_question")
+                in original_questions
+            )
+        )
+
+    def archive(self, older_than: DatetimeUTC, batch_size: int = 10_000) -> int:
+        """
+        Moves the memories saved before `older_than` out of `long_term_memories` into the archive, see `LongTermMemoriesArchive`.
+        Memories are appended to the archive of their month, if it already exists. Returns the number of archived memories.
+        Memories are moved in batches of `batch_size`, each in its own transaction, to bound the memory used and the time rows are locked.
+        """
+        self._flush_writer()
+        n_archived = 0
+        while n_archived_in_batch := self._archive_batch(older_than, batch_size):
+            n_archived += n_archived_in_batch
+        if n_archived:
+            self.sql_handler.clear_count_cache()
+        return n_archived
+
+    def _archive_batch(self, older_than: DatetimeUTC, batch_size: int) -> int:
+        with self.sql_handler.db_manager.get_session() as session:
+            # Memories locked by a concurrent run are skipped, so that no memory is archived twice.
+            memories = session.exec(
+                select(LongTermMemories)
+                .where(
+                    col(LongTermMemories.task_description) == self.task_description,
+                    col(LongTermMemories.datetime_) < older_than,
+                )
+                .order_by(col(LongTermMemories.datetime_), col(LongTermMemories.id))
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if not memories:
+                return 0
+
+            for month, memories_in_month_iter in groupby(
+                memories, key=lambda m: _month_start(m.datetime_)
+            ):
+                memories_in_month = list(memories_in_month_iter)
+                archive = self._lock_archive(
+                    session, month, memories_in_month[0].datetime_
+                )
+                archived = _decompress_memories(archive.data) + memories_in_month
+                archived.sort(key=lambda m: (m.datetime_, m.id))
+                archive.from_datetime = archived[0].datetime_
+                archive.to_datetime = archived[-1].datetime_
+                archive.n_memories = len(archived)
+                archive.data = _compress_memories(archived)
+                session.add(archive)
+
+            session.exec(
+                delete(LongTermMemories).where(
+                    col(LongTermMemories.id).in_([m.id for m in memories])
+                )
+            )
+            session.commit()
+        return len(memories)
+
+    def _lock_archive(
+        self, session: Session, month: DatetimeUTC, first_datetime: DatetimeUTC
+    ) -> LongTermMemoriesArchive:
+        """Returns the archive of the month, created empty if it doesn't exist yet, locked until the end of the transaction."""
+        table: Table = LongTermMemoriesArchive.__table__  # type: ignore[attr-defined]
+        insert = (
+            postgresql.insert(table)
+            if self.sql_handler.dialect_name == "postgresql"
+            else sqlite.insert(table)
+        )
+        # Upsert, because a concurrent run can be creating the same archive.
+        session.execute(
+            insert.values(
+                task_description=self.task_description,
+                month=month,
+                from_datetime=first_datetime,
+                to_datetime=first_datetime,
+                n_memories=0,
+                data=_compress_memories([]),
+            ).on_conflict_do_nothing(
+                index_elements=[table.c.task_description, table.c.month]
+            )
+        )
+        return session.exec(
+            select(LongTermMemoriesArchive)
+            .where(
+                col(LongTermMemoriesArchive.task_description) == self.task_description,
+                col(LongTermMemoriesArchive.month) == month,
+            )
+            .with_for_update()
+        ).one()
+
+    def iter_search(
+        self,
+        from_: DatetimeUTC | None = None,
+        to_: DatetimeUTC | None = None,
+        order_desc: bool = True,
+        exclude_role: str | None = None,
+        original_questions: t.Collection[str] | None = None,
+    ) -> t.Iterator[LongTermMemories]:
+        """
+        Same as `search` without limit, but streams the memories instead of loading all of them at once.
+        Archived memories are streamed after (or before, in ascending order) the ones in the table, as they are older.
+        """
+        self._flush_writer()
+        query_filters = self._get_query_filters(
+            from_, to_, exclude_role, original_questions
+        )
+        memories: t.Iterator[LongTermMemories] = self.sql_handler.iter_with_filter(
+            query_filters=query_filters,
+            order_by_column_name=LongTermMemories.datetime_.key,  # type: ignore[attr-defined]
+            order_desc=order_desc,
+        )
+        archived = self._iter_archive(
+            from_, to_, exclude_role, original_questions, order_desc=order_desc
+        )
+        return chain(memories, archived) if order_desc else chain(archived, memories)
+
+    def iter_after_id(self, after_id: int | None) -> t.Iterator[LongTermMemories]:
+        """Streams the memories with id greater than `after_id` (all of them if it's None), in the order they were saved."""
+        self._flush_writer()
+        query_filters = self._get_query_filters(from_=None, to_=None)
+        if after_id is not None:
+            query_filters.append(col(LongTermMemories.id) > after_id)
+        return self.sql_handler.iter_with_filter(
+            query_filters=query_filters,
+            order_by_column_name=LongTermMemories.id.key,  # type: ignore[union-attr]
+            order_desc=False,
+        )
+
+    def search_page(
+        self,
+        limit: int | None,
+        after: KeysetCursor | None = None,
+        from_: DatetimeUTC | None = None,
+        to_: DatetimeUTC | None = None,
+        order_desc: bool = True,
+        exclude_role: str | None = None,
+        original_questions: t.Collection[str] | None = None,
+    ) -> tuple[list[LongTermMemories], KeysetCursor | None]:
+        """
+        Seek-based pagination over the memories, returns the page and the cursor of the next page (or None if it was the last one).
+        Only the memories in the table are paginated, the archived ones (see `archive`) are not included.
+        """
+        self._flush_writer()
+        query_filters = self._get_query_filters(
+            from_, to_, exclude_role, original_questions
+        )
+        return self.sql_handler.get_page_with_filter_and_order(
+            query_filters=query_filters,
+            order_by_column_name=LongTermMemories.datetime_.key,  # type: ignore[attr-defined]
+            order_desc=order_desc,
+            after=after,
             limit=limit,
         )
 
-    def count(self) -> int:
-        query_filters = self._get_query_filters(None, None)
-        return self.sql_handler.count(query_filters=query_filters)
+    @staticmethod
+    def search_many(
+        task_descriptions: t.Sequence[str],
+        from_: DatetimeUTC | None = None,
+        to_: DatetimeUTC | None = None,
+        sqlalchemy_db_url: str | None = None,
+    ) -> dict[str, list[LongTermMemories]]:
+        """
+        Same as `search`, but for many task descriptions at once, using a single query (and one more for the archive).
+        Returns the memories grouped by task description, in the order of `task_descriptions`.
+        """
+        sql_handler = SQLHandler(
+            model=LongTermMemories, sqlalchemy_db_url=sqlalchemy_db_url
+        )
+        query_filters: list[ColumnElement[bool]] = [
+            col(LongTermMemories.task_description).in_(task_descriptions)
+        ]
+        if from_ is not None:
+            query_filters.append(col(LongTermMemories.datetime_) >= from_)
+        if to_ is not None:
+            query_filters.append(col(LongTermMemories.datetime_) <= to_)
+
+        memories: dict[str, list[LongTermMemories]] = {
+            task_description: [] for task_description in task_descriptions
+        }
+        memory: LongTermMemories
+        for memory in sql_handler.iter_with_filter(
+            query_filters=query_filters,
+            order_by_column_name=LongTermMemories.datetime_.key,  # type: ignore[attr-defined]
+            order_desc=True,
+        ):
+            memories[memory.task_description].append(memory)
+        for memory in _iter_archived(
+            SQLHandler(
+                model=LongTermMemoriesArchive, sqlalchemy_db_url=sqlalchemy_db_url
+            ),
+            task_descriptions,
+            from_,
+            to_,
+            order_desc=True,
+        ):
+            memories[memory.task_description].append(memory)
+        return memories
+
+    @staticmethod
+    def get_cursor(memory: LongTermMemories) -> KeysetCursor:
+        return KeysetCursor.from_item(memory, LongTermMemories.datetime_.key)  # type: ignore[attr-defined]
+
+    @staticmethod
+    def get_task_descriptions(sqlalchemy_db_url: str | None = None) -> list[str]:
+        sql_handler = SQLHandler(
+            model=LongTermMemories, sqlalchemy_db_url=sqlalchemy_db_url
+        )
+        with sql_handler.db_manager.get_session() as session:
+            return list(
+                session.exec(select(LongTermMemories.task_description).distinct()).all()
+            )
+
+    def count(
+        self, exclude_role: str | None = None, max_age_seconds: float | None = None
+    ) -> int:
+        """Number of the memories that are not archived, exact unless cached for `max_age_seconds`, see `SQLHandler.count`."""
+        self._flush_writer()
+        query_filters = self._get_query_filters(None, None, exclude_role)
+        # Memories are removed from this table only by `archive`, possibly in another process (see `scripts/archive_long_term_memories.py`),
+        # which always increases the number of archived memories, so it tells when the cached counts are outdated.
+        return self.sql_handler.count(
+            query_filters=query_filters,
+            max_age_seconds=max_age_seconds,
+            version=self._count_archived() if max_age_seconds is not None else None,
+        )
+
+    def _count_archived(self) -> int:
+        with self.archive_sql_handler.db_manager.get_session() as session:
+            n_archived = session.exec(
+                select(func.sum(LongTermMemoriesArchive.n_memories)).where(
+                    col(LongTermMemoriesArchive.task_description)
+                    == self.task_description
+                )
+            ).one()
+        return n_archived or 0
+
+
+def _iter_archived(
+    archive_sql_handler: SQLHandler,
+    task_descriptions: t.Sequence[str],
+    from_: DatetimeUTC | None,
+    to_: DatetimeUTC | None,
+    order_desc: bool,
+) -> t.Iterator[LongTermMemories]:
+    """
+    Archived memories of the task descriptions within the datetime range, ordered by datetime within each task description.
+    Archives are selected by their month first, and decompressed one by one only as the memories are consumed.
+    """
+    query_filters: list[ColumnElement[bool]] = [
+        col(LongTermMemoriesArchive.task_description).in_(task_descriptions)
+    ]
+    if from_ is not None:
+        query_filters.append(col(LongTermMemoriesArchive.month) >= _month_start(from_))
+        query_filters.append(col(LongTermMemoriesArchive.to_datetime) >= from_)
+    if to_ is not None:
+        query_filters.append(col(LongTermMemoriesArchive.month) <= to_)
+        query_filters.append(col(LongTermMemoriesArchive.from_datetime) <= to_)
+
+    archive: LongTermMemoriesArchive
+    for archive in archive_sql_handler.iter_with_filter(
+        query_filters=query_filters,
+        order_by_column_name=LongTermMemoriesArchive.month.key,  # type: ignore[attr-defined]
+        order_desc=order_desc,
+        # Archives are large, fetch them one at a time.
+        batch_size=1,
+    ):
+        memories = [
+            memory
+            for memory in _decompress_memories(archive.data)
+            if (from_ is None or memory.datetime_ >= from_)
+            and (to_ is None or memory.datetime_ <= to_)
+        ]
+        if order_desc:
+            memories.reverse()
+        yield from memories
+
+
+def _month_start(datetime_: DatetimeUTC) -> DatetimeUTC:
+    return DatetimeUTC(datetime_.year, datetime_.month, 1)
+
+
+def _metadata_field(field: str, dialect_name: str) -> ColumnElement[str]:
+    metadata_column = col(LongTermMemories.metadata_)
+    # Metadata is stored as a text, so it needs to be parsed as JSON first.
+    metadata = (
+        cast(metadata_column, JSONB)
+        if dialect_name == "postgresql"
+        else type_coerce(metadata_column, JSON)
+    )
+    field_value: ColumnElement[str] = metadata[field].as_string()
+    return field_value
+
+
+def _get_metadata_value(memory: LongTermMemories, field: str) -> t.Any:
+    """Value of the column copied from the metadata, or from the metadata itself for memories saved before the column existed."""
+    value = getattr(memory, field)
+    if value is None and memory.metadata_dict is not None:
+        value = memory.metadata_dict.get(field)
+    return value
+
+
+def _compress_memories(memories: t.Sequence[LongTermMemories]) -> bytes:
+    return zlib.compress(
+        json.dumps([memory.model_dump(mode="json") for memory in memories]).encode(),
+        level=zlib.Z_BEST_COMPRESSION,
+    )
+
+
+def _decompress_memories(data: bytes) -> list[LongTermMemories]:
+    return [
+        LongTermMemories.model_validate(memory)
+        for memory in json.loads(zlib.decompress(data).decode())
+    ]
@@ -0,0 +1,69 @@
+from itertools import islice
+from pathlib import Path
+
+from langchain_core.embeddings import Embeddings
+from prediction_market_agent_tooling.loggers import logger
+from prediction_market_agent_tooling.tools.utils import check_not_none
+
+from prediction_market_agent.db.local_vector_store import LocalVectorStore
+from prediction_market_agent.db.long_term_memory_table_handler import (
+    LongTermMemories,
+    LongTermMemoryTableHandler,
+)
+from prediction_market_agent.utils import DBKeys
+
+
+class LongTermMemoryVectorIndex:
+    """
+    Persistent vector index of an agent's long-term memories, stored as a `LocalVectorStore` in a directory per agent.
+
+    Memories are indexed under their id, and as they are append-only, `update` only needs to embed the memories
+    saved after the highest indexed id.
+    """
+
+    add_texts_batch_size = 1000
+
+    def __init__(
+        self,
+        long_term_memory: LongTermMemoryTableHandler,
+        embeddings: Embeddings,
+        path: str | Path | None = None,
+    ) -> None:
+        self.long_term_memory = long_term_memory
+        self.store = LocalVectorStore(
+            embedding=embeddings,
+            path=Path(path or DBKeys().MEMORY_VECTOR_INDEX_PATH)
+            / long_term_memory.task_description,
+        )
+
+    @property
+    def last_indexed_id(self) -> int | None:
+        return max((int(id) for id in self.store.ids), default=None)
+
+    def update(self) -> int:
+        """Indexes the memories saved since the last update, and returns how many there were."""
+        # Streamed in batches, instead of loading all of them at once on the first update.
+        new_memories = self.long_term_memory.iter_after_id(self.last_indexed_id)
+        n_indexed = 0
+        while memories_batch := list(islice(new_memories, self.add_texts_batch_size)):
+            self.store.add_texts(
+                texts=[
+                    f"From: {check_not_none(x.metadata_dict)['role']} Content: {check_not_none(x.metadata_dict)['content']}"
+                    for x in memories_batch
+                ],
+                metadatas=[{"json": x.model_dump_json()} for x in memories_batch],
+                ids=[str(check_not_none(x.id)) for x in memories_batch],
+            )
+            n_indexed += len(memories_batch)
+        logger.info(
+            f"Indexed {n_indexed} new memories of {self.long_term_memory.task_description}, {len(self.store)} in total."
+        )
+        return n_indexed
+
+    def search(self, query: str, k: int) -> list[LongTermMemories]:
+        """Updates the index and returns the `k` memories most similar to the `query`."""
+        self.update()
+        return [
+            LongTermMemories.model_validate_json(document.metadata["json"])
+            for document in self.store.similarity_search(query, k=k)
+        ]
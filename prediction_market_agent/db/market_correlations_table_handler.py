@@ -0,0 +1,113 @@
+import hashlib
+import typing as t
+from datetime import timedelta
+
+from prediction_market_agent_tooling.tools.utils import check_not_none, utcnow
+from sqlalchemy import Table
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import col
+
+from prediction_market_agent.agents.arbitrage_agent.data_models import Correlation
+from prediction_market_agent.db.models import MarketCorrelation
+from prediction_market_agent.db.sql_handler import SQLHandler
+
+
+class MarketCorrelationsTableHandler:
+    """Cache of correlations between pairs of market questions, so that the same pair doesn't need to be scored by an LLM again."""
+
+    def __init__(self, sqlalchemy_db_url: str | None = None):
+        self.sql_handler = SQLHandler(
+            model=MarketCorrelation, sqlalchemy_db_url=sqlalchemy_db_url
+        )
+
+    @staticmethod
+    def get_question_hash(question: str) -> str:
+        return hashlib.sha256(" ".join(question.lower().split()).encode()).hexdigest()
+
+    @staticmethod
+    def get_pair_key(question: str, other_question: str) -> str:
+        # Correlation is symmetric, so the pair is unordered.
+        question_hashes = sorted(
+            MarketCorrelationsTableHandler.get_question_hash(q)
+            for q in (question, other_question)
+        )
+        return hashlib.sha256(":".join(question_hashes).encode()).hexdigest()
+
+    def get_correlations(
+        self, question_pairs: t.Sequence[tuple[str, str]], max_age: timedelta
+    ) -> list[Correlation | None]:
+        """Returns the saved correlation of each of the pairs, or None if it's missing or older than `max_age`."""
+        pair_keys = [self.get_pair_key(*pair) for pair in question_pairs]
+        rows: list[MarketCorrelation] = self.sql_handler.get_with_filter_and_order(
+            query_filters=[
+                col(MarketCorrelation.pair_key).in_(set(pair_keys)),
+                col(MarketCorrelation.created_at) >= utcnow() - max_age,
+            ]
+        )
+        correlations = {
+            row.pair_key: Correlation(
+                near_perfect_correlation=row.near_perfect_correlation,
+                reasoning=row.reasoning,
+            )
+            for row in rows
+        }
+        return [correlations.get(pair_key) for pair_key in pair_keys]
+
+    def get_correlation_edges(self, max_age: timedelta) -> list[tuple[str, str, bool]]:
+        """Returns the question hashes and the sign of all the near-perfect correlations that aren't older than `max_age`."""
+        rows: list[MarketCorrelation] = self.sql_handler.get_with_filter_and_order(
+            query_filters=[
+                col(MarketCorrelation.question_hash).is_not(None),
+                col(MarketCorrelation.other_question_hash).is_not(None),
+                col(MarketCorrelation.near_perfect_correlation).is_not(None),
+                col(MarketCorrelation.created_at) >= utcnow() - max_age,
+            ]
+        )
+        return [
+            (
+                check_not_none(row.question_hash),
+                check_not_none(row.other_question_hash),
+                check_not_none(row.near_perfect_correlation),
+            )
+            for row in rows
+        ]
+
+    def save_correlations(
+        self, correlations: t.Sequence[tuple[str, str, Correlation]]
+    ) -> None:
+        """Saves correlations of the pairs of questions, replacing the previously saved ones, also if another process saved them in the meantime."""
+        if not correlations:
+            return
+        rows: dict[str, dict[str, t.Any]] = {}
+        for question, other_question, correlation in correlations:
+            question_hash, other_question_hash = sorted(
+                self.get_question_hash(q) for q in (question, other_question)
+            )
+            pair_key = self.get_pair_key(question, other_question)
+            rows[pair_key] = {
+                "pair_key": pair_key,
+                "question_hash": question_hash,
+                "other_question_hash": other_question_hash,
+                "near_perfect_correlation": correlation.near_perfect_correlation,
+                "reasoning": correlation.reasoning,
+                "created_at": utcnow(),
+            }
+        table: Table = MarketCorrelation.__table__  # type: ignore[attr-defined]
+        with self.sql_handler.db_manager.get_connection() as connection:
+            insert = (
+                postgresql.insert(table)
+                if connection.dialect.name == "postgresql"
+                else sqlite.insert(table)
+            )
+            connection.execute(
+                insert.on_conflict_do_update(
+                    index_elements=[table.c.pair_key],
+                    set_={
+                        column.name: insert.excluded[column.name]
+                        for column in table.columns
+                        if not column.primary_key
+                    },
+                ),
+                list(rows.values()),
+            )
+            connection.commit()
@@ -8,7 +8,7 @@ from prediction_market_agent_tooling.tools.datetime_utc import (
     DatetimeUTC,
     DatetimeUTCType,
 )
-from sqlalchemy import Column, Numeric
+from sqlalchemy import Column, Index, LargeBinary, Numeric
 from sqlmodel import Field, SQLModel
 
 from prediction_market_agent.agents.microchain_agent.nft_treasury_game.game_history import (
@@ -18,10 +18,27 @@ from prediction_market_agent.agents.microchain_agent.nft_treasury_game.game_hist
 
 class LongTermMemories(SQLModel, table=True):
     __tablename__ = "long_term_memories"
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = (
+        # Memories are always queried per agent and ordered by time, the id breaks ties for keyset pagination.
+        Index(
+            "ix_long_term_memories_task_description_datetime_id",
+            "task_description",
+            "datetime_",
+            "id",
+        ),
+        Index(
+            "ix_long_term_memories_task_description_original_question",
+            "task_description",
+            "original_question",
+        ),
+        {"extend_existing": True},
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     task_description: str
     metadata_: Optional[str] = None
+    # Copied from the JSON in `metadata_` when saving, so that memories can be filtered by them in the database.
+    role: Optional[str] = None
+    original_question: Optional[str] = None
     datetime_: DatetimeUTC = Field(sa_type=DatetimeUTCType)
 
     @cached_property
@@ -38,13 +55,43 @@ class LongTermMemories(SQLModel, table=True):
             raise e
 
 
+class LongTermMemoriesArchive(SQLModel, table=True):
+    """
+    Memories moved out of `long_term_memories` once they are older than the retention horizon.
+    There is one row per task description and month, holding all its memories as a compressed JSON list.
+    """
+
+    __tablename__ = "long_term_memories_archive"
+    __table_args__ = (
+        Index(
+            "ix_long_term_memories_archive_task_description_month",
+            "task_description",
+            "month",
+            unique=True,
+        ),
+        {"extend_existing": True},
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    task_description: str
+    # First moment of the month the memories were saved in.
+    month: DatetimeUTC = Field(sa_type=DatetimeUTCType)
+    # Datetime range of the archived memories, so that the data doesn't need to be decompressed to know if it's needed.
+    from_datetime: DatetimeUTC = Field(sa_type=DatetimeUTCType)
+    to_datetime: DatetimeUTC = Field(sa_type=DatetimeUTCType)
+    n_memories: int
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+
+
 class Prompt(SQLModel, table=True):
     """Checkpoint for general agent's prompts, as a way to restore its past progress."""
 
     __tablename__ = "prompts"
-    __table_args__ = {
-        "extend_existing": True
-    }  # required if initializing an existing table
+    __table_args__ = (
+        Index(
+            "ix_prompts_session_identifier_datetime", "session_identifier", "datetime_"
+        ),
+        {"extend_existing": True},  # required if initializing an existing table
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     prompt: str
     # This allows for future distinction between user sessions, if prompts from a specific
@@ -60,7 +107,10 @@ class EvaluatedGoalModel(SQLModel, table=True):
     """
 
     __tablename__ = "evaluated_goals"
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = (
+        Index("ix_evaluated_goals_agent_id_datetime", "agent_id", "datetime_"),
+        {"extend_existing": True},
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     agent_id: str  # Per-agent identifier
     goal: str
@@ -137,3 +187,49 @@ class ReplicatedMarket(SQLModel, table=True):
     )  # We don't replicate the parent market, not even across multiple platforms.
     copied_market_title: str = Field(nullable=False)
     created_at: DatetimeUTC = Field(sa_type=DatetimeUTCType)
+
+
+class PineconeSyncWatermark(SQLModel, table=True):
+    """
+    Creation time of the newest market inserted into a Pinecone index, so that the next sync fetches only the markets created after it.
+    Similarly, time of the last refresh of the markets' state in the index, see `PineconeHandler.refresh_market_states`.
+    """
+
+    __tablename__ = "pinecone_sync_watermark"
+    __table_args__ = {
+        "extend_existing": True,
+    }
+    index_name: str = Field(primary_key=True)
+    last_created_at: DatetimeUTC = Field(sa_type=DatetimeUTCType)
+    last_state_refresh_at: Optional[DatetimeUTC] = Field(
+        default=None, sa_type=DatetimeUTCType
+    )
+
+
+class MarketCorrelation(SQLModel, table=True):
+    """Correlation between two markets as calculated by the arbitrage agent, see `MarketCorrelationsTableHandler`."""
+
+    __tablename__ = "market_correlations"
+    __table_args__ = {
+        "extend_existing": True,
+    }
+    # Same for both orderings of the markets, see `MarketCorrelationsTableHandler.get_pair_key`.
+    pair_key: str = Field(primary_key=True)
+    # Hashes of the two questions in sorted order, to build the graph of correlations (see `CorrelationGraph`).
+    # Missing for correlations saved before they were stored.
+    question_hash: Optional[str] = None
+    other_question_hash: Optional[str] = None
+    near_perfect_correlation: Optional[bool] = None
+    reasoning: str
+    created_at: DatetimeUTC = Field(sa_type=DatetimeUTCType)
+
+
+class RecentlyTradedMarket(SQLModel, table=True):
+    """Last time the arbitrage agent traded in a market, see `SQLRecentlyTradedMarkets`."""
+
+    __tablename__ = "recently_traded_markets"
+    __table_args__ = {
+        "extend_existing": True,
+    }
+    market_id: str = Field(primary_key=True)
+    traded_at: DatetimeUTC = Field(sa_type=DatetimeUTCType)
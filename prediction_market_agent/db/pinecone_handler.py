@@ -1,6 +1,8 @@
 import hashlib
 import sys
 import typing as t
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from typing import Optional
 
 from langchain_core.vectorstores import VectorStore
@@ -15,14 +17,25 @@ from prediction_market_agent_tooling.markets.omen.omen_subgraph_handler import (
     OmenSubgraphHandler,
 )
 from prediction_market_agent_tooling.tools.datetime_utc import DatetimeUTC
+from prediction_market_agent_tooling.tools.utils import check_not_none, utcnow
+from sqlmodel import col
 from tqdm import tqdm
 
 from prediction_market_agent.agents.think_thoroughly_agent.models import (
     PineconeMetadata,
 )
-from prediction_market_agent.utils import APIKeys
+from prediction_market_agent.db.embedding_cache import CachedEmbeddings
+from prediction_market_agent.db.local_vector_store import (
+    LocalVectorStore,
+    VectorCompression,
+)
+from prediction_market_agent.db.models import PineconeSyncWatermark
+from prediction_market_agent.db.sql_handler import SQLHandler
+from prediction_market_agent.utils import APIKeys, DBKeys
 
 INDEX_NAME = "omen-index-text-embeddings-3-large"
+# Markets created shortly before the watermark are synced again, in case the subgraph indexed some of them late.
+SYNC_WATERMARK_OVERLAP = timedelta(hours=1)
 T = t.TypeVar("T")
 
 
@@ -30,16 +43,32 @@ class PineconeHandler:
     vectorstore: VectorStore
     pc: Pinecone
     index: Index
+    max_concurrent_queries = 10
 
-    def __init__(self, model: str = "text-embedding-3-large") -> None:
+    def __init__(
+        self,
+        model: str = "text-embedding-3-large",
+        sqlalchemy_db_url: str | None = None,
+        local_index_path: str | None = None,
+    ) -> None:
+        """If `local_index_path` (or `LOCAL_VECTOR_INDEX_PATH` in the environment) is set, the index is kept locally instead of in Pinecone."""
         self.keys = APIKeys()
+        self.db_keys = DBKeys()
         self.model = model
-        self.embeddings = OpenAIEmbeddings(
-            openai_api_key=self.keys.openai_api_key,
+        self.sqlalchemy_db_url = sqlalchemy_db_url
+        self.local_index_path = local_index_path or self.db_keys.LOCAL_VECTOR_INDEX_PATH
+        self.embeddings = CachedEmbeddings(
+            OpenAIEmbeddings(
+                openai_api_key=self.keys.openai_api_key,
+                model=model,
+            ),
             model=model,
         )
-        self.build_pinecone()
-        self.build_vectorstore()
+        if self.local_index_path is not None:
+            self.build_local_vectorstore(self.local_index_path)
+        else:
+            self.build_pinecone()
+            self.build_vectorstore()
 
     def build_pinecone(self) -> None:
         self.pc = Pinecone(api_key=self.keys.pinecone_api_key.get_secret_value())
@@ -61,6 +90,22 @@ class PineconeHandler:
             index_name=INDEX_NAME,
         )
 
+    def build_local_vectorstore(self, path: str) -> None:
+        self.vectorstore = LocalVectorStore(
+            embedding=self.embeddings,
+            path=path,
+            use_hnsw=self.db_keys.LOCAL_VECTOR_INDEX_USE_HNSW,
+            compression=(
+                VectorCompression(
+                    dimension=self.db_keys.LOCAL_VECTOR_INDEX_SEARCH_DIMENSION,
+                    quantization=self.db_keys.LOCAL_VECTOR_INDEX_QUANTIZATION,
+                )
+                if self.db_keys.LOCAL_VECTOR_INDEX_SEARCH_DIMENSION is not None
+                or self.db_keys.LOCAL_VECTOR_INDEX_QUANTIZATION is not None
+                else None
+            ),
+        )
+
     def encode_text(self, text: str) -> str:
         """Encodes string using sha-256 and returns it as string"""
         # We use SHA-256 for generating IDs with fixed length.
@@ -71,23 +116,88 @@ class PineconeHandler:
     ) -> list[OmenMarket]:
         """
         This function filters out markets based on the market_title attribute of each market.
-        It derives the ID of each market by encoding the market_title using base64 and
+        It derives the ID of each market by encoding the market_title using sha-256 and
         then checks for the existence of these IDs in the index.
 
         The function then returns a list of markets that are not present in the index.
 
         """
         ids_market_map = {self.encode_text(m.question_title): m for m in markets}
-        all_ids = list(ids_market_map.keys())
-        ids_in_vec_db = self.get_existing_ids_in_index()
-        missing_ids = set(all_ids).difference(ids_in_vec_db)
-        filtered_markets = [ids_market_map[id] for id in missing_ids]
+        ids_in_vec_db = self.get_existing_ids_in_index(list(ids_market_map.keys()))
+        filtered_markets = [
+            market for id, market in ids_market_map.items() if id not in ids_in_vec_db
+        ]
         return filtered_markets
 
-    def get_existing_ids_in_index(self) -> list[str]:
-        # index.list() returns [[id1,id2,...],[id4,id5,...]], hence the flattening.
-        ids_in_vec_db = [y for x in self.index.list() for y in x]
-        return ids_in_vec_db
+    def get_existing_ids_in_index(self, ids: list[str]) -> set[str]:
+        """Returns those of `ids` that are in the index, by fetching only them instead of listing the whole index."""
+        return set(self.get_metadata_in_index(ids))
+
+    def get_metadata_in_index(self, ids: list[str]) -> dict[str, dict[str, t.Any]]:
+        """Returns metadata of those of `ids` that are in the index."""
+        if isinstance(self.vectorstore, LocalVectorStore):
+            return {
+                t.cast(str, document.id): document.metadata
+                for document in self.vectorstore.get_by_ids(ids)
+            }
+
+        metadata_in_vec_db: dict[str, dict[str, t.Any]] = {}
+        for ids_chunk in self.chunks(ids, 100):
+            for id, vector in self.index.fetch(ids=ids_chunk).vectors.items():
+                metadata_in_vec_db[id] = vector.metadata or {}
+        return metadata_in_vec_db
+
+    def update_metadata(self, metadatas: dict[str, dict[str, t.Any]]) -> None:
+        """Sets the given metadata fields of the given ids, without re-embedding their texts."""
+        if isinstance(self.vectorstore, LocalVectorStore):
+            self.vectorstore.update_metadata(metadatas)
+            return
+
+        # Pinecone updates one vector per request.
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_queries) as executor:
+            list(
+                executor.map(
+                    lambda item: self.index.update(id=item[0], set_metadata=item[1]),
+                    metadatas.items(),
+                )
+            )
+
+    def get_sync_watermark(self) -> DatetimeUTC | None:
+        watermark = self._get_sync_watermark_row()
+        return watermark.last_created_at if watermark is not None else None
+
+    def save_sync_watermark(self, last_created_at: DatetimeUTC) -> None:
+        watermark = self._get_sync_watermark_row() or PineconeSyncWatermark(
+            index_name=INDEX_NAME, last_created_at=last_created_at
+        )
+        watermark.last_created_at = last_created_at
+        self._sync_watermark_sql_handler().save_multiple([watermark])
+
+    def get_state_refresh_watermark(self) -> DatetimeUTC | None:
+        watermark = self._get_sync_watermark_row()
+        return watermark.last_state_refresh_at if watermark is not None else None
+
+    def save_state_refresh_watermark(self, last_state_refresh_at: DatetimeUTC) -> None:
+        watermark = check_not_none(
+            self._get_sync_watermark_row(),
+            "Markets need to be inserted into the index before refreshing their state.",
+        )
+        watermark.last_state_refresh_at = last_state_refresh_at
+        self._sync_watermark_sql_handler().save_multiple([watermark])
+
+    def _get_sync_watermark_row(self) -> PineconeSyncWatermark | None:
+        watermarks: list[
+            PineconeSyncWatermark
+        ] = self._sync_watermark_sql_handler().get_with_filter_and_order(
+            query_filters=[col(PineconeSyncWatermark.index_name) == INDEX_NAME]
+        )
+        return watermarks[0] if watermarks else None
+
+    def _sync_watermark_sql_handler(self) -> SQLHandler:
+        # Created on demand, as the database is needed only for syncing the markets.
+        return SQLHandler(
+            model=PineconeSyncWatermark, sqlalchemy_db_url=self.sqlalchemy_db_url
+        )
 
     def insert_texts(
         self,
@@ -124,7 +234,12 @@ class PineconeHandler:
         self, created_after: DatetimeUTC | None = None
     ) -> None:
         """We use the agent's run to add embeddings of new markets that don't exist yet in the
-        vector DB."""
+        vector DB. Unless `created_after` is given, only markets created after the previous sync are fetched.
+        """
+        watermark = self.get_sync_watermark()
+        if created_after is None and watermark is not None:
+            created_after = watermark - SYNC_WATERMARK_OVERLAP
+
         subgraph_handler = OmenSubgraphHandler()
         markets = subgraph_handler.get_omen_markets_simple(
             limit=sys.maxsize,
@@ -142,7 +257,10 @@ class PineconeHandler:
         metadatas = []
         for m in missing_markets:
             texts.append(m.question_title)
-            metadatas.append(PineconeMetadata.from_omen_market(m).model_dump())
+            # Pinecone doesn't accept null values in the metadata.
+            metadatas.append(
+                PineconeMetadata.from_omen_market(m).model_dump(exclude_none=True)
+            )
 
         if texts:
             n_elements = 100
@@ -156,6 +274,59 @@ class PineconeHandler:
                 self.insert_texts(
                     ids=ids_chunk, texts=text_chunk, metadatas=metadata_chunk
                 )
+            if isinstance(self.vectorstore, LocalVectorStore):
+                self.vectorstore.persist()
+
+        if markets:
+            last_created_at = max(m.creation_datetime for m in markets)
+            if watermark is None or last_created_at > watermark:
+                self.save_sync_watermark(last_created_at)
+
+    def refresh_market_states(self) -> int:
+        """
+        Updates the live state (see `PineconeMetadata.STATE_FIELDS`) of the indexed markets that changed since the previous refresh,
+        and returns how many were updated. Changed markets are those traded or closed since then, so liquidity changes without a trade
+        are caught only by the first refresh, which updates all the open markets.
+        """
+        now = utcnow()
+        last_refresh = self.get_state_refresh_watermark()
+        subgraph_handler = OmenSubgraphHandler()
+
+        if last_refresh is None:
+            markets = subgraph_handler.get_omen_markets(
+                limit=None, question_opened_after=now
+            )
+        else:
+            since = last_refresh - SYNC_WATERMARK_OVERLAP
+            # Trades come with the current state of their market, so the traded markets don't need to be fetched again.
+            markets = [
+                trade.fpmm
+                for trade in subgraph_handler.get_trades(start_time=since, end_time=now)
+            ] + subgraph_handler.get_omen_markets(
+                limit=None, question_opened_after=since, question_opened_before=now
+            )
+        markets_by_id = {market.id: market for market in markets}
+
+        ids_markets = [
+            (self.encode_text(market.question_title), market)
+            for market in markets_by_id.values()
+        ]
+        metadata_in_index = self.get_metadata_in_index([id for id, _ in ids_markets])
+        metadatas = {
+            id: PineconeMetadata.from_omen_market(market).model_dump(
+                include=PineconeMetadata.STATE_FIELDS
+            )
+            for id, market in ids_markets
+            # Markets with duplicate titles share the id, keep the state of the market that was indexed.
+            if metadata_in_index.get(id, {}).get("market_address") == market.id
+        }
+        self.update_metadata(metadatas)
+        self.save_state_refresh_watermark(now)
+
+        logger.info(
+            f"Refreshed state of {len(metadatas)} markets out of {len(markets_by_id)} changed ones."
+        )
+        return len(metadatas)
 
     def find_nearest_questions_with_threshold(
         self,
@@ -177,3 +348,51 @@ class PineconeHandler:
             PineconeMetadata.model_validate(doc.metadata)
             for doc, score in documents_and_scores
         ]
+
+    def find_nearest_questions_batch(
+        self,
+        texts: list[str],
+        limit: int,
+        threshold: float = 0.25,
+        filter_on_metadata: dict[str, dict[str, t.Any]] | None = None,
+    ) -> list[list[PineconeMetadata]]:
+        """
+        Same as `find_nearest_questions_with_threshold` for many texts, in the same order as `texts`.
+        All the texts are embedded with a single request, and searched as one matrix product with the local index, or concurrently with Pinecone.
+        """
+        if not texts:
+            return []
+        embeddings = self.embeddings.embed_documents(texts)
+        vectorstore = self.vectorstore
+
+        if isinstance(vectorstore, LocalVectorStore):
+            results = vectorstore.similarity_search_by_vectors_with_score(
+                embeddings, k=limit, filter=filter_on_metadata
+            )
+        elif isinstance(vectorstore, PineconeVectorStore):
+            # Threads instead of `par_map`'s processes, as the requests are I/O bound and the client doesn't need to be pickled.
+            with ThreadPoolExecutor(
+                max_workers=self.max_concurrent_queries
+            ) as executor:
+                results = list(
+                    executor.map(
+                        lambda embedding: vectorstore.similarity_search_by_vector_with_score(
+                            embedding, k=limit, filter=filter_on_metadata
+                        ),
+                        embeddings,
+                    )
+                )
+        else:
+            raise TypeError(
+                f"Batched search is not supported for {type(vectorstore).__name__}."
+            )
+
+        relevance_score_fn = vectorstore._select_relevance_score_fn()
+        return [
+            [
+                PineconeMetadata.model_validate(doc.metadata)
+                for doc, score in documents_and_scores
+                if relevance_score_fn(score) >= threshold
+            ]
+            for documents_and_scores in results
+        ]
@@ -4,6 +4,7 @@ from prediction_market_agent_tooling.tools.utils import utcnow
 from sqlmodel import col
 
 from prediction_market_agent.agents.identifiers import AgentIdentifier
+from prediction_market_agent.db.background_writer import BackgroundWriter
 from prediction_market_agent.db.models import Prompt
 from prediction_market_agent.db.sql_handler import SQLHandler
 
@@ -13,15 +14,19 @@ class PromptTableHandler:
         self,
         session_identifier: str,
         sqlalchemy_db_url: str | None = None,
+        writer: BackgroundWriter | None = None,
     ):
+        """If `writer` is given, prompts are saved in the background, and flushed before any read to not miss them."""
         self.session_identifier = session_identifier
         self.sql_handler = SQLHandler(model=Prompt, sqlalchemy_db_url=sqlalchemy_db_url)
+        self.writer = writer
 
     @staticmethod
     def from_agent_identifier(
         identifier: AgentIdentifier,
+        writer: BackgroundWriter | None = None,
     ) -> "PromptTableHandler":
-        return PromptTableHandler(session_identifier=identifier)
+        return PromptTableHandler(session_identifier=identifier, writer=writer)
 
     def save_prompt(self, prompt: str) -> None:
         """Save item to storage."""
@@ -30,9 +35,14 @@ class PromptTableHandler:
             datetime_=utcnow(),
             session_identifier=self.session_identifier,
         )
-        self.sql_handler.save_multiple([prompt_to_save])
+        if self.writer is not None:
+            self.writer.submit(self.sql_handler, [prompt_to_save])
+        else:
+            self.sql_handler.save_multiple([prompt_to_save])
 
     def fetch_latest_prompt(self) -> Prompt | None:
+        if self.writer is not None:
+            self.writer.flush(raise_error=False)
         # We ignore since mypy doesn't play well with SQLModel class attributes.
         column_to_order: str = Prompt.datetime_.key  # type: ignore[attr-defined]
         query_filters = [col(Prompt.session_identifier) == self.session_identifier]
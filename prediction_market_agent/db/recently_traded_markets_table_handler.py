@@ -0,0 +1,43 @@
+import typing as t
+
+from prediction_market_agent_tooling.tools.utils import DatetimeUTC
+from sqlalchemy import Table
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import col
+
+from prediction_market_agent.db.models import RecentlyTradedMarket
+from prediction_market_agent.db.sql_handler import SQLHandler
+
+
+class RecentlyTradedMarketsTableHandler:
+    def __init__(self, sqlalchemy_db_url: str | None = None):
+        self.sql_handler = SQLHandler(
+            model=RecentlyTradedMarket, sqlalchemy_db_url=sqlalchemy_db_url
+        )
+
+    def get_traded_at(self, market_id: str) -> DatetimeUTC | None:
+        rows: list[RecentlyTradedMarket] = self.sql_handler.get_with_filter_and_order(
+            query_filters=[col(RecentlyTradedMarket.market_id) == market_id.lower()]
+        )
+        return rows[0].traded_at if rows else None
+
+    def save_traded(self, market_ids: t.Sequence[str], traded_at: DatetimeUTC) -> None:
+        """Saves the time of the trade, replacing the previous one, also if another process saved it in the meantime."""
+        table: Table = RecentlyTradedMarket.__table__  # type: ignore[attr-defined]
+        with self.sql_handler.db_manager.get_connection() as connection:
+            insert = (
+                postgresql.insert(table)
+                if connection.dialect.name == "postgresql"
+                else sqlite.insert(table)
+            )
+            connection.execute(
+                insert.on_conflict_do_update(
+                    index_elements=[table.c.market_id],
+                    set_={"traded_at": insert.excluded.traded_at},
+                ),
+                [
+                    {"market_id": market_id.lower(), "traded_at": traded_at}
+                    for market_id in set(market_ids)
+                ],
+            )
+            connection.commit()
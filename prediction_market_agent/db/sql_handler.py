@@ -1,24 +1,180 @@
+import io
+import threading
+import time
 import typing as t
+from dataclasses import dataclass
 
+from prediction_market_agent_tooling.loggers import logger
 from prediction_market_agent_tooling.tools.db.db_manager import DBManager
-from sqlalchemy import BinaryExpression, ColumnElement
+from sqlalchemy import (
+    BinaryExpression,
+    Column,
+    ColumnElement,
+    Connection,
+    Engine,
+    MetaData,
+    Table,
+    and_,
+    case,
+    func,
+    insert,
+    inspect,
+    literal,
+    select,
+    text,
+    true,
+    tuple_,
+)
+from sqlalchemy.schema import CreateIndex
 from sqlmodel import SQLModel, asc, desc
 
+from prediction_market_agent.utils import DBKeys
+
 SQLModelType = t.TypeVar("SQLModelType", bound=SQLModel)
 
 
+class KeysetCursor(t.NamedTuple):
+    """Position of a row in the `(order_by_column, id)` ordering, used for seek-based pagination."""
+
+    value: t.Any
+    id: int
+
+    @staticmethod
+    def from_item(item: SQLModel, order_by_column_name: str) -> "KeysetCursor":
+        return KeysetCursor(
+            value=getattr(item, order_by_column_name), id=getattr(item, "id")
+        )
+
+
+_DB_MANAGERS: dict[str | None, DBManager] = {}
+_DB_MANAGERS_LOCK = threading.Lock()
+
+
+def get_db_manager(sqlalchemy_db_url: str | None = None) -> DBManager:
+    """
+    Returns the process-wide DBManager, holding a pooled engine, for the given database URL (or the default one from the environment).
+    Compared to instantiating DBManager directly, the environment is read only once per process, instead of once per table handler.
+    """
+    if (db_manager := _DB_MANAGERS.get(sqlalchemy_db_url)) is None:
+        with _DB_MANAGERS_LOCK:
+            if (db_manager := _DB_MANAGERS.get(sqlalchemy_db_url)) is None:
+                keys = DBKeys()
+                db_manager = DBManager(
+                    sqlalchemy_db_url or keys.sqlalchemy_db_url.get_secret_value(),
+                    pool_size=keys.SQLALCHEMY_POOL_SIZE,
+                    max_overflow=keys.SQLALCHEMY_MAX_OVERFLOW,
+                )
+                _DB_MANAGERS[sqlalchemy_db_url] = db_manager
+    return db_manager
+
+
+@dataclass
+class _CachedCount:
+    count: int
+    # Highest id in the whole table at the time of counting, rows after it are counted incrementally.
+    max_id: int | None
+    # `time.monotonic()` of the last full count.
+    counted_at: float
+    # See `SQLHandler.count`.
+    version: t.Hashable = None
+
+
 class SQLHandler:
+    # Table initialisation runs at most once per database and table, even if handlers are created from multiple threads.
+    _init_table_lock = threading.Lock()
+    # Results of `count`, shared by all handlers of the same database and table.
+    _count_cache: dict[tuple[int, str, str], _CachedCount] = {}
+    _count_cache_lock = threading.Lock()
+
     def __init__(
         self,
         model: t.Type[SQLModelType],
         sqlalchemy_db_url: str | None = None,
     ):
-        self.db_manager = DBManager(sqlalchemy_db_url)
+        self.db_manager = get_db_manager(sqlalchemy_db_url)
         self.table = model
         self._init_table_if_not_exists()
 
+    @property
+    def dialect_name(self) -> str:
+        with self.db_manager.get_session() as session:
+            return session.get_bind().dialect.name
+
     def _init_table_if_not_exists(self) -> None:
-        self.db_manager.create_tables(sqlmodel_tables=[self.table])
+        table: Table = self.table.__table__  # type: ignore[attr-defined]
+        with self._init_table_lock:
+            if self.db_manager.cache_table_initialized.get(table.name):
+                return
+            # The table might have been re-created, so cached counts can't be trusted anymore.
+            self.clear_count_cache()
+            self.db_manager.create_tables(sqlmodel_tables=[self.table])
+            self._ensure_columns()
+
+    def _ensure_columns(self) -> None:
+        """
+        Add nullable columns declared on the model that are missing in the database.
+        New tables get them from `create_tables`, but tables created before the column was declared don't.
+        Other processes can be adding the same columns at the same time, so the statements must not fail if a column already exists.
+        """
+        table: Table = self.table.__table__  # type: ignore[attr-defined]
+        added_columns = []
+        with self.db_manager.get_connection() as connection:
+            existing_columns = {
+                column["name"] for column in inspect(connection).get_columns(table.name)
+            }
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                if not column.nullable:
+                    logger.warning(
+                        f"Column {column.name} is missing in the table {table.name}, but it can not be added automatically, because it's not nullable."
+                    )
+                    continue
+                column_type = column.type.compile(dialect=connection.dialect)
+                # SQLite doesn't support `IF NOT EXISTS` here, but it also doesn't run in multiple replicas.
+                if_not_exists = (
+                    "IF NOT EXISTS " if connection.dialect.name == "postgresql" else ""
+                )
+                connection.execute(
+                    text(
+                        f'ALTER TABLE "{table.name}" ADD COLUMN {if_not_exists}"{column.name}" {column_type}'
+                    )
+                )
+                added_columns.append(column.name)
+            connection.commit()
+        if added_columns:
+            logger.info(f"Added columns {added_columns} to the table {table.name}.")
+
+    def create_missing_indexes(self) -> list[str]:
+        """
+        Create indexes declared on the model that are missing in the database, and return their names.
+        New tables get them from `create_tables`, but tables created before the index was declared don't.
+        Building an index on a big table takes long, so this isn't done on startup, but by `scripts/create_missing_indexes.py`,
+        and on PostgreSQL the index is built concurrently, without blocking writes to the table.
+        """
+        table: Table = self.table.__table__  # type: ignore[attr-defined]
+        # Indexes of a copy of the table, so that the concurrent build doesn't leak into `create_tables`, where it would fail inside its transaction.
+        indexes = table.to_metadata(MetaData()).indexes
+        created_indexes = []
+        with self.db_manager.get_session() as session:
+            engine = session.get_bind()
+        assert isinstance(engine, Engine)
+        # `CREATE INDEX CONCURRENTLY` can't run inside a transaction.
+        with engine.connect().execution_options(
+            isolation_level="AUTOCOMMIT"
+        ) as connection:
+            existing_indexes = {
+                index["name"] for index in inspect(connection).get_indexes(table.name)
+            }
+            for index in indexes:
+                if index.name in existing_indexes:
+                    continue
+                index.dialect_kwargs["postgresql_concurrently"] = True
+                connection.execute(CreateIndex(index, if_not_exists=True))
+                created_indexes.append(str(index.name))
+        if created_indexes:
+            logger.info(f"Created indexes {created_indexes} on the table {table.name}.")
+        return created_indexes
 
     def get_all(self) -> t.Sequence[SQLModelType]:
         with self.db_manager.get_session() as session:
@@ -29,16 +185,54 @@ class SQLHandler:
             session.add_all(items)
             session.commit()
 
+    def bulk_insert(self, items: t.Sequence[SQLModelType]) -> None:
+        """
+        Faster alternative to `save_multiple` for append-only writes.
+
+        Rows are written with a single Core INSERT (executemany), or with COPY on PostgreSQL,
+        skipping the ORM unit-of-work. The given items are not attached to any session,
+        so e.g. their `id` is not populated afterwards.
+        """
+        if not items:
+            return
+
+        table: Table = self.table.__table__  # type: ignore[attr-defined]
+        # Let the database generate primary keys that weren't set explicitly.
+        columns = [
+            column
+            for column in table.columns
+            if not (
+                column.primary_key
+                and all(getattr(item, column.name) is None for item in items)
+            )
+        ]
+        rows = [
+            {column.name: getattr(item, column.name) for column in columns}
+            for item in items
+        ]
+
+        with self.db_manager.get_connection() as connection:
+            if (
+                connection.dialect.name == "postgresql"
+                and connection.dialect.driver == "psycopg2"
+            ):
+                _copy_rows(connection, table, columns, rows)
+            else:
+                connection.execute(insert(table), rows)
+            connection.commit()
+
     def remove_multiple(self, items: t.Sequence[SQLModelType]) -> None:
         with self.db_manager.get_session() as session:
             for item in items:
                 session.delete(item)
             session.commit()
+        self.clear_count_cache()
 
     def remove_by_id(self, item_id: int) -> None:
         with self.db_manager.get_session() as session:
             session.query(self.table).filter_by(id=item_id).delete()
             session.commit()
+        self.clear_count_cache()
 
     def get_with_filter_and_order(
         self,
@@ -66,12 +260,232 @@ class SQLHandler:
             results = query.all()
         return results
 
+    def iter_with_filter(
+        self,
+        query_filters: t.Sequence[ColumnElement[bool] | BinaryExpression[bool]] = (),
+        order_by_column_name: str | None = None,
+        order_desc: bool = True,
+        batch_size: int = 1000,
+    ) -> t.Iterator[SQLModelType]:
+        """
+        Streaming alternative to `get_with_filter_and_order`.
+
+        Rows are fetched in batches of `batch_size` (using a server-side cursor where the database supports it),
+        so the memory usage doesn't depend on the number of matching rows, as long as the consumer doesn't keep them all.
+        The session stays open until the iterator is exhausted or closed.
+        """
+        with self.db_manager.get_session() as session:
+            query = session.query(self.table)
+            for exp in query_filters:
+                query = query.where(exp)
+
+            if order_by_column_name:
+                query = query.order_by(
+                    desc(order_by_column_name)
+                    if order_desc
+                    else asc(order_by_column_name)
+                )
+
+            yield from query.yield_per(batch_size)
+
+    def get_page_with_filter_and_order(
+        self,
+        order_by_column_name: str,
+        limit: int | None,
+        query_filters: t.Sequence[ColumnElement[bool] | BinaryExpression[bool]] = (),
+        order_desc: bool = True,
+        after: KeysetCursor | None = None,
+    ) -> tuple[list[SQLModelType], KeysetCursor | None]:
+        """
+        Seek-based alternative to the `offset` of `get_with_filter_and_order`.
+
+        Rows are ordered by `(order_by_column_name, id)` and only rows strictly after the `after` cursor are returned,
+        so that any page costs the same as the first one. Returns the page and the cursor of the next page,
+        or None if there are no more rows.
+        """
+        order_column = getattr(self.table, order_by_column_name)
+        id_column = getattr(self.table, "id")
+        with self.db_manager.get_session() as session:
+            query = session.query(self.table)
+            for exp in query_filters:
+                query = query.where(exp)
+
+            if after is not None:
+                row_position = tuple_(order_column, id_column)
+                after_position = tuple_(
+                    literal(after.value, type_=order_column.type),
+                    literal(after.id, type_=id_column.type),
+                )
+                query = query.where(
+                    row_position < after_position
+                    if order_desc
+                    else row_position > after_position
+                )
+
+            query = query.order_by(
+                *(
+                    (desc(order_column), desc(id_column))
+                    if order_desc
+                    else (asc(order_column), asc(id_column))
+                )
+            )
+            if limit:
+                query = query.limit(limit)
+            results = query.all()
+
+        next_cursor = (
+            KeysetCursor.from_item(results[-1], order_by_column_name)
+            if limit and len(results) == limit
+            else None
+        )
+        return results, next_cursor
+
     def count(
         self,
         query_filters: t.Sequence[ColumnElement[bool] | BinaryExpression[bool]] = (),
+        max_age_seconds: float | None = None,
+        version: t.Hashable = None,
+    ) -> int:
+        """
+        Number of rows matching the filters.
+
+        By default, the rows are counted exactly. With `max_age_seconds` set, the count is cached per filter and kept up to date
+        by counting only the rows added since (with an id higher than any row seen before), instead of scanning all the matching rows again.
+        Rows removed through this class invalidate the cache, other changes (e.g. rows removed by a different process,
+        or inserted by a transaction that committed out of id order) are picked up by a full count once in `max_age_seconds`,
+        or as soon as the given `version` changes, if the caller can tell that such a change happened (see `LongTermMemoryTableHandler.count`).
+        """
+        table: Table = self.table.__table__  # type: ignore[attr-defined]
+        id_column = table.columns.get("id")
+        if max_age_seconds is None or id_column is None or not id_column.primary_key:
+            return self._count_exact(query_filters)
+
+        compiled = and_(true(), *query_filters).compile()
+        cache_key = (
+            id(self.db_manager),
+            table.name,
+            f"{compiled} {sorted(compiled.params.items())!r}",
+        )
+        cached = self._count_cache.get(cache_key)
+
+        if (
+            cached is None
+            or cached.version != version
+            or time.monotonic() - cached.counted_at > max_age_seconds
+        ):
+            count, max_id = self._count_with_max_id(id_column, query_filters)
+            cached = _CachedCount(
+                count=count,
+                max_id=max_id,
+                counted_at=time.monotonic(),
+                version=version,
+            )
+        elif new_rows := self._count_after(id_column, cached.max_id, query_filters):
+            n_new_rows, max_id = new_rows
+            cached = _CachedCount(
+                count=cached.count + n_new_rows,
+                max_id=max_id,
+                counted_at=cached.counted_at,
+                version=version,
+            )
+
+        with self._count_cache_lock:
+            self._count_cache[cache_key] = cached
+        return cached.count
+
+    def clear_count_cache(self) -> None:
+        """Drop cached counts of this table, needed after rows were removed without going through this class."""
+        table: Table = self.table.__table__  # type: ignore[attr-defined]
+        with self._count_cache_lock:
+            for key in list(self._count_cache):
+                if key[:2] == (id(self.db_manager), table.name):
+                    del self._count_cache[key]
+
+    def _count_exact(
+        self,
+        query_filters: t.Sequence[ColumnElement[bool] | BinaryExpression[bool]],
     ) -> int:
         with self.db_manager.get_session() as session:
             query = session.query(self.table)
             for exp in query_filters:
                 query = query.where(exp)
             return query.count()
+
+    def _count_with_max_id(
+        self,
+        id_column: Column[t.Any],
+        query_filters: t.Sequence[ColumnElement[bool] | BinaryExpression[bool]],
+    ) -> tuple[int, int | None]:
+        """Count of the rows matching the filters and the highest id in the table, from the same snapshot of the table."""
+        query = select(
+            select(func.count())
+            .select_from(id_column.table)
+            .where(true(), *query_filters)
+            .scalar_subquery(),
+            select(func.max(id_column)).scalar_subquery(),
+        )
+        with self.db_manager.get_connection() as connection:
+            count, max_id = connection.execute(query).one()
+        return count, max_id
+
+    def _count_after(
+        self,
+        id_column: Column[t.Any],
+        after_id: int | None,
+        query_filters: t.Sequence[ColumnElement[bool] | BinaryExpression[bool]],
+    ) -> tuple[int, int] | None:
+        """Count of the rows matching the filters with an id higher than `after_id`, and the new highest id. None if there are no new rows at all."""
+        # The filters are evaluated only on the new rows (found using the primary key), instead of being used to look up all the matching rows.
+        query = select(
+            func.sum(case((and_(true(), *query_filters), 1), else_=0)),
+            func.max(id_column),
+        )
+        if after_id is not None:
+            query = query.where(id_column > after_id)
+        with self.db_manager.get_connection() as connection:
+            n_rows, max_id = connection.execute(query).one()
+        return None if max_id is None else (n_rows, max_id)
+
+
+def _copy_rows(
+    connection: Connection,
+    table: Table,
+    columns: t.Sequence[Column[t.Any]],
+    rows: t.Sequence[dict[str, t.Any]],
+) -> None:
+    """Stream rows into the table using PostgreSQL's COPY in its text format."""
+    bind_processors = [
+        column.type.bind_processor(connection.dialect) for column in columns
+    ]
+    buffer = io.StringIO()
+    for row in rows:
+        values = []
+        for column, processor in zip(columns, bind_processors):
+            value = row[column.name]
+            if processor is not None:
+                value = processor(value)
+            values.append(_copy_escape(value))
+        buffer.write("\t".join(values) + "\n")
+    buffer.seek(0)
+
+    column_names = ", ".join(f'"{column.name}"' for column in columns)
+    cursor = connection.connection.driver_connection.cursor()  # type: ignore[union-attr]
+    try:
+        cursor.copy_expert(
+            f'COPY "{table.name}" ({column_names}) FROM STDIN WITH (FORMAT text)',
+            buffer,
+        )
+    finally:
+        cursor.close()
+
+
+def _copy_escape(value: t.Any) -> str:
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
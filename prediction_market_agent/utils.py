@@ -22,6 +22,25 @@ class DBKeys(BaseSettings):
         env_file=".env", env_file_encoding="utf-8", extra="ignore"
     )
     SQLALCHEMY_DB_URL: t.Optional[SecretStr] = None
+    # Shared by all the table handlers in the process, see `get_db_manager`.
+    SQLALCHEMY_POOL_SIZE: int = 2
+    SQLALCHEMY_MAX_OVERFLOW: int = 10
+    # Local database of `CachedEmbeddings`.
+    EMBEDDING_CACHE_SQLITE_PATH: str = "embedding_cache.sqlite"
+    # If set, `PineconeHandler` uses a `LocalVectorStore` in this directory instead of Pinecone.
+    LOCAL_VECTOR_INDEX_PATH: t.Optional[str] = None
+    LOCAL_VECTOR_INDEX_USE_HNSW: bool = False
+    # Searches the `LocalVectorStore` in a compact form first, see `VectorCompression`.
+    LOCAL_VECTOR_INDEX_SEARCH_DIMENSION: t.Optional[int] = None
+    LOCAL_VECTOR_INDEX_QUANTIZATION: t.Optional[t.Literal["int8", "binary"]] = None
+    # Directory with a `LongTermMemoryVectorIndex` of each agent.
+    MEMORY_VECTOR_INDEX_PATH: str = "memory_vector_index"
+
+    @property
+    def sqlalchemy_db_url(self) -> SecretStr:
+        return check_not_none(
+            self.SQLALCHEMY_DB_URL, "SQLALCHEMY_DB_URL missing in the environment."
+        )
 
 
 class APIKeys(APIKeysBase):
@@ -0,0 +1,35 @@
+"""
+Moves long-term memories older than the retention horizon into the archive table, to keep `long_term_memories` small.
+Archived memories are still returned by `LongTermMemoryTableHandler.search`, when the requested datetime range reaches them.
+
+Meant to be run periodically, for example:
+    python scripts/archive_long_term_memories.py --retention-days 90
+"""
+
+from datetime import timedelta
+
+import typer
+from prediction_market_agent_tooling.loggers import logger
+from prediction_market_agent_tooling.tools.utils import utcnow
+
+from prediction_market_agent.db.long_term_memory_table_handler import (
+    LongTermMemoryTableHandler,
+)
+
+APP = typer.Typer(pretty_exceptions_enable=False)
+
+
+@APP.command()
+def main(retention_days: int = 90) -> None:
+    older_than = utcnow() - timedelta(days=retention_days)
+    for task_description in LongTermMemoryTableHandler.get_task_descriptions():
+        n_archived = LongTermMemoryTableHandler(
+            task_description=task_description
+        ).archive(older_than=older_than)
+        logger.info(
+            f"Archived {n_archived} memories of {task_description} older than {older_than}."
+        )
+
+
+if __name__ == "__main__":
+    APP()
@@ -0,0 +1,28 @@
+"""
+Fills the `role` and `original_question` columns of long-term memories saved before the columns were added, from their metadata.
+Only memories with the columns still empty are updated, in batches, so the script can be re-run or interrupted at any time.
+
+Meant to be run once after the columns are added, for example:
+    python scripts/backfill_long_term_memory_columns.py --batch-size 10000
+"""
+
+import typer
+from prediction_market_agent_tooling.loggers import logger
+
+from prediction_market_agent.db.long_term_memory_table_handler import (
+    LongTermMemoryTableHandler,
+)
+
+APP = typer.Typer(pretty_exceptions_enable=False)
+
+
+@APP.command()
+def main(batch_size: int = 10_000) -> None:
+    n_processed = LongTermMemoryTableHandler.backfill_metadata_columns(
+        batch_size=batch_size
+    )
+    logger.info(f"Backfilled metadata columns of {n_processed} memories.")
+
+
+if __name__ == "__main__":
+    APP()
@@ -0,0 +1,116 @@
+"""
+Measures how long it takes to create all the table handlers, as the NFT game app and agents do at startup.
+
+The previous behaviour (building `DBManager` from the environment and creating the tables for every handler) is measured as well, for comparison.
+
+    SQLALCHEMY_DB_URL=sqlite:////tmp/benchmark.db python scripts/benchmark_sql_handler_startup.py
+"""
+
+import time
+import typing as t
+
+import typer
+from prediction_market_agent_tooling.config import APIKeys
+from prediction_market_agent_tooling.tools.db.db_manager import DBManager
+from sqlmodel import SQLModel
+
+from prediction_market_agent.agents.identifiers import (
+    NFT_TREASURY_GAME_AGENT_1,
+    NFT_TREASURY_GAME_AGENT_2,
+    NFT_TREASURY_GAME_AGENT_3,
+    NFT_TREASURY_GAME_AGENT_4,
+    NFT_TREASURY_GAME_AGENT_5,
+    NFT_TREASURY_GAME_AGENT_6,
+    NFT_TREASURY_GAME_AGENT_7,
+)
+from prediction_market_agent.agents.microchain_agent.nft_treasury_game.agent_db import (
+    AgentDB,
+    AgentTableHandler,
+)
+from prediction_market_agent.agents.microchain_agent.nft_treasury_game.agent_prompt_inject import (
+    AgentPromptInject,
+    PromptInjectHandler,
+)
+from prediction_market_agent.agents.microchain_agent.nft_treasury_game.game_history import (
+    NFTGameRound,
+    NFTGameRoundTableHandler,
+)
+from prediction_market_agent.db.evaluated_goal_table_handler import (
+    EvaluatedGoalTableHandler,
+)
+from prediction_market_agent.db.long_term_memory_table_handler import (
+    LongTermMemoryTableHandler,
+)
+from prediction_market_agent.db.models import (
+    EvaluatedGoalModel,
+    LongTermMemories,
+    Prompt,
+    ReplicatedMarket,
+    ReportNFTGame,
+)
+from prediction_market_agent.db.prompt_table_handler import PromptTableHandler
+from prediction_market_agent.db.replicated_markets_table_handler import (
+    ReplicatedMarketsTableHandler,
+)
+from prediction_market_agent.db.report_table_handler import ReportNFTGameTableHandler
+
+APP = typer.Typer(pretty_exceptions_enable=False)
+
+AGENT_IDENTIFIERS = [
+    NFT_TREASURY_GAME_AGENT_1,
+    NFT_TREASURY_GAME_AGENT_2,
+    NFT_TREASURY_GAME_AGENT_3,
+    NFT_TREASURY_GAME_AGENT_4,
+    NFT_TREASURY_GAME_AGENT_5,
+    NFT_TREASURY_GAME_AGENT_6,
+    NFT_TREASURY_GAME_AGENT_7,
+]
+
+
+def create_all_handlers() -> None:
+    NFTGameRoundTableHandler()
+    ReportNFTGameTableHandler()
+    ReplicatedMarketsTableHandler()
+    AgentTableHandler()
+    for identifier in AGENT_IDENTIFIERS:
+        LongTermMemoryTableHandler.from_agent_identifier(identifier)
+        PromptTableHandler.from_agent_identifier(identifier)
+        PromptInjectHandler.from_agent_identifier(identifier)
+        EvaluatedGoalTableHandler(agent_id=identifier)
+
+
+def create_all_handlers_previously() -> None:
+    """Equivalent of `create_all_handlers`, but with how `SQLHandler.__init__` worked before the shared registry."""
+    models: list[type[SQLModel]] = [
+        NFTGameRound,
+        ReportNFTGame,
+        ReplicatedMarket,
+        AgentDB,
+    ]
+    for _ in AGENT_IDENTIFIERS:
+        models.extend([LongTermMemories, Prompt, AgentPromptInject, EvaluatedGoalModel])
+    for model in models:
+        DBManager(APIKeys().sqlalchemy_db_url.get_secret_value()).create_tables([model])
+
+
+def measure(fn: t.Callable[[], None], n_repeats: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n_repeats):
+        fn()
+    return (time.perf_counter() - start) / n_repeats
+
+
+@APP.command()
+def main(n_repeats: int = 20) -> None:
+    # The first run includes engine creation and DDL checks.
+    print(f"First startup: {measure(create_all_handlers, 1) * 1000:.2f} ms")
+    print(
+        f"Subsequent startups: {measure(create_all_handlers, n_repeats) * 1000:.2f} ms"
+    )
+    print(
+        f"Subsequent startups, previous behaviour: {measure(create_all_handlers_previously, n_repeats) * 1000:.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    APP()
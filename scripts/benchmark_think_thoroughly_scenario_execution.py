@@ -0,0 +1,131 @@
+"""
+Compares wall time and memory (RSS of this process and its worker processes) of running the ThinkThoroughly scenarios
+in processes and in threads, see `ThinkThoroughlyBase.scenario_execution_mode`.
+
+By default, the predictions are replaced by a sleep of `--latency` seconds, to measure only the overhead of the execution modes.
+With `--real`, the predictions of `ThinkThoroughlyWithItsOwnResearch` are made, which costs money.
+
+    python scripts/benchmark_think_thoroughly_scenario_execution.py --n-scenarios 9
+"""
+
+import os
+import time
+from functools import partial
+from pathlib import Path
+from uuid import UUID, uuid4
+
+import typer
+from prediction_market_agent_tooling.gtypes import Probability
+from pydantic_ai.models import KnownModelName
+
+from prediction_market_agent.agents.microchain_agent.memory import AnswerWithScenario
+from prediction_market_agent.agents.think_thoroughly_agent.think_thoroughly_agent import (
+    ScenarioExecutionMode,
+    ScenarioInputs,
+    ThinkThoroughlyBase,
+    ThinkThoroughlyWithItsOwnResearch,
+)
+
+APP = typer.Typer(pretty_exceptions_enable=False)
+
+QUESTION = "Will the European Central Bank cut interest rates at its next meeting?"
+
+
+class ScenarioExecutor(ThinkThoroughlyBase):
+    """Only the scenario execution of the agent, without its handlers."""
+
+    def __init__(self, mode: ScenarioExecutionMode) -> None:
+        self.scenario_execution_mode = mode
+
+
+def sleeping_prediction(
+    latency: float,
+    unique_id: UUID,
+    model: KnownModelName,
+    scenario: str,
+    original_question: str,
+    previous_scenarios_and_answers: list[tuple[str, AnswerWithScenario]] | None,
+) -> AnswerWithScenario:
+    time.sleep(latency)
+    return AnswerWithScenario(
+        scenario=scenario,
+        original_question=original_question,
+        p_yes=Probability(0.5),
+        confidence=0.5,
+        reasoning="",
+    )
+
+
+def rss_mb(pid: int) -> float:
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def children_pids(pid: int) -> list[int]:
+    pids = []
+    for stat in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            # Command name in the brackets can contain spaces, parent pid is the second field after it.
+            ppid = int(stat.read_text().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            pids.append(int(stat.parent.name))
+    return pids
+
+
+def total_rss_mb() -> float:
+    pids = [os.getpid()]
+    # Include the workers of the workers, e.g. the resource tracker.
+    for pid in pids:
+        pids.extend(children_pids(pid))
+    return sum(rss_mb(pid) for pid in pids)
+
+
+def build_inputs(n_scenarios: int, latency: float, real: bool) -> list[ScenarioInputs]:
+    unique_id = uuid4()
+    agent_class = ThinkThoroughlyWithItsOwnResearch
+    return [
+        (
+            False,
+            unique_id,
+            agent_class.model_for_generate_prediction_for_one_outcome,
+            f"Scenario {i}: {QUESTION}",
+            QUESTION,
+            None,
+            (
+                agent_class.generate_prediction_for_one_outcome
+                if real
+                else partial(sleeping_prediction, latency)
+            ),
+        )
+        for i in range(n_scenarios)
+    ]
+
+
+@APP.command()
+def main(
+    n_scenarios: int = 9,
+    n_rounds: int = 3,
+    latency: float = 2.0,
+    real: bool = False,
+) -> None:
+    # Threads are measured first, so that the RSS isn't influenced by the worker processes left by the process mode.
+    modes: list[ScenarioExecutionMode] = ["thread", "process"]
+    for mode in modes:
+        executor = ScenarioExecutor(mode)
+        for i in range(n_rounds):
+            inputs = build_inputs(n_scenarios, latency, real)
+            start = time.perf_counter()
+            results, dropped = executor.process_scenarios(inputs)
+            wall_time = time.perf_counter() - start
+            n_failed = sum(prediction is None for _, prediction in results)
+            print(
+                f"{mode}, round {i + 1}: {wall_time:.2f} s for {n_scenarios} scenarios ({n_failed} failed, {len(dropped)} dropped), {total_rss_mb():.0f} MB RSS in total"
+            )
+
+
+if __name__ == "__main__":
+    APP()
@@ -0,0 +1,115 @@
+"""
+Compares recall and latency of the compressed searches of `LocalVectorStore` (see `VectorCompression`) against the exact search.
+
+Queries are a fixed (seeded) sample of the indexed vectors, and the ground truth is the exact top-k of each of them.
+Without `--index-path`, a synthetic index is created in a temporary directory, of clustered random vectors with the variance
+decreasing along the dimensions, to roughly imitate Matryoshka embeddings. Measure a real index for the actual recall.
+
+    python scripts/benchmark_vector_index_compression.py --index-path local_index
+"""
+
+import tempfile
+import time
+import typing as t
+from pathlib import Path
+
+import numpy as np
+import typer
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from prediction_market_agent.db.local_vector_store import (
+    LocalVectorStore,
+    VectorCompression,
+)
+
+APP = typer.Typer(pretty_exceptions_enable=False)
+
+COMPRESSIONS = [
+    VectorCompression(dimension=dimension, quantization=quantization)
+    for dimension in [None, 1024, 512, 256]
+    for quantization in t.cast(
+        list[t.Literal["int8", "binary"] | None], [None, "int8", "binary"]
+    )
+    if dimension is not None or quantization is not None
+]
+
+
+def synthetic_vectors(size: int, dimension: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    scales = 1 / np.sqrt(np.arange(1, dimension + 1, dtype=np.float32))
+    centers = rng.standard_normal((max(size // 100, 1), dimension), dtype=np.float32)
+    vectors = centers[
+        rng.integers(len(centers), size=size)
+    ] + 0.5 * rng.standard_normal((size, dimension), dtype=np.float32)
+    return vectors * scales
+
+
+def measure(
+    store: LocalVectorStore, queries: list[list[float]], k: int
+) -> tuple[list[set[str]], float]:
+    start = time.perf_counter()
+    results = [
+        store.similarity_search_by_vector_with_score(query, k=k) for query in queries
+    ]
+    latency = (time.perf_counter() - start) / len(queries)
+    return [{t.cast(str, document.id) for document, _ in r} for r in results], latency
+
+
+@APP.command()
+def main(
+    index_path: t.Optional[Path] = None,
+    n_queries: int = 100,
+    k: int = 10,
+    rerank_factors: list[int] = [1, 4, 10],
+    synthetic_size: int = 20_000,
+    synthetic_dimension: int = 3072,
+    seed: int = 0,
+) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if index_path is None:
+            index_path = Path(tmp_dir)
+            vectors = synthetic_vectors(synthetic_size, synthetic_dimension, seed)
+            LocalVectorStore(
+                embedding=DeterministicFakeEmbedding(size=synthetic_dimension),
+                path=index_path,
+            ).add_vectors(
+                vectors=vectors,
+                texts=[""] * synthetic_size,
+                metadatas=[{} for _ in range(synthetic_size)],
+                ids=[str(i) for i in range(synthetic_size)],
+            )
+
+        # The embedding isn't used, as the queries are already vectors.
+        embedding = DeterministicFakeEmbedding(size=1)
+        exact_store = LocalVectorStore(embedding=embedding, path=index_path)
+        rows = np.random.default_rng(seed).choice(
+            np.flatnonzero(exact_store.active),
+            size=min(n_queries, len(exact_store)),
+            replace=False,
+        )
+        queries = [exact_store.vectors[row].tolist() for row in rows]
+
+        ground_truth, exact_latency = measure(exact_store, queries, k)
+        print(
+            f"Exact search of {len(exact_store)} vectors of dimension {exact_store.dimension}: {exact_latency * 1000:.2f} ms per query"
+        )
+        for compression in COMPRESSIONS:
+            store = LocalVectorStore(
+                embedding=embedding, path=index_path, compression=compression
+            )
+            for rerank_factor in rerank_factors:
+                compression.rerank_factor = rerank_factor
+                results, latency = measure(store, queries, k)
+                recall = np.mean(
+                    [
+                        len(r & truth) / len(truth)
+                        for r, truth in zip(results, ground_truth)
+                    ]
+                )
+                print(
+                    f"{compression.name}, rerank factor {rerank_factor}: recall@{k} {recall:.3f}, {latency * 1000:.2f} ms per query"
+                )
+
+
+if __name__ == "__main__":
+    APP()
@@ -0,0 +1,45 @@
+"""
+Creates the indexes declared on the agent tables that are missing in the database, e.g. because the table existed before the index was declared.
+On PostgreSQL, the indexes are built concurrently, so the agents can keep writing to the tables meanwhile.
+
+Meant to be run after deploying new index declarations, for example:
+    python scripts/create_missing_indexes.py
+"""
+
+import typer
+from prediction_market_agent_tooling.loggers import logger
+from sqlmodel import SQLModel
+
+from prediction_market_agent.agents.microchain_agent.nft_treasury_game.game_history import (
+    NFTGameRound,
+)
+from prediction_market_agent.db.models import (
+    EvaluatedGoalModel,
+    LongTermMemories,
+    LongTermMemoriesArchive,
+    Prompt,
+)
+from prediction_market_agent.db.sql_handler import SQLHandler
+
+APP = typer.Typer(pretty_exceptions_enable=False)
+
+INDEXED_MODELS: list[type[SQLModel]] = [
+    LongTermMemories,
+    LongTermMemoriesArchive,
+    Prompt,
+    EvaluatedGoalModel,
+    NFTGameRound,
+]
+
+
+@APP.command()
+def main() -> None:
+    for model in INDEXED_MODELS:
+        created_indexes = SQLHandler(model=model).create_missing_indexes()
+        logger.info(
+            f"Created {len(created_indexes)} missing indexes on {model.__tablename__}."
+        )
+
+
+if __name__ == "__main__":
+    APP()
@@ -0,0 +1,37 @@
+"""
+Keeps the state of the markets (open/closed, current p_yes, liquidity) in the vector index current,
+so that agents searching for related markets don't need to fetch each of them from the subgraph.
+
+Each refresh first inserts newly created markets, then updates only the markets that changed since the previous refresh.
+Meant to be run in the background next to the agents, for example:
+    python scripts/refresh_market_states.py --interval-seconds 300
+"""
+
+import time
+
+import typer
+from prediction_market_agent_tooling.loggers import logger
+
+from prediction_market_agent.db.pinecone_handler import PineconeHandler
+
+APP = typer.Typer(pretty_exceptions_enable=False)
+
+
+@APP.command()
+def main(interval_seconds: int = 300, once: bool = False) -> None:
+    pinecone_handler = PineconeHandler()
+    while True:
+        try:
+            pinecone_handler.insert_all_omen_markets_if_not_exists()
+            pinecone_handler.refresh_market_states()
+        except Exception as e:
+            if once:
+                raise
+            logger.exception(f"Failed to refresh the market states: {e}")
+        if once:
+            return
+        time.sleep(interval_seconds)
+
+
+if __name__ == "__main__":
+    APP()
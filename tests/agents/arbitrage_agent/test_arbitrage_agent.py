@@ -1,13 +1,29 @@
+import time
 import typing as t
 from unittest.mock import Mock, patch
 
 import pytest
+from langchain_core.runnables import RunnableLambda, RunnableSerializable
+from prediction_market_agent_tooling.deploy.agent import DeployableTraderAgent
 from prediction_market_agent_tooling.markets.agent_market import AgentMarket
+from prediction_market_agent_tooling.markets.markets import MarketType
 from prediction_market_agent_tooling.markets.omen.omen import OmenAgentMarket
 
+from prediction_market_agent.agents.arbitrage_agent.correlation_graph import (
+    ArbitrageLeg,
+    GraphArbitrage,
+)
+from prediction_market_agent.agents.arbitrage_agent.data_models import Correlation
 from prediction_market_agent.agents.arbitrage_agent.deploy import (
     DeployableArbitrageAgent,
 )
+from prediction_market_agent.agents.think_thoroughly_agent.models import (
+    PineconeMetadata,
+)
+from prediction_market_agent.db.market_correlations_table_handler import (
+    MarketCorrelationsTableHandler,
+)
+from tests.agents.arbitrage_agent.test_correlation_graph import build_market
 from tests.utils import RUN_PAID_TESTS
 
 
@@ -59,3 +75,112 @@ def test_correlation_for_similar_markets(
         market=main_market, related_market=other_market
     )
     assert correlation.near_perfect_correlation == is_correlated
+
+
+def test_correlations_are_calculated_concurrently(
+    market_correlations_table_handler: MarketCorrelationsTableHandler,
+) -> None:
+    calculated_questions = []
+
+    def correlation(inputs: dict[str, str]) -> Correlation:
+        calculated_questions.append(inputs["related_market_question"])
+        time.sleep(0.2)
+        if inputs["related_market_question"] == "failing":
+            raise TimeoutError("Request timed out.")
+        return Correlation(near_perfect_correlation=True, reasoning="")
+
+    agent = DeployableArbitrageAgent.__new__(DeployableArbitrageAgent)
+    agent.market_correlations = market_correlations_table_handler
+    agent.chain = t.cast(
+        RunnableSerializable[t.Any, t.Any], RunnableLambda(correlation)
+    )
+    main_market = Mock(OmenAgentMarket, id="main", question="main")
+    related_markets = [
+        Mock(OmenAgentMarket, id=str(i), question=question)
+        for i, question in enumerate(["a", "failing", "b", "c", "d"])
+    ]
+
+    start = time.monotonic()
+    with patch(
+        "prediction_market_agent.agents.arbitrage_agent.deploy.get_langfuse_langchain_config",
+        Mock(return_value={}),
+    ):
+        correlations = agent.calculate_correlations_between_markets(
+            market=main_market, related_markets=related_markets
+        )
+
+    # Calls run concurrently, and a failed one doesn't fail the others.
+    assert time.monotonic() - start < 0.2 * len(related_markets) / 2
+    assert [c is not None for c in correlations] == [True, False, True, True, True]
+
+    # Calculated correlations are reused, also with the markets swapped, only the failed one is calculated again.
+    calculated_questions.clear()
+    with patch(
+        "prediction_market_agent.agents.arbitrage_agent.deploy.get_langfuse_langchain_config",
+        Mock(return_value={}),
+    ):
+        correlations = agent.calculate_correlations_between_markets(
+            market=related_markets[0], related_markets=[main_market, related_markets[1]]
+        )
+    assert calculated_questions == ["failing"]
+    assert correlations[0] is not None
+
+
+def test_graph_arbitrage_takes_a_single_market_slot() -> None:
+    agent = DeployableArbitrageAgent.__new__(DeployableArbitrageAgent)
+    agent.pinecone_handler = Mock(
+        find_nearest_questions_batch=lambda texts, **kwargs: [[] for _ in texts]
+    )
+    markets = {id: build_market(id, 0.5) for id in "abcd"}
+    arbitrage = GraphArbitrage(
+        legs=[
+            ArbitrageLeg(market=markets["a"], direction=True),
+            ArbitrageLeg(market=markets["b"], direction=False),
+        ]
+    )
+
+    with (
+        patch.object(
+            DeployableTraderAgent,
+            "get_markets",
+            return_value=[markets["b"], markets["c"], markets["d"]],
+        ),
+        patch.object(
+            DeployableArbitrageAgent, "find_graph_arbitrages", return_value=[arbitrage]
+        ),
+    ):
+        processed_markets = agent.get_markets(MarketType.OMEN)
+
+    # The arbitrage is traded when processing its first leg, its other legs aren't processed on their own.
+    assert [market.id for market in processed_markets] == ["a", "c", "d"]
+    assert agent.graph_arbitrages_by_market_id == {"a": arbitrage}
+
+
+def test_related_markets_are_searched_in_chunks() -> None:
+    agent = DeployableArbitrageAgent.__new__(DeployableArbitrageAgent)
+    agent.bet_on_n_markets_per_run = 2
+    searched_texts: list[list[str]] = []
+
+    def find_nearest_questions_batch(
+        texts: list[str], **kwargs: t.Any
+    ) -> list[list[PineconeMetadata]]:
+        searched_texts.append(texts)
+        return [[] for _ in texts]
+
+    agent.pinecone_handler = Mock(
+        find_nearest_questions_batch=find_nearest_questions_batch
+    )
+    markets = [build_market(id, 0.5) for id in "abcde"]
+    with (
+        patch.object(DeployableTraderAgent, "get_markets", return_value=markets),
+        patch.object(
+            DeployableArbitrageAgent, "find_graph_arbitrages", return_value=[]
+        ),
+    ):
+        agent.get_markets(MarketType.OMEN)
+    assert searched_texts == []
+
+    for market in markets[:3]:
+        assert agent.get_related_markets(market) == []
+    # Only the markets that are about to be processed are searched, a chunk at once.
+    assert searched_texts == [["Will a?", "Will b?"], ["Will c?", "Will d?"]]
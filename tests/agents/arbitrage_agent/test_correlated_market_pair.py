@@ -9,6 +9,7 @@ from prediction_market_agent_tooling.markets.omen.omen import OmenAgentMarket
 from prediction_market_agent.agents.arbitrage_agent.data_models import (
     CorrelatedMarketPair,
     Correlation,
+    best_case_profits_per_bet_unit,
 )
 
 PERFECT_POSITIVE_CORRELATION = Correlation(near_perfect_correlation=True, reasoning="")
@@ -81,3 +82,25 @@ def test_profit(
 
     assert bet_direction_main == m1_bet_yes
     assert bet_direction_related == m2_bet_yes
+
+
+def test_best_case_profits_bound_profit_of_any_correlation() -> None:
+    main_market = build_market(0.5)
+    related_markets = [build_market(p_yes) for p_yes in [0.1, 0.499, 0.5, 0.502, 0.9]]
+    best_case_profits = best_case_profits_per_bet_unit(main_market, related_markets)
+
+    for related_market, best_case_profit in zip(related_markets, best_case_profits):
+        profits = [
+            CorrelatedMarketPair(
+                main_market=main_market,
+                related_market=related_market,
+                correlation=correlation,
+            ).potential_profit_per_bet_unit()
+            for correlation in [
+                PERFECT_POSITIVE_CORRELATION,
+                PERFECT_NEGATIVE_CORRELATION,
+            ]
+        ]
+        assert max(profits) == pytest.approx(best_case_profit)
+    # Only pairs priced close to each other and to 0.5 can't be profitable with either correlation.
+    assert list(best_case_profits > 0.005) == [True, False, False, False, True]
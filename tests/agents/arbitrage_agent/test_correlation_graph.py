@@ -0,0 +1,74 @@
+from unittest.mock import Mock
+
+import numpy as np
+from prediction_market_agent_tooling.gtypes import USD, OutcomeStr
+from prediction_market_agent_tooling.markets.agent_market import AgentMarket
+from prediction_market_agent_tooling.markets.omen.omen import OmenAgentMarket
+
+from prediction_market_agent.agents.arbitrage_agent.correlation_graph import (
+    CorrelationGraph,
+)
+
+
+def build_market(id: str, p_yes: float, question: str | None = None) -> AgentMarket:
+    market = Mock(OmenAgentMarket, wraps=OmenAgentMarket)
+    market.id = id
+    market.question = question or f"Will {id}?"
+    market.p_yes = p_yes
+    market.p_no = 1 - p_yes
+    market.get_outcome_str_from_bool = lambda direction: OutcomeStr(
+        "Yes" if direction else "No"
+    )
+    return market
+
+
+def test_arbitrage_across_markets_connected_through_others() -> None:
+    markets = [
+        build_market("a", 0.3),
+        # b is the negation of a, c is the same as b, so c is the negation of a.
+        build_market("b", 0.65),
+        build_market("c", 0.5),
+        # d has the same question as a, and is connected to it implicitly.
+        build_market("d", 0.35, question="Will a?"),
+        # e and f are correlated, but priced consistently.
+        build_market("e", 0.4),
+        build_market("f", 0.4),
+    ]
+    graph = CorrelationGraph(
+        markets=markets,
+        question_hashes=[m.question for m in markets],
+        correlations=[
+            ("Will a?", "Will b?", False),
+            ("Will b?", "Will c?", True),
+            ("Will e?", "Will f?", True),
+            ("Will x?", "Will e?", False),
+        ],
+    )
+    [arbitrage] = graph.find_arbitrages(min_profit_per_bet_unit=0.005)
+
+    # a and c were never paired directly: YES in a (0.3) and YES in c (0.5) cover both outcomes, cheaper than through b.
+    assert [(leg.market, leg.direction) for leg in arbitrage.legs] == [
+        (markets[0], True),
+        (markets[2], True),
+    ]
+    assert np.isclose(arbitrage.potential_profit_per_bet_unit(), 1 / 0.8 - 1)
+    trades = arbitrage.build_trades(USD(8))
+    assert [(trade.market, trade.outcome) for trade in trades] == [
+        (markets[0], "Yes"),
+        (markets[2], "Yes"),
+    ]
+    assert np.allclose([trade.amount.value for trade in trades], [3, 5])
+
+
+def test_contradicting_correlations_are_skipped() -> None:
+    markets = [build_market("a", 0.2), build_market("b", 0.2), build_market("c", 0.5)]
+    graph = CorrelationGraph(
+        markets=markets,
+        question_hashes=[m.question for m in markets],
+        correlations=[
+            ("Will a?", "Will b?", True),
+            ("Will b?", "Will c?", True),
+            ("Will a?", "Will c?", False),
+        ],
+    )
+    assert graph.find_arbitrages(min_profit_per_bet_unit=0.005) == []
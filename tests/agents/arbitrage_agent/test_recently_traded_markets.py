@@ -0,0 +1,52 @@
+from datetime import timedelta
+from pathlib import Path
+
+import pytest
+from freezegun import freeze_time
+
+from prediction_market_agent.agents.arbitrage_agent.recently_traded_markets import (
+    InMemoryRecentlyTradedMarkets,
+    RecentlyTradedMarkets,
+    SQLRecentlyTradedMarkets,
+)
+
+TTL = timedelta(hours=3)
+
+
+@pytest.mark.parametrize("store", ["in_memory", "sql"])
+def test_recently_traded_markets_expire(store: str, tmp_path: Path) -> None:
+    with freeze_time("2024-01-01 00:00:00"):
+        recently_traded_markets: RecentlyTradedMarkets = (
+            InMemoryRecentlyTradedMarkets(ttl=TTL)
+            if store == "in_memory"
+            else SQLRecentlyTradedMarkets(
+                ttl=TTL, sqlalchemy_db_url=f"sqlite:///{tmp_path / 'test.db'}"
+            )
+        )
+        recently_traded_markets.mark_traded(["0xA", "0xb"])
+        assert recently_traded_markets.was_traded("0xa")
+        assert recently_traded_markets.was_traded("0xB")
+        assert not recently_traded_markets.was_traded("0xc")
+
+    with freeze_time("2024-01-01 03:00:01"):
+        assert not recently_traded_markets.was_traded("0xa")
+        recently_traded_markets.mark_traded(["0xa"])
+        assert recently_traded_markets.was_traded("0xa")
+
+
+def test_sql_recently_traded_markets_are_shared(tmp_path: Path) -> None:
+    sqlalchemy_db_url = f"sqlite:///{tmp_path / 'test.db'}"
+    with freeze_time("2024-01-01 00:00:00"):
+        replica = SQLRecentlyTradedMarkets(ttl=TTL, sqlalchemy_db_url=sqlalchemy_db_url)
+        other_replica = SQLRecentlyTradedMarkets(
+            ttl=TTL, sqlalchemy_db_url=sqlalchemy_db_url
+        )
+        assert not other_replica.was_traded("0xa")
+        replica.mark_traded(["0xa"])
+        assert other_replica.was_traded("0xa")
+
+    # Trade by the other replica after the previous one expired is seen as well.
+    with freeze_time("2024-01-01 04:00:00"):
+        assert not replica.was_traded("0xa")
+        other_replica.mark_traded(["0xa"])
+        assert replica.was_traded("0xa")
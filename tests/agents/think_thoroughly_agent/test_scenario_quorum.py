@@ -0,0 +1,87 @@
+import threading
+import time
+import typing as t
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+
+import pytest
+
+from prediction_market_agent.agents.think_thoroughly_agent.scenario_quorum import (
+    wait_for_quorum,
+)
+
+ScenarioFuture = Future[tuple[str, float | None]]
+
+
+def done_future(prediction: float | None) -> ScenarioFuture:
+    future: ScenarioFuture = Future()
+    future.set_result(("scenario", prediction))
+    return future
+
+
+def failed_future() -> ScenarioFuture:
+    future: ScenarioFuture = Future()
+    future.set_exception(RuntimeError("Worker died."))
+    return future
+
+
+def predict_when(release: threading.Event) -> tuple[str, float | None]:
+    release.wait()
+    return ("scenario", 0.5)
+
+
+@pytest.fixture
+def executor() -> t.Iterator[ThreadPoolExecutor]:
+    executor = ThreadPoolExecutor(max_workers=10)
+    yield executor
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def test_quorum_reached_early(executor: ThreadPoolExecutor) -> None:
+    release = threading.Event()
+    futures = [done_future(0.5) for _ in range(4)] + [
+        executor.submit(predict_when, release)
+    ]
+
+    start = time.monotonic()
+    pending = wait_for_quorum(
+        futures, quorum=0.8, min_quorum=0.5, deadline=timedelta(minutes=10)
+    )
+    # The straggler isn't awaited, as 4 of 5 scenarios are enough.
+    assert time.monotonic() - start < 1
+    assert pending == {futures[-1]}
+    release.set()
+
+
+def test_deadline_hit_below_quorum(executor: ThreadPoolExecutor) -> None:
+    release = threading.Event()
+    futures = [done_future(0.5) for _ in range(3)] + [
+        executor.submit(predict_when, release) for _ in range(2)
+    ]
+
+    start = time.monotonic()
+    pending = wait_for_quorum(
+        futures, quorum=0.8, min_quorum=0.5, deadline=timedelta(seconds=0.2)
+    )
+    # Quorum wasn't reached, so the stragglers are awaited until the deadline, after which the minimal quorum is enough.
+    assert 0.2 <= time.monotonic() - start < 1
+    assert pending == set(futures[3:])
+    release.set()
+
+
+def test_failed_scenarios_are_not_counted(executor: ThreadPoolExecutor) -> None:
+    release = threading.Event()
+    futures = (
+        [done_future(0.5) for _ in range(2)]
+        + [done_future(None), failed_future()]
+        + [executor.submit(predict_when, release)]
+    )
+    threading.Timer(0.2, release.set).start()
+
+    start = time.monotonic()
+    pending = wait_for_quorum(
+        futures, quorum=0.6, min_quorum=0.5, deadline=timedelta(seconds=0)
+    )
+    # 4 of 5 scenarios are done, but only 2 of them were predicted, so the last one is awaited to reach even the minimal quorum.
+    assert time.monotonic() - start >= 0.2
+    assert pending == set()
@@ -9,6 +9,9 @@ from prediction_market_agent.db.evaluated_goal_table_handler import (
 from prediction_market_agent.db.long_term_memory_table_handler import (
     LongTermMemoryTableHandler,
 )
+from prediction_market_agent.db.market_correlations_table_handler import (
+    MarketCorrelationsTableHandler,
+)
 from prediction_market_agent.db.prompt_table_handler import PromptTableHandler
 
 
@@ -70,3 +73,13 @@ def evaluated_goal_table_handler(
     )
     yield table_handler
     reset_init_params_db_manager(table_handler.sql_handler.db_manager)
+
+
+@pytest.fixture(scope="function")
+def market_correlations_table_handler() -> (
+    Generator[MarketCorrelationsTableHandler, None, None]
+):
+    """Creates a in-memory SQLite DB for testing"""
+    table_handler = MarketCorrelationsTableHandler(sqlalchemy_db_url="sqlite://")
+    yield table_handler
+    reset_init_params_db_manager(table_handler.sql_handler.db_manager)
@@ -0,0 +1,121 @@
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from prediction_market_agent.db.background_writer import BackgroundWriter
+from prediction_market_agent.db.long_term_memory_table_handler import (
+    LongTermMemoryTableHandler,
+)
+from prediction_market_agent.db.prompt_table_handler import PromptTableHandler
+from prediction_market_agent.db.sql_handler import SQLHandler
+
+
+@pytest.fixture(scope="function")
+def db_url(tmp_path: Path) -> str:
+    # In-memory SQLite database is per-thread, so the background writer needs a file-based one.
+    return f"sqlite:///{tmp_path / 'test.db'}"
+
+
+def test_background_writer_keeps_order_and_flushes_before_read(db_url: str) -> None:
+    writer = BackgroundWriter(max_batch_size=1000, max_delay_seconds=1000)
+    long_term_memory = LongTermMemoryTableHandler(
+        task_description="test", sqlalchemy_db_url=db_url, writer=writer
+    )
+    prompt_handler = PromptTableHandler(
+        session_identifier="test", sqlalchemy_db_url=db_url, writer=writer
+    )
+
+    for i in range(5):
+        long_term_memory.save_history([{"i": i}])
+        prompt_handler.save_prompt(f"prompt {i}")
+
+    # Nothing was written yet, as neither of the thresholds was reached.
+    assert len(long_term_memory.sql_handler.get_all()) == 0
+
+    # Reading through the handler flushes the writer first.
+    assert [m.metadata_dict for m in long_term_memory.search()] == [
+        {"i": i} for i in reversed(range(5))
+    ]
+    latest_prompt = prompt_handler.fetch_latest_prompt()
+    assert latest_prompt is not None
+    assert latest_prompt.prompt == "prompt 4"
+
+    writer.close()
+
+
+def test_background_writer_flushes_on_batch_size(db_url: str) -> None:
+    writer = BackgroundWriter(max_batch_size=3, max_delay_seconds=1000)
+    sql_handler = LongTermMemoryTableHandler(
+        task_description="test", sqlalchemy_db_url=db_url
+    ).sql_handler
+    long_term_memory = LongTermMemoryTableHandler(
+        task_description="test", sqlalchemy_db_url=db_url, writer=writer
+    )
+
+    with patch.object(
+        SQLHandler, "bulk_insert", autospec=True, side_effect=SQLHandler.bulk_insert
+    ) as bulk_insert:
+        long_term_memory.save_history([{"i": 0}, {"i": 1}, {"i": 2}])
+        writer.close()
+
+    bulk_insert.assert_called_once()
+    assert len(sql_handler.get_all()) == 3
+
+
+def test_background_writer_retries_failed_writes(db_url: str) -> None:
+    writer = BackgroundWriter(max_batch_size=1000, max_delay_seconds=1000)
+    long_term_memory = LongTermMemoryTableHandler(
+        task_description="test", sqlalchemy_db_url=db_url, writer=writer
+    )
+    long_term_memory.save_history([{"i": 0}])
+
+    with patch.object(SQLHandler, "bulk_insert", side_effect=RuntimeError("DB down")):
+        with pytest.raises(RuntimeError, match="DB down"):
+            writer.flush()
+
+    # The failed items are kept and written with the next flush, before the newer ones.
+    long_term_memory.save_history([{"i": 1}])
+    writer.close()
+    assert [m.metadata_dict for m in long_term_memory.search()] == [{"i": 1}, {"i": 0}]
+
+
+def test_background_writer_drops_items_after_max_retries(db_url: str) -> None:
+    writer = BackgroundWriter(
+        max_batch_size=1000, max_delay_seconds=1000, max_retries=1
+    )
+    long_term_memory = LongTermMemoryTableHandler(
+        task_description="test", sqlalchemy_db_url=db_url, writer=writer
+    )
+    long_term_memory.save_history([{"i": 0}])
+
+    with patch.object(SQLHandler, "bulk_insert", side_effect=RuntimeError("DB down")):
+        for _ in range(2):
+            with pytest.raises(RuntimeError, match="DB down"):
+                writer.flush()
+
+    # The failed items were dropped, instead of being retried forever.
+    long_term_memory.save_history([{"i": 1}])
+    writer.close()
+    assert [m.metadata_dict for m in long_term_memory.search()] == [{"i": 1}]
+
+
+def test_background_writer_error_is_raised_once_and_not_from_reads(
+    db_url: str,
+) -> None:
+    writer = BackgroundWriter(max_batch_size=1000, max_delay_seconds=1000)
+    long_term_memory = LongTermMemoryTableHandler(
+        task_description="test", sqlalchemy_db_url=db_url, writer=writer
+    )
+    long_term_memory.save_history([{"i": 0}])
+
+    with patch.object(SQLHandler, "bulk_insert", side_effect=RuntimeError("DB down")):
+        # Reading logs the failed write instead of failing.
+        assert long_term_memory.search() == []
+        long_term_memory.save_history([{"i": 1}])
+        with pytest.raises(RuntimeError, match="DB down"):
+            writer.flush()
+    # The error was already raised, the failed items are written with the next flush.
+    writer.flush()
+    assert [m.metadata_dict for m in long_term_memory.search()] == [{"i": 1}, {"i": 0}]
+    writer.close()
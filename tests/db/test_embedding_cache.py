@@ -0,0 +1,43 @@
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from prediction_market_agent.db.embedding_cache import CachedEmbeddings
+
+
+def test_cached_embeddings(tmp_path: Path) -> None:
+    sqlite_path = str(tmp_path / "embeddings.sqlite")
+    fake_embeddings = DeterministicFakeEmbedding(size=8)
+    embeddings = CachedEmbeddings(
+        fake_embeddings, model="fake", sqlite_path=sqlite_path
+    )
+
+    with patch.object(
+        DeterministicFakeEmbedding,
+        "embed_documents",
+        autospec=True,
+        side_effect=DeterministicFakeEmbedding.embed_documents,
+    ) as embed_documents:
+        vectors = embeddings.embed_documents(["a", "b", "a"])
+        embed_documents.assert_called_once_with(fake_embeddings, ["a", "b"])
+        assert (embeddings.hits, embeddings.misses) == (1, 2)
+
+        # Cached in the database, so a new instance doesn't call the model either.
+        embeddings = CachedEmbeddings(
+            fake_embeddings, model="fake", sqlite_path=sqlite_path
+        )
+        assert embeddings.embed_documents(["b", "a"]) == [vectors[1], vectors[0]]
+        assert embeddings.embed_query("a") == vectors[0]
+        assert embed_documents.call_count == 1
+        assert embeddings.hit_rate == 1.0
+
+        # Different model doesn't share the vectors.
+        CachedEmbeddings(
+            fake_embeddings, model="other", sqlite_path=sqlite_path
+        ).embed_documents(["a"])
+        assert embed_documents.call_count == 2
+
+    # Stored as float32.
+    assert vectors[0] == pytest.approx(fake_embeddings.embed_query("a"), rel=1e-6)
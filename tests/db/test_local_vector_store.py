@@ -0,0 +1,153 @@
+from pathlib import Path
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from prediction_market_agent.db.local_vector_store import (
+    LocalVectorStore,
+    VectorCompression,
+)
+
+TEXTS = ["a", "b", "c", "d"]
+
+
+@pytest.mark.parametrize("use_hnsw", [False, True])
+def test_local_vector_store(tmp_path: Path, use_hnsw: bool) -> None:
+    if use_hnsw:
+        pytest.importorskip("hnswlib")
+    embedding = DeterministicFakeEmbedding(size=16)
+    store = LocalVectorStore(embedding=embedding, path=tmp_path, use_hnsw=use_hnsw)
+    store.add_texts(
+        TEXTS,
+        metadatas=[{"close_time_timestamp": i} for i in range(len(TEXTS))],
+        ids=TEXTS,
+    )
+
+    [(document, score)] = store.similarity_search_with_score("b", k=1)
+    assert (document.id, document.page_content) == ("b", "b")
+    assert score == pytest.approx(1.0, abs=1e-5)
+
+    assert {
+        document.id
+        for document in store.similarity_search(
+            "b", k=10, filter={"close_time_timestamp": {"$gte": 2}}
+        )
+    } == {"c", "d"}
+    assert [
+        document.id
+        for document, _ in store.similarity_search_with_relevance_scores(
+            "b", k=10, score_threshold=0.999
+        )
+    ] == ["b"]
+
+    # Re-adding an id replaces its previous version, also after reloading from the disk.
+    store.add_texts(["b"], metadatas=[{"close_time_timestamp": 10}], ids=["b"])
+    if use_hnsw:
+        # HNSW index isn't rewritten after every addition, rows missing in it are added when loading.
+        assert not (tmp_path / "hnsw.bin").exists()
+        LocalVectorStore(embedding=embedding, path=tmp_path, use_hnsw=use_hnsw)
+        store.persist()
+        assert (tmp_path / "hnsw.bin").exists()
+    store = LocalVectorStore(embedding=embedding, path=tmp_path, use_hnsw=use_hnsw)
+    assert len(store) == len(TEXTS)
+    assert [
+        document.metadata
+        for document in store.similarity_search(
+            "b", k=10, filter={"close_time_timestamp": {"$gte": 3}}
+        )
+    ] == [{"close_time_timestamp": 10}, {"close_time_timestamp": 3}]
+    assert [document.id for document in store.get_by_ids(["a", "x"])] == ["a"]
+
+
+@pytest.mark.parametrize("use_hnsw", [False, True])
+def test_search_by_many_vectors(tmp_path: Path, use_hnsw: bool) -> None:
+    if use_hnsw:
+        pytest.importorskip("hnswlib")
+    embedding = DeterministicFakeEmbedding(size=16)
+    store = LocalVectorStore(embedding=embedding, path=tmp_path, use_hnsw=use_hnsw)
+    store.add_texts(TEXTS, ids=TEXTS)
+
+    queries = embedding.embed_documents(["c", "a"])
+    batch_results = store.similarity_search_by_vectors_with_score(queries, k=2)
+    for query, batch_result in zip(queries, batch_results):
+        result = store.similarity_search_by_vector_with_score(query, k=2)
+        assert [document.id for document, _ in batch_result] == [
+            document.id for document, _ in result
+        ]
+        assert [score for _, score in batch_result] == pytest.approx(
+            [score for _, score in result], abs=1e-5
+        )
+
+
+@pytest.mark.parametrize(
+    "compression",
+    [
+        VectorCompression(dimension=8),
+        VectorCompression(quantization="int8"),
+        VectorCompression(dimension=32, quantization="binary"),
+    ],
+)
+def test_compressed_search_reranks_with_full_vectors(
+    tmp_path: Path, compression: VectorCompression
+) -> None:
+    embedding = DeterministicFakeEmbedding(size=64)
+    texts = [str(i) for i in range(200)]
+    exact_store = LocalVectorStore(embedding=embedding, path=tmp_path / "exact")
+    exact_store.add_texts(texts, ids=texts)
+    # Rows indexed before the compression was enabled are compressed on load.
+    store = LocalVectorStore(embedding=embedding, path=tmp_path / "compressed")
+    store.add_texts(texts[:100], ids=texts[:100])
+    store = LocalVectorStore(
+        embedding=embedding, path=tmp_path / "compressed", compression=compression
+    )
+    store.add_texts(texts[100:], ids=texts[100:])
+    assert len(store.compressed_vectors) == len(texts)
+
+    [(document, score)] = store.similarity_search_with_score("150", k=1)
+    assert document.id == "150"
+    # Scores of the returned documents are exact, not approximate.
+    assert score == pytest.approx(1.0, abs=1e-5)
+
+    # With all the documents as candidates, the results are the same as without the compression.
+    compression.rerank_factor = len(texts)
+    queries = embedding.embed_documents(["3", "120"])
+    for result, exact_result in zip(
+        store.similarity_search_by_vectors_with_score(queries, k=5),
+        exact_store.similarity_search_by_vectors_with_score(queries, k=5),
+    ):
+        assert [document.id for document, _ in result] == [
+            document.id for document, _ in exact_result
+        ]
+
+
+def test_update_metadata(tmp_path: Path) -> None:
+    embedding = DeterministicFakeEmbedding(size=16)
+    store = LocalVectorStore(embedding=embedding, path=tmp_path)
+    store.add_texts(
+        TEXTS,
+        metadatas=[{"i": i, "is_open": True} for i in range(len(TEXTS))],
+        ids=TEXTS,
+    )
+    store.update_metadata({"a": {"is_open": False}, "x": {"is_open": False}})
+    assert {
+        document.id
+        for document in store.similarity_search("a", k=10, filter={"is_open": True})
+    } == {"b", "c", "d"}
+
+    # Updates are kept after reloading, but don't override metadata of an id added again after them.
+    store.add_texts(["b"], metadatas=[{"i": 10, "is_open": False}], ids=["b"])
+    store = LocalVectorStore(embedding=embedding, path=tmp_path)
+    assert [document.metadata for document in store.get_by_ids(["a", "b"])] == [
+        {"i": 0, "is_open": False},
+        {"i": 10, "is_open": False},
+    ]
+
+    # Once there are more updates than documents, they are merged into the documents.
+    for _ in range(len(store.ids)):
+        store.update_metadata({"c": {"is_open": False}})
+    store = LocalVectorStore(embedding=embedding, path=tmp_path)
+    assert not (tmp_path / "metadata_updates.jsonl").exists()
+    assert {
+        document.id
+        for document in store.similarity_search("a", k=10, filter={"is_open": True})
+    } == {"d"}
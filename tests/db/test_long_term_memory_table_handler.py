@@ -1,8 +1,21 @@
-from prediction_market_agent_tooling.tools.utils import utcnow
+import typing as t
+from pathlib import Path
+from unittest.mock import patch
+
+from freezegun import freeze_time
+from prediction_market_agent_tooling.tools.utils import (
+    DatetimeUTC,
+    check_not_none,
+    utcnow,
+)
+from sqlalchemy import create_engine, text
 
 from prediction_market_agent.db.long_term_memory_table_handler import (
     LongTermMemoryTableHandler,
+    _decompress_memories,
 )
+from prediction_market_agent.db.models import LongTermMemories, LongTermMemoriesArchive
+from prediction_market_agent.db.sql_handler import SQLHandler
 
 
 def test_save_load_long_term_memory_item(
@@ -28,3 +41,272 @@ def test_save_load_long_term_memory_item(
 
     # Retrieve all
     assert len(long_term_memory_table_handler.search()) == 2
+
+
+def test_search_page(
+    long_term_memory_table_handler: LongTermMemoryTableHandler,
+) -> None:
+    n_items, page_size = 7, 3
+    # Some memories share the same datetime, so the id has to break ties.
+    with freeze_time("2024-01-01 00:00:00"):
+        long_term_memory_table_handler.save_history([{"i": i} for i in range(4)])
+    long_term_memory_table_handler.save_history([{"i": i} for i in range(4, n_items)])
+    expected = long_term_memory_table_handler.search()
+
+    pages: list[list[LongTermMemories]] = []
+    cursor = None
+    while True:
+        page, cursor = long_term_memory_table_handler.search_page(
+            limit=page_size, after=cursor
+        )
+        pages.append(page)
+        if cursor is None:
+            break
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [m.id for page in pages for m in page] == [
+        m.id for m in sorted(expected, key=lambda m: (m.datetime_, m.id), reverse=True)
+    ]
+
+    # Going back from the oldest memory in ascending order returns the newer ones.
+    newer, _ = long_term_memory_table_handler.search_page(
+        limit=page_size,
+        after=LongTermMemoryTableHandler.get_cursor(pages[-1][0]),
+        order_desc=False,
+    )
+    assert [m.id for m in newer] == [m.id for m in pages[-2][::-1]]
+
+    # `search` accepts the cursor as well.
+    assert [
+        m.id
+        for m in long_term_memory_table_handler.search(
+            after=LongTermMemoryTableHandler.get_cursor(pages[0][-1])
+        )
+    ] == [m.id for page in pages[1:] for m in page]
+
+
+def test_iter_search(
+    long_term_memory_table_handler: LongTermMemoryTableHandler,
+) -> None:
+    long_term_memory_table_handler.save_history([{"i": i} for i in range(5)])
+    timestamp = utcnow()
+    long_term_memory_table_handler.save_history([{"i": 5}])
+
+    iterator = long_term_memory_table_handler.iter_search(to_=timestamp)
+    assert not isinstance(iterator, list)
+    assert [m.metadata_dict for m in iterator] == [{"i": i} for i in range(5)][::-1]
+
+    assert [
+        check_not_none(m.metadata_dict)["i"]
+        for m in long_term_memory_table_handler.iter_search(order_desc=False)
+    ] == list(range(6))
+
+
+def test_search_filters_on_metadata(
+    long_term_memory_table_handler: LongTermMemoryTableHandler,
+) -> None:
+    long_term_memory_table_handler.save_history(
+        [
+            {"role": "system", "content": "a"},
+            {"role": "user", "content": "b"},
+            {"original_question": "Will it rain?", "p_yes": 0.5},
+            {"original_question": "Will it snow?", "p_yes": 0.1},
+        ]
+    )
+
+    assert [
+        m.metadata_dict
+        for m in long_term_memory_table_handler.search(exclude_role="system")
+    ] == [
+        {"original_question": "Will it snow?", "p_yes": 0.1},
+        {"original_question": "Will it rain?", "p_yes": 0.5},
+        {"role": "user", "content": "b"},
+    ]
+    assert long_term_memory_table_handler.count(exclude_role="system") == 3
+    assert [
+        m.metadata_dict
+        for m in long_term_memory_table_handler.iter_search(
+            original_questions={"Will it rain?", "Will it hail?"}
+        )
+    ] == [{"original_question": "Will it rain?", "p_yes": 0.5}]
+
+
+def test_metadata_columns_are_backfilled(tmp_path: Path) -> None:
+    db_url = f"sqlite:///{tmp_path / 'test.db'}"
+    # Simulate a table created before the metadata columns were added.
+    engine = create_engine(db_url)
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "CREATE TABLE long_term_memories (id INTEGER PRIMARY KEY, task_description VARCHAR NOT NULL, metadata_ VARCHAR, datetime_ DATETIME NOT NULL)"
+            )
+        )
+        connection.execute(
+            text(
+                """INSERT INTO long_term_memories (task_description, metadata_, datetime_) VALUES ('test', '{"role": "system", "content": "a"}', '2024-01-01 00:00:00')"""
+            )
+        )
+        connection.execute(
+            text(
+                """INSERT INTO long_term_memories (task_description, metadata_, datetime_) VALUES ('test', '{"original_question": "Will it rain?", "p_yes": 0.5}', '2024-01-02 00:00:00')"""
+            )
+        )
+
+    long_term_memory = LongTermMemoryTableHandler(
+        task_description="test", sqlalchemy_db_url=db_url
+    )
+    # Creating the handler only adds the columns, the backfill runs separately.
+    assert [m.role for m in long_term_memory.search()] == [None, None]
+
+    def search_contents(**kwargs: t.Any) -> list[dict[str, t.Any] | None]:
+        return [m.metadata_dict for m in long_term_memory.search(**kwargs)]
+
+    # Until then, the filters fall back to the metadata.
+    expected_not_system = [{"original_question": "Will it rain?", "p_yes": 0.5}]
+    assert search_contents(exclude_role="system") == expected_not_system
+    assert search_contents(original_questions={"Will it rain?"}) == expected_not_system
+    assert long_term_memory.count(exclude_role="system", max_age_seconds=600) == 1
+
+    long_term_memory.save_history([{"role": "user", "content": "b"}])
+    assert (
+        LongTermMemoryTableHandler.backfill_metadata_columns(
+            batch_size=1, sqlalchemy_db_url=db_url
+        )
+        == 2
+    )
+    # Cached counts are recounted after the backfill.
+    with patch.object(
+        SQLHandler,
+        "_count_with_max_id",
+        autospec=True,
+        side_effect=SQLHandler._count_with_max_id,
+    ) as full_count:
+        assert long_term_memory.count(exclude_role="system", max_age_seconds=600) == 2
+        assert full_count.call_count == 1
+    # Already backfilled memories are skipped.
+    assert (
+        LongTermMemoryTableHandler.backfill_metadata_columns(sqlalchemy_db_url=db_url)
+        == 0
+    )
+    _, rain, system = long_term_memory.search()
+    assert system.role == "system"
+    assert rain.original_question == "Will it rain?"
+    assert search_contents(original_questions={"Will it rain?"}) == expected_not_system
+    assert [m.role for m in long_term_memory.search(exclude_role="system")] == [
+        "user",
+        None,
+    ]
+
+    long_term_memory.sql_handler.db_manager._engine.dispose()
+    engine.dispose()
+
+
+def test_search_many(
+    long_term_memory_table_handler: LongTermMemoryTableHandler,
+) -> None:
+    other = LongTermMemoryTableHandler(
+        task_description="OTHER", sqlalchemy_db_url="sqlite://"
+    )
+    long_term_memory_table_handler.save_history([{"i": 0}])
+    other.save_history([{"i": 1}])
+    timestamp = utcnow()
+    long_term_memory_table_handler.save_history([{"i": 2}, {"i": 3}])
+    other.save_history([{"i": 4}])
+
+    memories = LongTermMemoryTableHandler.search_many(
+        task_descriptions=["OTHER", "EMPTY", "LONG_TERM_MEMORY_TEST"],
+        from_=timestamp,
+        sqlalchemy_db_url="sqlite://",
+    )
+    assert {
+        task_description: [m.metadata_dict for m in memories_for_task]
+        for task_description, memories_for_task in memories.items()
+    } == {
+        "OTHER": [{"i": 4}],
+        "EMPTY": [],
+        "LONG_TERM_MEMORY_TEST": [{"i": 3}, {"i": 2}],
+    }
+    assert list(memories) == ["OTHER", "EMPTY", "LONG_TERM_MEMORY_TEST"]
+
+
+def test_archive(
+    long_term_memory_table_handler: LongTermMemoryTableHandler,
+) -> None:
+    for datetime_, i in [
+        ("2024-01-10", 0),
+        ("2024-01-20", 1),
+        ("2024-02-10", 2),
+        ("2024-02-20", 3),
+        ("2024-03-10", 4),
+    ]:
+        with freeze_time(datetime_):
+            long_term_memory_table_handler.save_history(
+                [{"i": i, "role": "system" if i == 1 else "user"}]
+            )
+
+    assert long_term_memory_table_handler.count(max_age_seconds=600) == 5
+    # Batches smaller than a month append to the month's archive created by the previous batch.
+    assert (
+        long_term_memory_table_handler.archive(DatetimeUTC(2024, 2, 15), batch_size=1)
+        == 3
+    )
+    assert long_term_memory_table_handler.count(max_age_seconds=600) == 2
+    # Second run appends to the already archived month, here as if from another process, which can't clear this process' cached counts.
+    with patch.object(SQLHandler, "clear_count_cache"):
+        assert long_term_memory_table_handler.archive(DatetimeUTC(2024, 3, 1)) == 1
+    assert long_term_memory_table_handler.count(max_age_seconds=600) == 1
+    archives: t.Sequence[LongTermMemoriesArchive] = (
+        long_term_memory_table_handler.archive_sql_handler.get_all()
+    )
+    assert [(archive.month, archive.n_memories) for archive in archives] == [
+        (DatetimeUTC(2024, 1, 1), 2),
+        (DatetimeUTC(2024, 2, 1), 2),
+    ]
+
+    def search_i(**kwargs: t.Any) -> list[int]:
+        return [
+            check_not_none(m.metadata_dict)["i"]
+            for m in long_term_memory_table_handler.search(**kwargs)
+        ]
+
+    assert search_i() == [4, 3, 2, 1, 0]
+    assert search_i(offset=1, limit=2) == [3, 2]
+    assert search_i(from_=DatetimeUTC(2024, 1, 15), to_=DatetimeUTC(2024, 2, 15)) == [
+        2,
+        1,
+    ]
+    assert search_i(from_=DatetimeUTC(2024, 3, 1)) == [4]
+    assert search_i(exclude_role="system") == [4, 3, 2, 0]
+
+    # Archive is read only if the table doesn't have enough memories, and only the needed months are decompressed.
+    with patch(
+        "prediction_market_agent.db.long_term_memory_table_handler._decompress_memories",
+        side_effect=_decompress_memories,
+    ) as decompress:
+        assert search_i(limit=1) == [4]
+        assert search_i(from_=DatetimeUTC(2024, 3, 5)) == [4]
+        assert decompress.call_count == 0
+        assert search_i(limit=2) == [4, 3]
+        assert decompress.call_count == 1
+
+    def iter_search_i(**kwargs: t.Any) -> list[int]:
+        return [
+            check_not_none(m.metadata_dict)["i"]
+            for m in long_term_memory_table_handler.iter_search(**kwargs)
+        ]
+
+    assert iter_search_i() == [4, 3, 2, 1, 0]
+    assert iter_search_i(order_desc=False, exclude_role="system") == [0, 2, 3, 4]
+    assert [
+        check_not_none(m.metadata_dict)["i"]
+        for m in LongTermMemoryTableHandler.search_many(
+            task_descriptions=[long_term_memory_table_handler.task_description],
+            from_=DatetimeUTC(2024, 2, 15),
+            sqlalchemy_db_url="sqlite://",
+        )[long_term_memory_table_handler.task_description]
+    ] == [4, 3]
+
+    # Pagination is only over the memories in the table.
+    page, cursor = long_term_memory_table_handler.search_page(limit=10)
+    assert [check_not_none(m.metadata_dict)["i"] for m in page] == [4]
+    assert cursor is None
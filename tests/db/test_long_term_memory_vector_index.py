@@ -0,0 +1,45 @@
+from pathlib import Path
+from unittest.mock import patch
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from prediction_market_agent.db.long_term_memory_table_handler import (
+    LongTermMemoryTableHandler,
+)
+from prediction_market_agent.db.long_term_memory_vector_index import (
+    LongTermMemoryVectorIndex,
+)
+
+
+def test_long_term_memory_vector_index_embeds_only_new_memories(
+    long_term_memory_table_handler: LongTermMemoryTableHandler, tmp_path: Path
+) -> None:
+    embeddings = DeterministicFakeEmbedding(size=16)
+    long_term_memory_table_handler.save_history(
+        [{"role": "user", "content": content} for content in ["a", "b", "c"]]
+    )
+    index = LongTermMemoryVectorIndex(
+        long_term_memory=long_term_memory_table_handler,
+        embeddings=embeddings,
+        path=tmp_path,
+    )
+    assert index.update() == 3
+    assert index.update() == 0
+
+    long_term_memory_table_handler.save_history([{"role": "user", "content": "d"}])
+    # A new instance continues from the index persisted by the previous one.
+    index = LongTermMemoryVectorIndex(
+        long_term_memory=long_term_memory_table_handler,
+        embeddings=embeddings,
+        path=tmp_path,
+    )
+    with patch.object(
+        DeterministicFakeEmbedding,
+        "embed_documents",
+        autospec=True,
+        side_effect=DeterministicFakeEmbedding.embed_documents,
+    ) as embed_documents:
+        [memory] = index.search("From: user Content: d", k=1)
+    embed_documents.assert_called_once_with(embeddings, ["From: user Content: d"])
+    assert memory.metadata_dict == {"role": "user", "content": "d"}
+    assert len(index.store) == 4
@@ -0,0 +1,72 @@
+from datetime import timedelta
+
+from freezegun import freeze_time
+
+from prediction_market_agent.agents.arbitrage_agent.data_models import Correlation
+from prediction_market_agent.db.market_correlations_table_handler import (
+    MarketCorrelationsTableHandler,
+)
+
+
+def test_correlations_are_reused_for_both_orderings(
+    market_correlations_table_handler: MarketCorrelationsTableHandler,
+) -> None:
+    market_correlations = market_correlations_table_handler
+    correlation = Correlation(near_perfect_correlation=False, reasoning="Opposite.")
+    with freeze_time("2024-01-01"):
+        market_correlations.save_correlations([("Will A?", "Will B?", correlation)])
+
+    with freeze_time("2024-01-02"):
+        # The pair is found in either order, and with differently formatted questions.
+        assert market_correlations.get_correlations(
+            [("Will B?", "will  a?"), ("Will A?", "Will C?")], max_age=timedelta(days=7)
+        ) == [correlation, None]
+        assert market_correlations.get_correlations(
+            [("Will A?", "Will B?")], max_age=timedelta(hours=1)
+        ) == [None]
+
+        # Expired correlation is replaced by the new one.
+        new_correlation = Correlation(near_perfect_correlation=True, reasoning="Same.")
+        market_correlations.save_correlations([("Will B?", "Will A?", new_correlation)])
+        assert market_correlations.get_correlations(
+            [("Will A?", "Will B?")], max_age=timedelta(hours=1)
+        ) == [new_correlation]
+    assert len(market_correlations.sql_handler.get_all()) == 1
+
+
+def test_correlation_edges(
+    market_correlations_table_handler: MarketCorrelationsTableHandler,
+) -> None:
+    market_correlations = market_correlations_table_handler
+    with freeze_time("2024-01-01"):
+        market_correlations.save_correlations(
+            [
+                (
+                    "Will A?",
+                    "Will B?",
+                    Correlation(near_perfect_correlation=True, reasoning=""),
+                ),
+                (
+                    "Will C?",
+                    "Will A?",
+                    Correlation(near_perfect_correlation=None, reasoning=""),
+                ),
+            ]
+        )
+    with freeze_time("2024-01-05"):
+        market_correlations.save_correlations(
+            [
+                (
+                    "Will D?",
+                    "Will C?",
+                    Correlation(near_perfect_correlation=False, reasoning=""),
+                )
+            ]
+        )
+
+    get_hash = market_correlations.get_question_hash
+    with freeze_time("2024-01-06"):
+        # Unknown correlations and the ones that are too old aren't edges.
+        assert market_correlations.get_correlation_edges(max_age=timedelta(days=2)) == [
+            (*sorted([get_hash("will c?"), get_hash("Will D?")]), False)
+        ]
@@ -1,14 +1,22 @@
+from datetime import timedelta
+from pathlib import Path
 from typing import Generator
 from unittest.mock import Mock, patch
 
 import pytest
 from eth_typing import HexAddress, HexStr
 from langchain_chroma import Chroma
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from prediction_market_agent_tooling.tools.datetime_utc import DatetimeUTC
 
 from prediction_market_agent.agents.think_thoroughly_agent.models import (
     PineconeMetadata,
 )
-from prediction_market_agent.db.pinecone_handler import PineconeHandler
+from prediction_market_agent.db.local_vector_store import LocalVectorStore
+from prediction_market_agent.db.pinecone_handler import (
+    SYNC_WATERMARK_OVERLAP,
+    PineconeHandler,
+)
 from tests.utils import RUN_PAID_TESTS
 
 TRUMP_MARKETS = [
@@ -75,3 +83,161 @@ def test_search_filter_metadata_works(test_pinecone_handler: PineconeHandler) ->
         },
     )
     assert len(questions) == 0
+
+
+def test_insert_all_omen_markets_syncs_from_watermark(tmp_path: Path) -> None:
+    def market(title: str, created_at: DatetimeUTC) -> Mock:
+        return Mock(
+            question_title=title,
+            title=title,
+            collateralVolume=0,
+            creation_datetime=created_at,
+            close_time=created_at,
+            id=HexAddress(HexStr("0x")),
+            current_p_yes=0.5,
+            liquidityParameter=Mock(as_token=Mock(value=0.0)),
+        )
+
+    with patch.object(PineconeHandler, "__init__", Mock(return_value=None)):
+        p = PineconeHandler()
+    p.sqlalchemy_db_url = f"sqlite:///{tmp_path / 'test.db'}"
+    p.index = Mock()
+    p.vectorstore = Mock()
+
+    first_sync = [
+        market("a", DatetimeUTC(2024, 1, 1)),
+        market("b", DatetimeUTC(2024, 1, 2)),
+    ]
+    p.index.fetch.return_value = Mock(vectors={p.encode_text("a"): Mock()})
+    with patch(
+        "prediction_market_agent.db.pinecone_handler.OmenSubgraphHandler"
+    ) as subgraph_handler:
+        subgraph_handler.return_value.get_omen_markets_simple.return_value = first_sync
+        p.insert_all_omen_markets_if_not_exists()
+
+        assert (
+            subgraph_handler.return_value.get_omen_markets_simple.call_args.kwargs[
+                "created_after"
+            ]
+            is None
+        )
+        # Only the candidate ids are checked, and only the missing market is inserted.
+        assert set(p.index.fetch.call_args.kwargs["ids"]) == {
+            p.encode_text("a"),
+            p.encode_text("b"),
+        }
+        assert p.vectorstore.add_texts.call_args.kwargs["texts"] == ["b"]
+        assert p.get_sync_watermark() == DatetimeUTC(2024, 1, 2)
+
+        subgraph_handler.return_value.get_omen_markets_simple.return_value = []
+        p.insert_all_omen_markets_if_not_exists()
+        assert (
+            subgraph_handler.return_value.get_omen_markets_simple.call_args.kwargs[
+                "created_after"
+            ]
+            == DatetimeUTC(2024, 1, 2) - SYNC_WATERMARK_OVERLAP
+        )
+        assert p.get_sync_watermark() == DatetimeUTC(2024, 1, 2)
+
+
+def test_find_nearest_questions_batch(tmp_path: Path) -> None:
+    with patch.object(PineconeHandler, "__init__", Mock(return_value=None)):
+        p = PineconeHandler()
+    p.embeddings = Mock(wraps=DeterministicFakeEmbedding(size=16))
+    p.vectorstore = LocalVectorStore(embedding=p.embeddings, path=tmp_path)
+    texts = TRUMP_MARKETS + BIDEN_MARKETS
+    p.insert_texts(
+        ids=[p.encode_text(text) for text in texts],
+        texts=texts,
+        metadatas=[
+            PineconeMetadata(
+                question_title=text,
+                market_address=HexAddress(HexStr("")),
+                close_time_timestamp=i,
+            ).model_dump(exclude_none=True)
+            for i, text in enumerate(texts)
+        ],
+    )
+    p.embeddings.reset_mock()
+
+    results = p.find_nearest_questions_batch(
+        texts=[BIDEN_MARKETS[0], TRUMP_MARKETS[0]],
+        limit=1,
+        threshold=0.99,
+        filter_on_metadata={"close_time_timestamp": {"$gte": 1}},
+    )
+
+    p.embeddings.embed_documents.assert_called_once()
+    # The first Trump market is filtered out by the close time.
+    assert [[r.question_title for r in result] for result in results] == [
+        [BIDEN_MARKETS[0]],
+        [],
+    ]
+
+
+def test_refresh_market_states(tmp_path: Path) -> None:
+    def market(title: str, id: str, p_yes: float, is_open: bool = True) -> Mock:
+        return Mock(
+            question_title=title,
+            id=HexAddress(HexStr(id)),
+            close_time=DatetimeUTC(2024, 1, 1),
+            is_open=is_open,
+            is_resolved=False,
+            current_p_yes=p_yes,
+            liquidityParameter=Mock(as_token=Mock(value=1.0)),
+        )
+
+    with patch.object(PineconeHandler, "__init__", Mock(return_value=None)):
+        p = PineconeHandler()
+    p.sqlalchemy_db_url = f"sqlite:///{tmp_path / 'test.db'}"
+    p.vectorstore = LocalVectorStore(
+        embedding=DeterministicFakeEmbedding(size=16), path=tmp_path / "index"
+    )
+    p.insert_texts(
+        ids=[p.encode_text("a"), p.encode_text("b")],
+        texts=["a", "b"],
+        metadatas=[
+            PineconeMetadata(
+                question_title=title,
+                market_address=HexAddress(HexStr(id)),
+                close_time_timestamp=0,
+            ).model_dump(exclude_none=True)
+            for title, id in [("a", "0xa"), ("b", "0xb")]
+        ],
+    )
+    p.save_sync_watermark(DatetimeUTC(2024, 1, 1))
+
+    with patch(
+        "prediction_market_agent.db.pinecone_handler.OmenSubgraphHandler"
+    ) as subgraph_handler:
+        # The first refresh updates all the open markets.
+        subgraph_handler.return_value.get_omen_markets.return_value = [
+            market("a", "0xa", 0.1),
+            market("b", "0xb", 0.2),
+            # Different market with the same title as the indexed one is ignored.
+            market("b", "0xc", 0.9),
+        ]
+        assert p.refresh_market_states() == 2
+        subgraph_handler.return_value.get_trades.assert_not_called()
+        last_refresh = p.get_state_refresh_watermark()
+        assert last_refresh is not None
+
+        # Next refreshes update only the traded and closed markets.
+        subgraph_handler.return_value.get_trades.return_value = [
+            Mock(fpmm=market("a", "0xa", 0.3))
+        ]
+        subgraph_handler.return_value.get_omen_markets.return_value = [
+            market("b", "0xb", 0.2, is_open=False)
+        ]
+        assert p.refresh_market_states() == 2
+        assert (
+            subgraph_handler.return_value.get_trades.call_args.kwargs["start_time"]
+            == last_refresh - SYNC_WATERMARK_OVERLAP
+        )
+
+    related = p.find_nearest_questions_with_threshold(limit=2, text="a", threshold=0)
+    assert {(r.question_title, r.current_p_yes, r.is_open) for r in related} == {
+        ("a", 0.3, True),
+        ("b", 0.2, False),
+    }
+    assert all(r.has_state_newer_than(timedelta(hours=1)) for r in related)
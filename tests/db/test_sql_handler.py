@@ -1,12 +1,16 @@
 import datetime
 import typing as t
+from pathlib import Path
+from unittest.mock import patch
 
 import pytest
 from prediction_market_agent_tooling.tools.utils import utcnow
+from sqlalchemy import Table, create_engine, inspect
 from sqlmodel import col
 
 from prediction_market_agent.db.models import Prompt
 from prediction_market_agent.db.prompt_table_handler import PromptTableHandler
+from prediction_market_agent.db.sql_handler import SQLHandler, get_db_manager
 
 
 @pytest.fixture(scope="function")
@@ -83,3 +87,123 @@ def test_get_with_filter(
     )
     assert len(results) == 1
     assert results[0].session_identifier == session_identifier
+
+
+def test_bulk_insert(
+    prompt_table_handler: PromptTableHandler, example_prompts: list[Prompt]
+) -> None:
+    prompt_table_handler.sql_handler.bulk_insert(example_prompts)
+    # Objects aren't refreshed by the bulk path.
+    assert all(p.id is None for p in example_prompts)
+
+    results: t.Sequence[Prompt] = (
+        prompt_table_handler.sql_handler.get_with_filter_and_order(
+            order_by_column_name=Prompt.datetime_.key,  # type: ignore[attr-defined]
+            order_desc=False,
+        )
+    )
+    assert [r.prompt for r in results] == [p.prompt for p in example_prompts]
+    assert [r.datetime_ for r in results] == [p.datetime_ for p in example_prompts]
+    assert all(r.id is not None for r in results)
+
+
+def test_bulk_insert_empty(prompt_table_handler: PromptTableHandler) -> None:
+    prompt_table_handler.sql_handler.bulk_insert([])
+    assert len(prompt_table_handler.sql_handler.get_all()) == 0
+
+
+def test_missing_indexes_are_created_on_existing_table(tmp_path: Path) -> None:
+    db_url = f"sqlite:///{tmp_path / 'test.db'}"
+    table: Table = Prompt.__table__  # type: ignore[attr-defined]
+    assert table.indexes
+
+    # Simulate a table that was created before the indexes were declared.
+    engine = create_engine(db_url)
+    with engine.begin() as connection:
+        table.create(connection)
+        for index in table.indexes:
+            index.drop(connection)
+    assert inspect(engine).get_indexes(table.name) == []
+
+    sql_handler = SQLHandler(model=Prompt, sqlalchemy_db_url=db_url)
+    # Indexes aren't built on startup, as it can take long on a big table.
+    assert inspect(engine).get_indexes(table.name) == []
+
+    assert sorted(sql_handler.create_missing_indexes()) == sorted(
+        str(i.name) for i in table.indexes
+    )
+    assert {i["name"] for i in inspect(engine).get_indexes(table.name)} == {
+        i.name for i in table.indexes
+    }
+    assert sql_handler.create_missing_indexes() == []
+    # The shared table definition isn't changed by the concurrent build.
+    assert all(
+        not i.dialect_options["postgresql"]["concurrently"] for i in table.indexes
+    )
+
+    sql_handler.db_manager._engine.dispose()
+    engine.dispose()
+
+
+def test_handlers_share_db_manager(tmp_path: Path) -> None:
+    db_url = f"sqlite:///{tmp_path / 'test.db'}"
+    first = SQLHandler(model=Prompt, sqlalchemy_db_url=db_url)
+    second = SQLHandler(model=Prompt, sqlalchemy_db_url=db_url)
+    assert first.db_manager is second.db_manager is get_db_manager(db_url)
+    first.db_manager._engine.dispose()
+
+
+def test_count_is_cached(prompt_table_handler: PromptTableHandler) -> None:
+    sql_handler = prompt_table_handler.sql_handler
+
+    def count(session_identifier: str) -> int:
+        return sql_handler.count(
+            query_filters=[col(Prompt.session_identifier) == session_identifier],
+            max_age_seconds=600,
+        )
+
+    def save(session_identifier: str, n: int) -> None:
+        sql_handler.bulk_insert(
+            [
+                Prompt(
+                    prompt="p",
+                    datetime_=utcnow(),
+                    session_identifier=session_identifier,
+                )
+                for _ in range(n)
+            ]
+        )
+
+    save("a", 3)
+    save("b", 1)
+    with patch.object(
+        SQLHandler,
+        "_count_with_max_id",
+        autospec=True,
+        side_effect=SQLHandler._count_with_max_id,
+    ) as full_count:
+        assert count("a") == 3
+        assert count("b") == 1
+        save("a", 2)
+        save("b", 1)
+        # Only the new rows are counted.
+        assert count("a") == 5
+        assert count("b") == 2
+        assert full_count.call_count == 2
+
+        sql_handler.remove_by_id(
+            sql_handler.get_with_filter_and_order(
+                query_filters=[col(Prompt.session_identifier) == "a"], limit=1
+            )[0].id
+        )
+        assert count("a") == 4
+        assert full_count.call_count == 3
+
+    assert sql_handler.count() == 6
+    # Counts are exact unless caching is asked for.
+    with patch.object(SQLHandler, "_count_with_max_id") as full_count:
+        assert (
+            sql_handler.count(query_filters=[col(Prompt.session_identifier) == "b"])
+            == 2
+        )
+        full_count.assert_not_called()